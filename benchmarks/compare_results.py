@@ -0,0 +1,78 @@
+"""Confronta due file di risultati di run_benchmark.py e segnala le regressioni.
+
+Le esecuzioni vengono abbinate per (righe, client); una regressione è un percentile di latenza
+cresciuto, o un throughput calato, oltre la soglia relativa.
+
+    python benchmarks/compare_results.py benchmarks/results/prima.json benchmarks/results/dopo.json --threshold 0.15
+
+Esce con codice 1 se trova regressioni, così può fare da controllo in CI.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Tuple
+
+COMPARED_PERCENTILES = ("p50", "p95", "p99")
+
+
+def _runs_by_key(results: Dict[str, Any]) -> Dict[Tuple[int, int], Dict[str, Any]]:
+    return {(run["rows"], run["clients"]): run for run in results.get("runs", [])}
+
+
+def _change(before: float, after: float) -> float:
+    return (after - before) / before if before else 0.0
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Una riga per metrica confrontata: valori, variazione relativa e se è una regressione."""
+    rows: List[Dict[str, Any]] = []
+    before_runs = _runs_by_key(baseline)
+    for key, after in sorted(_runs_by_key(current).items()):
+        before = before_runs.get(key)
+        if before is None:
+            continue
+        for stage, after_stats in sorted(after["latency_ms"].items()):
+            before_stats = before["latency_ms"].get(stage)
+            if not before_stats or not after_stats:
+                continue
+            for percentile in COMPARED_PERCENTILES:
+                change = _change(before_stats[percentile], after_stats[percentile])
+                rows.append({"rows": key[0], "clients": key[1], "metric": f"{stage}.{percentile}",
+                             "before": before_stats[percentile], "after": after_stats[percentile],
+                             "change": change, "regression": change > threshold})
+        change = _change(before["throughput_rps"], after["throughput_rps"])
+        rows.append({"rows": key[0], "clients": key[1], "metric": "throughput_rps",
+                     "before": before["throughput_rps"], "after": after["throughput_rps"],
+                     "change": change, "regression": change < -threshold})
+        for service, after_rss in sorted(after.get("rss_peak_mb", {}).items()):
+            before_rss = before.get("rss_peak_mb", {}).get(service)
+            if before_rss and after_rss:
+                change = _change(before_rss, after_rss)
+                rows.append({"rows": key[0], "clients": key[1], "metric": f"rss_peak_mb.{service}",
+                             "before": before_rss, "after": after_rss, "change": change, "regression": change > threshold})
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]], only_changes: bool = False):
+    print(f"{'righe':>9} {'client':>6}  {'metrica':<32} {'prima':>10} {'dopo':>10} {'var.':>8}")
+    for row in rows:
+        if only_changes and not row["regression"]:
+            continue
+        marker = "  REGRESSIONE" if row["regression"] else ""
+        print(f"{row['rows']:>9} {row['clients']:>6}  {row['metric']:<32} {row['before']:>10.1f} {row['after']:>10.1f} "
+              f"{row['change'] * 100:>+7.1f}%{marker}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Variazione relativa tollerata (default 0.2 = 20%%)")
+    parser.add_argument("--regressions-only", action="store_true")
+    args = parser.parse_args()
+    with open(args.baseline, encoding="utf-8") as baseline_file, open(args.current, encoding="utf-8") as current_file:
+        comparison = compare(json.load(baseline_file), json.load(current_file), args.threshold)
+    print_comparison(comparison, args.regressions_only)
+    regressions = sum(1 for row in comparison if row["regression"])
+    print(f"\n{len(comparison)} metriche confrontate, {regressions} regressioni oltre il {args.threshold * 100:.0f}%.")
+    sys.exit(1 if regressions else 0)
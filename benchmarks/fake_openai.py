@@ -0,0 +1,174 @@
+"""Server OpenAI finto e deterministico per i benchmark: /v1/chat/completions (anche in streaming) e /v1/embeddings.
+
+Il prompt dell'utente inizia con "[scenario]": lo scenario stabilisce quali tool chiamare a ogni giro
+(SCENARIOS). Quando i giri dello scenario sono finiti risponde con un testo fisso che riassume le
+risposte dei tool ricevute. Nessuna casualità: due esecuzioni producono le stesse conversazioni.
+
+    OPENAI_BASE_URL=http://127.0.0.1:8090/v1 OPENAI_API_KEY=bench python frontend/frontend-application.py
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FAKE_OPENAI_PORT = int(os.getenv("FAKE_OPENAI_PORT", "8090"))
+# Latenza simulata del modello: attesa prima della risposta (o del primo frammento) e tra i frammenti
+FAKE_OPENAI_LATENCY_MS = float(os.getenv("FAKE_OPENAI_LATENCY_MS", "50"))
+FAKE_OPENAI_CHUNK_DELAY_MS = float(os.getenv("FAKE_OPENAI_CHUNK_DELAY_MS", "2"))
+FAKE_OPENAI_EMBEDDING_DIMENSIONS = 64
+
+# Scenario -> giri di chiamate (ogni giro è una lista di (tool, argomenti) eseguite in parallelo)
+SCENARIOS: Dict[str, List[List[Any]]] = {
+    "aggregate": [[("aggregate_dataset", {"dataset": "employees", "metrics": ["count", "mean:Salary", "p90:Salary"], "group_by": ["Role"]})]],
+    "query": [[("query_employees", {"role": "Data Analyst", "min_age": 40, "sort": "-Salary", "limit": 20})]],
+    "search": [[("search_people", {"name": "john", "limit": 10})]],
+    "scan": [[("scan_employees", {"filters": ["Age>=60", "Salary>100000"], "fields": ["Name", "Role", "Salary"], "limit": 200})]],
+    "parallel": [[("search_people", {"role": "QA Engineer", "min_age": 30, "max_age": 40}),
+                  ("aggregate_dataset", {"dataset": "employees", "metrics": ["count", "max:Age"], "group_by": ["Age:10"]})]],
+    "multi_step": [[("aggregate_dataset", {"dataset": "employees", "metrics": ["count"], "group_by": ["Role"], "sort": "-count", "limit": 1})],
+                   [("query_employees", {"role": "QA Engineer", "sort": "-Age", "limit": 5})]],
+    "full_dump": [[("get_dati_csv_mcp", {})]],
+}
+DEFAULT_SCENARIOS = ["aggregate", "query", "search", "scan", "parallel", "multi_step"] # full_dump solo su richiesta
+
+_SCENARIO_PATTERN = re.compile(r"^\[(?P<name>[\w-]+)\]")
+
+app = FastAPI()
+stats: Dict[str, Any] = {"completions": 0, "streamed": 0, "tool_call_rounds": 0, "answers": 0, "embeddings": 0,
+                         "unknown_scenarios": 0, "missing_tools": 0, "request_bytes": 0}
+
+
+def _conversation_state(messages: List[Dict[str, Any]]) -> Tuple[Optional[str], int, List[str]]:
+    """(scenario, giri di tool già eseguiti, contenuti delle risposte dei tool) dall'ultimo messaggio utente."""
+    last_user = max((i for i, message in enumerate(messages) if message.get("role") == "user"), default=-1)
+    if last_user < 0:
+        return None, 0, []
+    match = _SCENARIO_PATTERN.match(str(messages[last_user].get("content") or ""))
+    turn = messages[last_user + 1:]
+    rounds = sum(1 for message in turn if message.get("role") == "assistant" and message.get("tool_calls"))
+    tool_outputs = [str(message.get("content") or "") for message in turn if message.get("role") == "tool"]
+    return (match.group("name") if match else None), rounds, tool_outputs
+
+
+def _resolve_tool(tools: List[Dict[str, Any]], name: str) -> Optional[str]:
+    """Il frontend prefissa i tool con l'id del server ("mcp_local_csv__search_people")."""
+    for tool in tools or []:
+        full_name = tool.get("function", {}).get("name", "")
+        if full_name == name or full_name.endswith(f"__{name}"):
+            return full_name
+    return None
+
+
+def _plan(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Il prossimo messaggio dell'assistente: tool_calls dello scenario oppure la risposta finale."""
+    scenario, rounds, tool_outputs = _conversation_state(body.get("messages", []))
+    script = SCENARIOS.get(scenario or "")
+    if script is None:
+        stats["unknown_scenarios"] += 1
+    elif rounds < len(script):
+        tool_calls = []
+        for position, (name, arguments) in enumerate(script[rounds]):
+            full_name = _resolve_tool(body.get("tools"), name)
+            if full_name is None:
+                stats["missing_tools"] += 1
+                continue
+            tool_calls.append({"id": f"call_{scenario}_{rounds}_{position}", "type": "function",
+                               "function": {"name": full_name, "arguments": json.dumps(arguments)}})
+        if tool_calls:
+            stats["tool_call_rounds"] += 1
+            return {"role": "assistant", "content": None, "tool_calls": tool_calls}
+    stats["answers"] += 1
+    received = sum(len(output) for output in tool_outputs)
+    errors = sum(1 for output in tool_outputs if output.startswith('{"error"'))
+    content = (f"Scenario {scenario or 'libero'} completato: {len(tool_outputs)} risposte dei tool, "
+               f"{received} caratteri ricevuti, {errors} errori.")
+    return {"role": "assistant", "content": content}
+
+
+def _completion_id(body: Dict[str, Any]) -> str:
+    return "chatcmpl-" + hashlib.sha1(json.dumps(body.get("messages", []), sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+
+async def _stream(message: Dict[str, Any], completion_id: str, model: str):
+    def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> bytes:
+        payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                   "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+        return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+    yield chunk({"role": "assistant", "content": ""})
+    if message.get("tool_calls"):
+        for index, tool_call in enumerate(message["tool_calls"]):
+            # Nome e argomenti in due frammenti, come fa l'API vera
+            yield chunk({"tool_calls": [{"index": index, "id": tool_call["id"], "type": "function",
+                                         "function": {"name": tool_call["function"]["name"], "arguments": ""}}]})
+            yield chunk({"tool_calls": [{"index": index, "function": {"arguments": tool_call["function"]["arguments"]}}]})
+        yield chunk({}, "tool_calls")
+    else:
+        for word in re.findall(r"\S+\s*", message["content"]):
+            await asyncio.sleep(FAKE_OPENAI_CHUNK_DELAY_MS / 1000)
+            yield chunk({"content": word})
+        yield chunk({}, "stop")
+    yield b"data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    raw = await request.body()
+    body = json.loads(raw)
+    stats["completions"] += 1
+    stats["request_bytes"] += len(raw)
+    message = _plan(body)
+    completion_id = _completion_id(body)
+    model = body.get("model", "fake-model")
+    await asyncio.sleep(FAKE_OPENAI_LATENCY_MS / 1000)
+    if body.get("stream"):
+        stats["streamed"] += 1
+        return StreamingResponse(_stream(message, completion_id, model), media_type="text/event-stream")
+    return JSONResponse({
+        "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+        "usage": {"prompt_tokens": len(raw) // 4, "completion_tokens": len(json.dumps(message)) // 4,
+                  "total_tokens": (len(raw) + len(json.dumps(message))) // 4},
+    })
+
+
+def _embedding(text: str) -> List[float]:
+    """Vettore derivato dall'hash delle parole: stesse parole -> stesso vettore, parole diverse -> vettori lontani."""
+    vector = [0.0] * FAKE_OPENAI_EMBEDDING_DIMENSIONS
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.sha1(word.encode("utf-8")).digest()
+        for i in range(FAKE_OPENAI_EMBEDDING_DIMENSIONS):
+            vector[i] += (digest[i % len(digest)] - 127.5) / 127.5
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body.get("input")
+    inputs = inputs if isinstance(inputs, list) else [inputs]
+    stats["embeddings"] += len(inputs)
+    return JSONResponse({
+        "object": "list", "model": body.get("model", "fake-embedding"),
+        "data": [{"object": "embedding", "index": i, "embedding": _embedding(str(text))} for i, text in enumerate(inputs)],
+        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+    })
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    print(f"Avvio OpenAI finto su http://127.0.0.1:{FAKE_OPENAI_PORT}/v1 (latenza {FAKE_OPENAI_LATENCY_MS:g} ms)")
+    uvicorn.run(app, host="127.0.0.1", port=FAKE_OPENAI_PORT, log_level="warning")
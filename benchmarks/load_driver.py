@@ -0,0 +1,149 @@
+"""Client Socket.IO concorrenti contro frontend-application.py: initialize -> send_message, con i tempi di ogni fase.
+
+Ogni client è un browser simulato (un thread con il proprio socketio.Client): si connette, inizializza
+la sessione MCP e invia i messaggi uno dopo l'altro, aspettando la risposta completa. Tutti i client
+partono insieme dopo l'inizializzazione, così la concorrenza misurata è quella richiesta.
+
+Fasi di ogni messaggio (millisecondi dall'invio):
+- first_tool_ms: primo tool avviato (instradamento nel frontend + prima chiamata al modello)
+- tools_ms: dal primo tool avviato all'ultimo concluso (MCP server + dataset server)
+- answer_ms: dall'ultimo tool concluso alla risposta completa (seconda chiamata al modello + streaming)
+- first_delta_ms: primo frammento di testo ricevuto
+- total_ms: risposta completa
+"""
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import socketio
+
+
+class SimulatedUser:
+    def __init__(self, index: int, url: str, server_id: str, timeout: float):
+        self.index = index
+        self.url = url
+        self.server_id = server_id
+        self.timeout = timeout
+        self.client = socketio.Client(reconnection=False)
+        self.initialized = threading.Event()
+        self.done = threading.Event()
+        self.current: Optional[Dict[str, Any]] = None
+        self.errors: List[str] = []
+        self._register_handlers()
+
+    def _elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.current["_sent_at"]) * 1000
+
+    def _register_handlers(self):
+        @self.client.on("mcp_initialized")
+        def on_initialized(data):
+            self.initialized.set()
+
+        @self.client.on("message_delta")
+        def on_delta(data):
+            if self.current is not None and self.current["first_delta_ms"] is None:
+                self.current["first_delta_ms"] = self._elapsed_ms()
+
+        @self.client.on("tool_progress")
+        def on_tool_progress(data):
+            if self.current is None:
+                return
+            if data.get("status") == "started":
+                if self.current["first_tool_ms"] is None:
+                    self.current["first_tool_ms"] = self._elapsed_ms()
+            else:
+                self.current["last_tool_done_ms"] = self._elapsed_ms()
+                self.current["tools"].append({"name": str(data.get("name")).split("__")[-1], "status": data.get("status"),
+                                              "elapsed_ms": data.get("elapsed_ms")})
+
+        def on_answer(data):
+            if self.current is not None:
+                self.current["total_ms"] = self._elapsed_ms()
+                self.current["answer_chars"] = len(data.get("text") or "")
+                self.done.set()
+
+        self.client.on("message_done", on_answer)
+        self.client.on("new_message", on_answer) # Frontend con STREAM_RESPONSES=0
+
+        @self.client.on("error")
+        def on_error(data):
+            message = (data or {}).get("message", str(data))
+            if self.current is not None:
+                self.current["error"] = message
+                self.done.set()
+            else:
+                self.errors.append(message)
+                self.initialized.set() # Inizializzazione fallita: inutile aspettare il timeout
+
+    def connect_and_initialize(self) -> Dict[str, float]:
+        started = time.perf_counter()
+        self.client.connect(self.url, transports=["websocket"], wait_timeout=self.timeout)
+        connected = time.perf_counter()
+        self.client.emit("initialize", {"selected_server_ids": [self.server_id], "conversation_id": f"bench-{uuid.uuid4()}"})
+        if not self.initialized.wait(self.timeout) or self.errors:
+            raise RuntimeError(f"client {self.index}: inizializzazione fallita ({'; '.join(self.errors) or 'timeout'})")
+        return {"connect_ms": (connected - started) * 1000, "initialize_ms": (time.perf_counter() - connected) * 1000}
+
+    def send(self, scenario: str, sequence: int) -> Dict[str, Any]:
+        self.done.clear()
+        self.current = {"client": self.index, "sequence": sequence, "scenario": scenario, "first_tool_ms": None,
+                        "last_tool_done_ms": None, "first_delta_ms": None, "total_ms": None, "tools": [], "error": None,
+                        "_sent_at": time.perf_counter()}
+        self.client.emit("send_message", {"message": f"[{scenario}] richiesta {sequence} del client {self.index}"})
+        if not self.done.wait(self.timeout):
+            self.current["error"] = f"timeout dopo {self.timeout:g}s"
+        record, self.current = self.current, None
+        record.pop("_sent_at")
+        if record["first_tool_ms"] is not None and record["last_tool_done_ms"] is not None:
+            record["tools_ms"] = record["last_tool_done_ms"] - record["first_tool_ms"]
+            if record["total_ms"] is not None:
+                record["answer_ms"] = record["total_ms"] - record["last_tool_done_ms"]
+        if any(tool["status"] == "error" for tool in record["tools"]) and record["error"] is None:
+            record["error"] = "tool in errore: " + ", ".join(tool["name"] for tool in record["tools"] if tool["status"] == "error")
+        return record
+
+    def close(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+
+def run_load(url: str, clients: int, messages_per_client: int, scenarios: List[str], server_id: str,
+             timeout: float = 120.0) -> Dict[str, Any]:
+    """Esegue il carico e restituisce i record dei messaggi, i tempi di inizializzazione e la durata della fase di carico."""
+    users = [SimulatedUser(index, url, server_id, timeout) for index in range(clients)]
+    setup: List[Dict[str, Any]] = [{} for _ in users]
+    records: List[List[Dict[str, Any]]] = [[] for _ in users]
+    start_barrier = threading.Barrier(clients + 1)
+
+    def run_user(user: SimulatedUser):
+        try:
+            setup[user.index] = user.connect_and_initialize()
+        except Exception as e:
+            setup[user.index] = {"error": str(e)}
+        try:
+            start_barrier.wait(timeout * 2)
+        except threading.BrokenBarrierError:
+            return
+        if "error" in setup[user.index]:
+            return
+        for sequence in range(messages_per_client):
+            # Scenari a rotazione, sfasati tra i client: a ogni istante girano richieste diverse
+            records[user.index].append(user.send(scenarios[(user.index + sequence) % len(scenarios)], sequence))
+
+    threads = [threading.Thread(target=run_user, args=(user,), name=f"bench-user-{user.index}", daemon=True) for user in users]
+    for thread in threads:
+        thread.start()
+    try:
+        start_barrier.wait(timeout * 2)
+    except threading.BrokenBarrierError:
+        pass # Qualche client non ha finito l'inizializzazione in tempo: risulta tra gli errori di setup
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall_s = time.perf_counter() - started
+    for user in users:
+        user.close()
+    return {"setup": setup, "messages": [record for user_records in records for record in user_records], "wall_s": wall_s}
@@ -0,0 +1,399 @@
+"""Benchmark end-to-end: dataset_server.py + mcp_web.py + frontend-application.py con un OpenAI finto.
+
+Per ogni dimensione del dataset genera un CSV sintetico, avvia i quattro processi in locale (porte
+standard 8000, 8080, 5000 e FAKE_OPENAI_PORT), esegue un giro di riscaldamento e poi, per ogni livello
+di concorrenza, N client Socket.IO che inviano messaggi degli scenari scelti (vedi fake_openai.SCENARIOS).
+Misura latenze p50/p95/p99 totali e per fase, throughput e memoria residente (RSS) di ogni processo,
+e scrive tutto in un file JSON confrontabile con compare_results.py. Il riscaldamento è riportato a
+parte ("warmup"): contiene i costi a freddo (primo caricamento del CSV, indici). Le cache restano
+attive come in produzione; con --env MCP_CACHE_TTL=0 ogni tool interroga davvero il dataset server.
+
+    pip install -r requirements_dataset.txt -r requirements_mcp_web.txt -r frontend/requirements.txt -r benchmarks/requirements.txt
+    python benchmarks/run_benchmark.py --sizes 1000,100000 --clients 1,10 --messages 4
+    python benchmarks/run_benchmark.py --baseline benchmarks/results/precedente.json
+    python benchmarks/run_benchmark.py --env DATASET_COLUMNAR=0 --output /tmp/senza-colonnare.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+try:
+    import psutil # Opzionale: RSS anche fuori da Linux e comprensivo dei processi figli
+except ImportError:
+    psutil = None
+
+from compare_results import compare, print_comparison
+from fake_openai import DEFAULT_SCENARIOS, FAKE_OPENAI_PORT, SCENARIOS
+from load_driver import run_load
+from synthetic_data import generate
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+BENCH_SERVER_ID = "bench_local_csv"
+DATASET_URL = "http://127.0.0.1:8000"
+MCP_WEB_URL = "http://127.0.0.1:8080"
+FRONTEND_URL = "http://127.0.0.1:5000"
+STARTUP_TIMEOUT = float(os.getenv("BENCH_STARTUP_TIMEOUT", "180")) # Secondi; con 10^6 righe il primo caricamento è lento
+RSS_SAMPLE_INTERVAL = 0.25
+# "dev": server Werkzeug di frontend-application.py; "gunicorn": come nel Dockerfile (serve eventlet)
+FRONTEND_COMMANDS = {
+    "dev": [sys.executable, os.path.join(REPO_DIR, "frontend", "frontend-application.py")],
+    "gunicorn": [sys.executable, "-m", "gunicorn", "--bind", "0.0.0.0:5000", "--workers", "1", "--worker-class", "eventlet",
+                 "--timeout", "3600", "frontend-application:app"],
+}
+LATENCY_STAGES = ("total_ms", "first_tool_ms", "tools_ms", "answer_ms", "first_delta_ms")
+
+
+class Service:
+    """Un processo del sistema sotto test, con log su file e attesa della prontezza via HTTP."""
+
+    def __init__(self, name: str, command: List[str], cwd: str, env: Dict[str, str], ready_url: str, log_dir: str):
+        self.name = name
+        self.command = command
+        self.cwd = cwd
+        self.env = env
+        self.ready_url = ready_url
+        self.log_path = os.path.join(log_dir, f"{name}.log")
+        self.process: Optional[subprocess.Popen] = None
+        self.startup_s: Optional[float] = None
+
+    def start(self):
+        started = time.perf_counter()
+        with open(self.log_path, "wb") as log:
+            self.process = subprocess.Popen(self.command, cwd=self.cwd, env=self.env, stdout=log, stderr=subprocess.STDOUT)
+        while time.perf_counter() - started < STARTUP_TIMEOUT:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.name} terminato all'avvio (codice {self.process.returncode}):\n{self.log_tail()}")
+            try:
+                if requests.get(self.ready_url, timeout=2).status_code < 500:
+                    self.startup_s = time.perf_counter() - started
+                    print(f"  {self.name} pronto in {self.startup_s:.1f}s (pid {self.process.pid})")
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"{self.name} non pronto dopo {STARTUP_TIMEOUT:g}s:\n{self.log_tail()}")
+
+    def log_tail(self, lines: int = 20) -> str:
+        with open(self.log_path, "rb") as log:
+            return b"\n".join(log.read().splitlines()[-lines:]).decode("utf-8", errors="replace")
+
+    def stop(self):
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def _rss_bytes(pid: int) -> Optional[int]:
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            return process.memory_info().rss + sum(child.memory_info().rss for child in process.children(recursive=True))
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler:
+    """Campiona l'RSS dei servizi durante un'esecuzione e ne tiene il massimo."""
+
+    def __init__(self, services: List[Service]):
+        self.services = services
+        self.peak: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-rss", daemon=True)
+
+    def _sample(self):
+        for service in self.services:
+            rss = _rss_bytes(service.process.pid)
+            if rss is not None:
+                self.peak[service.name] = max(self.peak.get(service.name, 0), rss)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(RSS_SAMPLE_INTERVAL)
+
+    def __enter__(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Interpolazione lineare tra i due campioni più vicini (come numpy.percentile)."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def latency_summary(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 1),
+        "p50": round(percentile(values, 0.50), 1),
+        "p95": round(percentile(values, 0.95), 1),
+        "p99": round(percentile(values, 0.99), 1),
+        "max": round(max(values), 1),
+    }
+
+
+def summarize(load: Dict[str, Any]) -> Dict[str, Any]:
+    messages = load["messages"]
+    completed = [record for record in messages if record["error"] is None and record["total_ms"] is not None]
+    latency = {stage: latency_summary([record[stage] for record in completed if record.get(stage) is not None])
+               for stage in LATENCY_STAGES}
+    for setup_stage in ("connect_ms", "initialize_ms"):
+        latency[setup_stage] = latency_summary([setup[setup_stage] for setup in load["setup"] if setup_stage in setup])
+    tools: Dict[str, List[float]] = {}
+    for record in completed:
+        for tool in record["tools"]:
+            if tool["elapsed_ms"] is not None:
+                tools.setdefault(tool["name"], []).append(tool["elapsed_ms"])
+    scenarios: Dict[str, List[float]] = {}
+    for record in completed:
+        scenarios.setdefault(record["scenario"], []).append(record["total_ms"])
+    errors: Dict[str, int] = {}
+    for record in messages:
+        if record["error"] is not None:
+            errors[record["error"]] = errors.get(record["error"], 0) + 1
+    for setup in load["setup"]:
+        if "error" in setup:
+            errors[setup["error"]] = errors.get(setup["error"], 0) + 1
+    return {
+        "messages": len(messages),
+        "completed": len(completed),
+        "errors": errors,
+        "wall_s": round(load["wall_s"], 3),
+        "throughput_rps": round(len(completed) / load["wall_s"], 3) if load["wall_s"] else 0.0,
+        "latency_ms": latency,
+        "tool_latency_ms": {name: latency_summary(values) for name, values in sorted(tools.items())},
+        "scenario_latency_ms": {name: latency_summary(values) for name, values in sorted(scenarios.items())},
+    }
+
+
+def _server_stats() -> Dict[str, Any]:
+    """Contatori interni dei servizi dopo l'esecuzione (cache, pool, dispatcher, chiamate al modello)."""
+    endpoints = {
+        "dataset_server": f"{DATASET_URL}/cache-stats",
+        "mcp_web": f"{MCP_WEB_URL}/pool-stats",
+        "frontend_dispatcher": f"{FRONTEND_URL}/api/dispatcher_stats",
+        "frontend_mcp_pool": f"{FRONTEND_URL}/api/mcp_pool_stats",
+        "fake_openai": f"http://127.0.0.1:{FAKE_OPENAI_PORT}/stats",
+    }
+    stats = {}
+    for name, url in endpoints.items():
+        try:
+            stats[name] = requests.get(url, timeout=5).json()
+        except Exception as e:
+            stats[name] = {"error": str(e)}
+    return stats
+
+
+def _check_ports_free():
+    for port in (8000, 8080, 5000, FAKE_OPENAI_PORT):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+            if probe.connect_ex(("127.0.0.1", port)) == 0:
+                raise RuntimeError(f"La porta {port} è già in uso: ferma i servizi locali prima del benchmark.")
+
+
+def _write_server_config(path: str):
+    config = {"available_mcp_servers": [{
+        "id": BENCH_SERVER_ID,
+        "name": "Server MCP locale (benchmark)",
+        "url": f"{MCP_WEB_URL}/sse",
+        "default_selected": True,
+        "idempotent_tools": ["*"],
+        "data_version_url": f"{MCP_WEB_URL}/data-version",
+    }]}
+    with open(path, "w", encoding="utf-8") as config_file:
+        json.dump(config, config_file, indent=2)
+
+
+def start_services(data_dir: str, log_dir: str, latency_ms: float, extra_env: Dict[str, str],
+                   frontend_server: str) -> List[Service]:
+    config_path = os.path.join(log_dir, "mcp_servers.json")
+    _write_server_config(config_path)
+    env = dict(os.environ, PYTHONUNBUFFERED="1", **extra_env)
+    frontend_env = dict(env, OPENAI_BASE_URL=f"http://127.0.0.1:{FAKE_OPENAI_PORT}/v1", OPENAI_API_KEY="bench",
+                        MCP_SERVERS_CONFIG_PATH=config_path)
+    services = [
+        # cwd = directory dei dati sintetici: il dataset server legge i file con percorsi relativi
+        Service("dataset_server", [sys.executable, os.path.join(REPO_DIR, "dataset_server.py")], data_dir, env,
+                f"{DATASET_URL}/cache-stats", log_dir),
+        Service("fake_openai", [sys.executable, os.path.join(REPO_DIR, "benchmarks", "fake_openai.py")], REPO_DIR,
+                dict(env, FAKE_OPENAI_PORT=str(FAKE_OPENAI_PORT), FAKE_OPENAI_LATENCY_MS=str(latency_ms)),
+                f"http://127.0.0.1:{FAKE_OPENAI_PORT}/stats", log_dir),
+        Service("mcp_web", [sys.executable, os.path.join(REPO_DIR, "mcp_web.py")], REPO_DIR,
+                dict(env, DATASET_API_BASE_URL=DATASET_URL), f"{MCP_WEB_URL}/pool-stats", log_dir),
+        Service("frontend", FRONTEND_COMMANDS[frontend_server], os.path.join(REPO_DIR, "frontend"), frontend_env,
+                f"{FRONTEND_URL}/api/session_stats", log_dir),
+    ]
+    started: List[Service] = []
+    try:
+        for service in services:
+            service.start()
+            started.append(service)
+    except Exception:
+        stop_services(started)
+        raise
+    return services
+
+
+def stop_services(services: List[Service]):
+    for service in reversed(services):
+        service.stop()
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def benchmark_size(rows: int, args: argparse.Namespace, work_dir: str, extra_env: Dict[str, str]) -> List[Dict[str, Any]]:
+    data_dir = os.path.join(work_dir, f"rows-{rows}")
+    print(f"\n== {rows} righe ==")
+    generated_at = time.perf_counter()
+    data = generate(data_dir, rows)
+    data["generate_s"] = round(time.perf_counter() - generated_at, 2)
+    services = start_services(data_dir, data_dir, args.latency_ms, extra_env, args.frontend)
+    runs = []
+    try:
+        startup = {service.name: round(service.startup_s, 2) for service in services}
+        # Riscaldamento: ogni scenario una volta con un client (caricamento dei dati, indici, archivio colonnare)
+        with RssSampler(services) as sampler:
+            warmup = run_load(FRONTEND_URL, 1, len(args.scenarios), args.scenarios, BENCH_SERVER_ID, args.timeout)
+        cold = summarize(warmup)
+        print(f"  riscaldamento: {cold['completed']}/{cold['messages']} messaggi, "
+              f"p50 {((cold['latency_ms']['total_ms'] or {}).get('p50'))} ms")
+        for clients in args.clients:
+            with RssSampler(services) as sampler:
+                load = run_load(FRONTEND_URL, clients, args.messages, args.scenarios, BENCH_SERVER_ID, args.timeout)
+            run = {"rows": rows, "clients": clients, "messages_per_client": args.messages, "data": data,
+                   "startup_s": startup, "warmup": cold, **summarize(load),
+                   "rss_peak_mb": {name: round(value / 2 ** 20, 1) for name, value in sampler.peak.items()},
+                   "server_stats": _server_stats()}
+            if args.raw:
+                run["records"] = load["messages"]
+            total = run["latency_ms"]["total_ms"] or {}
+            print(f"  {clients:>4} client: {run['completed']}/{run['messages']} ok, {run['throughput_rps']:.2f} msg/s, "
+                  f"p50 {total.get('p50')} / p95 {total.get('p95')} / p99 {total.get('p99')} ms, "
+                  f"RSS dataset {run['rss_peak_mb'].get('dataset_server')} MB")
+            runs.append(run)
+    finally:
+        stop_services(services)
+        if not args.keep_data:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return runs
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(float(item)) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=_int_list, default=[1_000, 10_000, 100_000, 1_000_000],
+                        help="Righe del CSV sintetico, separate da virgola (accetta 1e6)")
+    parser.add_argument("--clients", type=_int_list, default=[1, 10, 25], help="Livelli di concorrenza")
+    parser.add_argument("--messages", type=int, default=6, help="Messaggi inviati da ogni client")
+    parser.add_argument("--scenarios", type=lambda value: [item.strip() for item in value.split(",") if item.strip()],
+                        default=DEFAULT_SCENARIOS, help=f"Scenari a rotazione tra: {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Latenza simulata di ogni chiamata al modello")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Attesa massima di una risposta (secondi)")
+    parser.add_argument("--env", action="append", default=[], metavar="NOME=VALORE",
+                        help="Variabile d'ambiente per tutti i servizi (ripetibile), es. DATASET_COLUMNAR=0")
+    parser.add_argument("--frontend", choices=sorted(FRONTEND_COMMANDS), default="dev",
+                        help="Come avviare il frontend: server di sviluppo o gunicorn+eventlet come in produzione")
+    parser.add_argument("--output", help="File JSON dei risultati (default benchmarks/results/bench-<data>.json)")
+    parser.add_argument("--baseline", help="Risultati precedenti da confrontare con questa esecuzione")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Variazione relativa tollerata nel confronto")
+    parser.add_argument("--raw", action="store_true", help="Salva anche i tempi di ogni singolo messaggio")
+    parser.add_argument("--keep-data", action="store_true", help="Non cancellare dati sintetici e log")
+    args = parser.parse_args()
+
+    unknown = [scenario for scenario in args.scenarios if scenario not in SCENARIOS]
+    if unknown:
+        parser.error(f"Scenari sconosciuti: {', '.join(unknown)}")
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    _check_ports_free()
+
+    started_at = datetime.datetime.now()
+    results: Dict[str, Any] = {
+        "meta": {
+            "started_at": started_at.isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sizes": args.sizes,
+            "clients": args.clients,
+            "messages_per_client": args.messages,
+            "scenarios": args.scenarios,
+            "model_latency_ms": args.latency_ms,
+            "frontend_server": args.frontend,
+            "env": extra_env,
+        },
+        "runs": [],
+    }
+    work_dir = tempfile.mkdtemp(prefix="mcp-bench-")
+    try:
+        for rows in args.sizes:
+            results["runs"].extend(benchmark_size(rows, args, work_dir, extra_env))
+    finally:
+        if args.keep_data:
+            print(f"\nDati sintetici e log in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        output = args.output or os.path.join(RESULTS_DIR, f"bench-{started_at:%Y%m%d-%H%M%S}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2, ensure_ascii=False)
+        print(f"\nRisultati scritti in {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            comparison = compare(json.load(baseline_file), results, args.threshold)
+        print()
+        print_comparison(comparison)
+        if any(row["regression"] for row in comparison):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Dataset sintetici per i benchmark: mauden_employees.csv e stagisti.json di N righe, sempre uguali a parità di N.
+
+Ruoli e nomi vengono dai dati reali del repository, così filtri e ricerche degli scenari trovano
+risultati a ogni dimensione.
+
+    python benchmarks/synthetic_data.py 100000 /tmp/bench-data
+"""
+import csv
+import json
+import os
+import sys
+from typing import Dict, List
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED = 20240601
+CHUNK_ROWS = 100_000 # Righe generate e scritte alla volta: 10^6 righe senza picchi di memoria
+
+
+def _vocabulary() -> Dict[str, List[str]]:
+    with open(os.path.join(REPO_DIR, "mauden_employees.csv"), newline="", encoding="utf-8") as source:
+        rows = list(csv.DictReader(source))
+    names = [row["Name"].split(" ", 1) for row in rows if " " in row["Name"]]
+    return {
+        "roles": sorted({row["Role"] for row in rows}),
+        "first_names": sorted({first for first, _ in names}),
+        "last_names": sorted({last for _, last in names}),
+    }
+
+
+def write_employees_csv(path: str, rows: int) -> int:
+    """Scrive il CSV dei dipendenti (Name, Role, Age, Salary "$58,473"); restituisce i byte scritti."""
+    vocabulary = _vocabulary()
+    random = np.random.RandomState(SEED)
+    roles = np.array(vocabulary["roles"], dtype=object)
+    first_names = np.array(vocabulary["first_names"], dtype=object)
+    last_names = np.array(vocabulary["last_names"], dtype=object)
+    with open(path, "w", newline="", encoding="utf-8") as target:
+        writer = csv.writer(target)
+        writer.writerow(["Name", "Role", "Age", "Salary"])
+        for start in range(0, rows, CHUNK_ROWS):
+            size = min(CHUNK_ROWS, rows - start)
+            names = first_names[random.randint(0, len(first_names), size)] + " " + last_names[random.randint(0, len(last_names), size)]
+            role = roles[random.randint(0, len(roles), size)]
+            age = random.randint(22, 66, size)
+            salary = random.randint(35_000, 130_000, size)
+            writer.writerows(zip(names, role, age, (f"${value:,}" for value in salary)))
+    return os.path.getsize(path)
+
+
+def write_stagisti_json(path: str, rows: int) -> int:
+    vocabulary = _vocabulary()
+    random = np.random.RandomState(SEED + 1)
+    dipendenti = [{
+        "ruolo": "stagista",
+        "nome": f"{vocabulary['first_names'][random.randint(len(vocabulary['first_names']))]} "
+                f"{vocabulary['last_names'][random.randint(len(vocabulary['last_names']))]}",
+        "societa": "Mauden",
+        "eta": int(random.randint(21, 30)),
+    } for _ in range(rows)]
+    with open(path, "w", encoding="utf-8") as target:
+        json.dump({"dipendenti": dipendenti}, target, ensure_ascii=False, indent=2)
+    return os.path.getsize(path)
+
+
+def generate(directory: str, rows: int) -> Dict[str, int]:
+    """Crea i due file nella directory di lavoro del dataset server; gli stagisti sono un centesimo dei dipendenti."""
+    os.makedirs(directory, exist_ok=True)
+    return {
+        "employees_rows": rows,
+        "employees_bytes": write_employees_csv(os.path.join(directory, "mauden_employees.csv"), rows),
+        "stagisti_rows": max(4, rows // 100),
+        "stagisti_bytes": write_stagisti_json(os.path.join(directory, "stagisti.json"), max(4, rows // 100)),
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python benchmarks/synthetic_data.py <righe> <directory>", file=sys.stderr)
+        sys.exit(2)
+    print(json.dumps(generate(sys.argv[2], int(sys.argv[1])), indent=2))
@@ -1,10 +1,39 @@
+import asyncio
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import json
 import os
 import csv # Importa il modulo csv
+import difflib
+import gc
+import gzip
+import hashlib
+import re
+import sqlite3
+import sys
+import threading
+import unicodedata
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import unquote_plus
+from fastapi import Request
+import numpy as np
 import pandas as pd # Se usi pandas per il CSV
 
+try:
+    import brotli # Opzionale: se assente si usa solo gzip
+except ImportError:
+    brotli = None
+
+try:
+    import pyarrow as pa # Opzionale: archivio colonnare Arrow IPC; se assente si leggono direttamente CSV/JSON
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
 app = FastAPI()
 
 # Percorsi ai file dati all'interno del container
@@ -12,29 +41,1594 @@ app = FastAPI()
 STAGISTI_JSON_PATH = "stagisti.json" # Equivalente a /app/stagisti.json
 MAUDEN_CSV_PATH = "mauden_employees.csv" # Equivalente a /app/mauden_employees.csv
 
+
+# --- ETag e compressione delle risposte ---
+DATASET_COMPRESS_MIN_BYTES = int(os.getenv("DATASET_COMPRESS_MIN_BYTES", "1024"))
+DATASET_GZIP_LEVEL = int(os.getenv("DATASET_GZIP_LEVEL", "6"))
+DATASET_BROTLI_QUALITY = int(os.getenv("DATASET_BROTLI_QUALITY", "5"))
+
+def _make_etag(seed: str) -> str:
+    return '"' + hashlib.sha1(seed.encode("utf-8")).hexdigest()[:24] + '"'
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=DATASET_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=DATASET_GZIP_LEVEL)
+
+def _choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Sceglie la codifica con q più alto tra quelle supportate; a parità preferisce br."""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        token, _, params = item.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if token.strip():
+            accepted[token.strip().lower()] = quality
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_quality = None, 0.0
+    for encoding in candidates:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def _encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """ETag della variante compressa ("abc-gzip"): rappresentazioni diverse non condividono l'ETag forte."""
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+def _matching_etag(if_none_match: str, etag: str, encoding: Optional[str]) -> Optional[str]:
+    """ETag da restituire nel 304 se If-None-Match corrisponde a etag, altrimenti None.
+
+    Il 304 riporta lo stesso ETag del 200 che il client ha in cache: la variante compressa nella
+    codifica scelta se il client ne ha inviata una, altrimenti quella non compressa (body piccoli).
+    """
+    if if_none_match.strip() == "*":
+        return etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return etag
+        # Le varianti compresse hanno un suffisso ("abc-gzip"): il contenuto è lo stesso
+        for suffix in ("-br\"", "-gzip\""):
+            if candidate.endswith(suffix) and candidate[:-len(suffix)] + '"' == etag:
+                return _encoded_etag(etag, encoding)
+    return None
+
+def conditional_json_response(request: Request, etag: str, build_body: Callable[[], bytes],
+                              snapshot: Optional["DatasetSnapshot"] = None) -> Response:
+    """304 se il client ha già questa versione, altrimenti il body JSON compresso secondo Accept-Encoding.
+
+    build_body viene chiamata solo se serve davvero inviare il contenuto; se snapshot è indicato
+    il body è quello completo del dataset e la variante compressa viene riusata tra le richieste.
+    """
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    # La codifica si sceglie prima del controllo: il 304 deve avere l'ETag della variante che il 200 invierebbe
+    encoding = _choose_encoding(request.headers.get("accept-encoding", ""))
+    if_none_match = request.headers.get("if-none-match")
+    matched = _matching_etag(if_none_match, etag, encoding) if if_none_match else None
+    if matched is not None:
+        headers["ETag"] = matched
+        return Response(status_code=304, headers=headers)
+
+    body = build_body()
+    if encoding is None or len(body) < DATASET_COMPRESS_MIN_BYTES:
+        return Response(content=body, media_type="application/json", headers=headers)
+    headers["Content-Encoding"] = encoding
+    headers["ETag"] = _encoded_etag(etag, encoding)
+    content = snapshot.encoded_body(encoding) if snapshot is not None else _compress(body, encoding)
+    return Response(content=content, media_type="application/json", headers=headers)
+# --- Fine ETag e compressione ---
+
+
+# --- Pool di thread per il lavoro bloccante ---
+# Parsing dei file, filtri pandas, serializzazione JSON e compressione girano qui e non sul loop di
+# uvicorn: un CSV grande in caricamento non blocca le altre richieste dello stesso worker.
+DATASET_WORKER_THREADS = int(os.getenv("DATASET_WORKER_THREADS", str(min(8, (os.cpu_count() or 1) + 2))))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid = 0
+_executor_lock = threading.Lock()
+_blocking_stats = {"submitted": 0, "active": 0, "queued": 0, "failed": 0}
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    # Creato nel processo che lo usa: con gunicorn --preload i thread del master non sopravvivono al fork
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=DATASET_WORKER_THREADS, thread_name_prefix="dataset-worker")
+            _executor_pid = os.getpid()
+        return _executor
+
+async def run_blocking(function: Callable[..., Any], *args: Any) -> Any:
+    """Esegue function(*args) nel pool di thread e ne attende il risultato senza bloccare il loop."""
+    with _executor_lock:
+        _blocking_stats["submitted"] += 1
+        _blocking_stats["queued"] += 1
+
+    def run() -> Any:
+        with _executor_lock:
+            _blocking_stats["queued"] -= 1
+            _blocking_stats["active"] += 1
+        try:
+            return function(*args)
+        except Exception:
+            with _executor_lock:
+                _blocking_stats["failed"] += 1
+            raise
+        finally:
+            with _executor_lock:
+                _blocking_stats["active"] -= 1
+
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), run)
+
+def executor_stats() -> Dict[str, Any]:
+    with _executor_lock:
+        return dict(_blocking_stats, max_threads=DATASET_WORKER_THREADS, pid=os.getpid())
+
+@app.on_event("shutdown")
+def _shutdown_executor():
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+# --- Fine pool di thread ---
+
+
+# --- Archivio colonnare (Arrow IPC in memory-map) ---
+# Ogni sorgente viene convertita una volta in un file Arrow con tipi veri (importi numerici, colonne
+# ripetitive come categorie); le letture successive mappano il file in memoria invece di riparsare
+# il testo, e i worker dello stesso host condividono le pagine tramite la page cache del sistema.
+# Il file viene ricostruito quando cambia la firma (mtime, dimensione) della sorgente.
+DATASET_COLUMNAR = pa is not None and os.getenv("DATASET_COLUMNAR", "1").lower() in ("1", "true", "yes")
+DATASET_COLUMNAR_DIR = os.getenv("DATASET_COLUMNAR_DIR", ".columnar")
+# Una colonna testuale diventa categorica se i valori distinti sono al massimo questa frazione delle righe
+DATASET_CATEGORY_MAX_RATIO = float(os.getenv("DATASET_CATEGORY_MAX_RATIO", "0.5"))
+DATASET_COLUMNAR_BATCH_ROWS = int(os.getenv("DATASET_COLUMNAR_BATCH_ROWS", "10000")) # Righe per record batch (unità dello streaming)
+
+_CURRENCY_SYMBOL_PATTERN = re.compile(r"[$€£]")
+
+
+def _typed_frame(frame: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """Importi in valuta -> float64 (ricordando il simbolo), testo ripetitivo -> categoria."""
+    typed = frame.copy()
+    formats: Dict[str, str] = {}
+    for column, values in _parse_currency_columns(frame).items():
+        sample = str(frame[column].dropna().iloc[0])
+        formats[str(column)] = _CURRENCY_SYMBOL_PATTERN.search(sample).group(0)
+        typed[column] = values.astype("float64")
+    for column in typed.columns:
+        series = typed[column]
+        if str(column) in formats or pd.api.types.is_numeric_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype):
+            continue
+        if len(series) and series.nunique(dropna=True) <= DATASET_CATEGORY_MAX_RATIO * len(series):
+            typed[column] = series.astype("category")
+    return typed, formats
+
+
+class ColumnarStore:
+    """File Arrow IPC derivato da una sorgente CSV/JSON, con la firma della sorgente nei metadati."""
+
+    def __init__(self, name: str, source_path: str, directory: str = DATASET_COLUMNAR_DIR):
+        self.name = name
+        self.source_path = source_path
+        base = os.path.dirname(source_path) if not os.path.isabs(directory) else ""
+        self.path = os.path.join(base, directory, os.path.basename(source_path) + ".arrow")
+        self.builds = 0
+        self.mapped_loads = 0
+        self.write_errors = 0
+
+    @staticmethod
+    def _signature_tag(signature: Tuple[int, int]) -> bytes:
+        return f"{signature[0]}:{signature[1]}".encode("ascii")
+
+    def _build(self, signature: Tuple[int, int], loader: Callable[[str], Tuple[Any, pd.DataFrame, Any]],
+               records_key: Optional[str]) -> "pa.Table":
+        _, frame, payload = loader(self.source_path)
+        typed, formats = _typed_frame(frame)
+        # La parte della risposta che non sono righe (es. altre chiavi di stagisti.json) va nei metadati
+        envelope = {key: (None if key == records_key else value) for key, value in payload.items()} if records_key else None
+        table = pa.Table.from_pandas(typed, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata.update({
+            b"mcp.source_signature": self._signature_tag(signature),
+            b"mcp.formats": json.dumps(formats).encode("utf-8"),
+            b"mcp.envelope": json.dumps(envelope, ensure_ascii=False).encode("utf-8"),
+        })
+        table = table.replace_schema_metadata(metadata)
+        self.builds += 1
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temporary = f"{self.path}.{os.getpid()}.tmp"
+            with pa.OSFile(temporary, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=DATASET_COLUMNAR_BATCH_ROWS)
+            os.replace(temporary, self.path) # Atomico: i lettori vedono il file vecchio o quello nuovo, mai a metà
+            print(f"ColumnarStore '{self.name}': {self.source_path} convertito in {self.path} ({table.num_rows} righe).")
+        except OSError as e:
+            self.write_errors += 1
+            print(f"ColumnarStore '{self.name}': impossibile scrivere {self.path} ({e}), uso la tabella in memoria.", file=sys.stderr)
+        return table
+
+    def open(self, signature: Tuple[int, int]) -> Optional["pa.ipc.RecordBatchFileReader"]:
+        """Reader sul file mappato in memoria, se esiste ed è allineato alla sorgente."""
+        try:
+            reader = pa.ipc.open_file(pa.memory_map(self.path, "r"))
+        except (OSError, pa.ArrowInvalid):
+            return None
+        if (reader.schema.metadata or {}).get(b"mcp.source_signature") != self._signature_tag(signature):
+            return None
+        return reader
+
+    def load(self, signature: Tuple[int, int], loader: Callable[[str], Tuple[Any, pd.DataFrame, Any]],
+             records_key: Optional[str]) -> Tuple[pd.DataFrame, Dict[str, str], Any]:
+        reader = self.open(signature)
+        if reader is None:
+            table = self._build(signature, loader, records_key)
+            reader = self.open(signature)
+        if reader is not None:
+            table = reader.read_all() # Zero-copy: i buffer puntano alle pagine del file mappato
+            self.mapped_loads += 1
+        metadata = table.schema.metadata or {}
+        # split_blocks evita di consolidare le colonne numeriche in nuovi array: restano viste sul file
+        frame = table.to_pandas(split_blocks=True)
+        return frame, json.loads(metadata.get(b"mcp.formats", b"{}")), json.loads(metadata.get(b"mcp.envelope", b"null"))
+
+    def iter_frames(self, signature: Tuple[int, int]) -> Optional[Iterator[pd.DataFrame]]:
+        """Record batch del file uno alla volta, per lo streaming senza caricare l'intera tabella.
+
+        Il file viene aperto subito: se nel frattempo viene ricostruito, lo stream continua sulla versione mappata.
+        """
+        reader = self.open(signature)
+        if reader is None:
+            return None
+        return (reader.get_batch(index).to_pandas() for index in range(reader.num_record_batches))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "format": "arrow-ipc",
+            "path": self.path,
+            "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "builds": self.builds,
+            "mapped_loads": self.mapped_loads,
+            "write_errors": self.write_errors,
+        }
+# --- Fine archivio colonnare ---
+
+
+# --- Indici secondari ---
+# Costruiti una volta per versione del dataset (al caricamento e a ogni ricaricamento):
+# - hash: valore normalizzato -> posizioni (ruolo), per uguaglianze in O(1)
+# - ordinati: valori numerici ordinati + posizioni (età), per intervalli in O(log n) con searchsorted
+# - testo: token normalizzati -> posizioni (nomi) e vocabolario ordinato per i prefissi in O(log n)
+# La normalizzazione ignora maiuscole e accenti ("Niccolò" == "niccolo").
+DATASET_FUZZY_CUTOFF = float(os.getenv("DATASET_FUZZY_CUTOFF", "0.8")) # Somiglianza minima per i match approssimati; 0 li disattiva
+DATASET_SEARCH_DEFAULT_LIMIT = int(os.getenv("DATASET_SEARCH_DEFAULT_LIMIT", "20"))
+
+_TOKEN_PATTERN = re.compile(r"[^\W_]+")
+_EMPTY_POSITIONS = np.array([], dtype=np.int64)
+
+
+def fold_text(value: Any) -> str:
+    """Minuscolo e senza accenti, spazi compattati."""
+    text = unicodedata.normalize("NFKD", str(value))
+    return " ".join("".join(char for char in text if not unicodedata.combining(char)).lower().split())
+
+def _tokens(value: Any) -> List[str]:
+    return _TOKEN_PATTERN.findall(fold_text(value))
+
+_MATCH_LEVELS = ["exact", "prefix", "fuzzy"]
+
+
+class DatasetIndexes:
+    """Indici secondari di una versione del dataset; le posizioni sono quelle delle righe di snapshot.frame."""
+
+    def __init__(self, snapshot: "DatasetSnapshot", hash_columns: List[str] = (), sorted_columns: List[str] = (),
+                 text_columns: List[str] = ()):
+        frame = snapshot.frame
+        self.rows = len(frame)
+        self.hash: Dict[str, Dict[str, np.ndarray]] = {}
+        for column in hash_columns:
+            if column not in frame.columns:
+                continue
+            # factorize lavora sui valori distinti: la normalizzazione costa O(valori distinti), non O(righe)
+            codes, uniques = pd.factorize(frame[column])
+            by_code = pd.Series(np.arange(self.rows)).groupby(codes).indices
+            index: Dict[str, np.ndarray] = {}
+            for code, positions in by_code.items():
+                if code < 0:
+                    continue # Celle vuote
+                key = fold_text(uniques[code])
+                index[key] = np.union1d(index[key], positions) if key in index else positions
+            self.hash[column] = index
+
+        self.sorted: Dict[str, Tuple[np.ndarray, np.ndarray]] = {} # colonna -> (valori ordinati, posizioni)
+        for column in sorted_columns:
+            if column not in frame.columns:
+                continue
+            values = pd.to_numeric(snapshot.value_column(column), errors="coerce").to_numpy(dtype=float)
+            valid = np.flatnonzero(~np.isnan(values))
+            order = valid[np.argsort(values[valid], kind="stable")]
+            self.sorted[column] = (values[order], order)
+
+        self.text: Dict[str, Dict[str, np.ndarray]] = {}
+        self.vocabulary: Dict[str, List[str]] = {}
+        for column in text_columns:
+            if column not in frame.columns:
+                continue
+            postings: Dict[str, List[int]] = {}
+            for position, value in enumerate(frame[column].tolist()):
+                if pd.isna(value):
+                    continue
+                for token in set(_tokens(value)):
+                    postings.setdefault(token, []).append(position)
+            self.text[column] = {token: np.array(positions, dtype=np.int64) for token, positions in postings.items()}
+            self.vocabulary[column] = sorted(postings)
+
+    def has_hash(self, column: str) -> bool:
+        return column in self.hash
+
+    def has_sorted(self, column: str) -> bool:
+        return column in self.sorted
+
+    def equal(self, column: str, values: List[str], fuzzy: bool = False) -> Tuple[np.ndarray, str]:
+        """Righe il cui valore è uno di values; con fuzzy, se nessuno corrisponde, prova i valori più simili."""
+        index = self.hash[column]
+        keys = [fold_text(value) for value in values]
+        found = [index[key] for key in keys if key in index]
+        level = "exact"
+        if not found and fuzzy and DATASET_FUZZY_CUTOFF > 0:
+            # Pochi valori distinti (es. ruoli): il confronto con tutti resta economico ("business analysts")
+            close = {match for key in keys for match in difflib.get_close_matches(key, list(index), n=3, cutoff=DATASET_FUZZY_CUTOFF)}
+            found = [index[key] for key in close]
+            level = "fuzzy"
+        if not found:
+            return _EMPTY_POSITIONS, level
+        return (found[0] if len(found) == 1 else np.unique(np.concatenate(found))), level
+
+    def range(self, column: str, low: Optional[float] = None, high: Optional[float] = None,
+              include_low: bool = True, include_high: bool = True) -> np.ndarray:
+        """Righe con low <= valore <= high (estremi opzionali), in ordine di posizione."""
+        values, positions = self.sorted[column]
+        start = 0 if low is None else int(np.searchsorted(values, low, side="left" if include_low else "right"))
+        end = len(values) if high is None else int(np.searchsorted(values, high, side="right" if include_high else "left"))
+        return np.sort(positions[start:end]) if end > start else _EMPTY_POSITIONS
+
+    def _token_positions(self, column: str, token: str) -> Tuple[np.ndarray, str]:
+        postings = self.text[column]
+        if token in postings:
+            return postings[token], "exact"
+        vocabulary = self.vocabulary[column]
+        matches = []
+        start = bisect_left(vocabulary, token)
+        while start < len(vocabulary) and vocabulary[start].startswith(token):
+            matches.append(vocabulary[start])
+            start += 1
+        level = "prefix"
+        if not matches and DATASET_FUZZY_CUTOFF > 0 and len(token) >= 3:
+            matches = difflib.get_close_matches(token, vocabulary, n=3, cutoff=DATASET_FUZZY_CUTOFF)
+            level = "fuzzy"
+        if not matches:
+            return _EMPTY_POSITIONS, level
+        return np.unique(np.concatenate([postings[match] for match in matches])), level
+
+    def match_text(self, column: str, text: str) -> Tuple[np.ndarray, str]:
+        """Righe il cui testo contiene tutti i token cercati (interi, come prefisso o approssimati)."""
+        result: Optional[np.ndarray] = None
+        worst = 0
+        for token in dict.fromkeys(_tokens(text)):
+            positions, level = self._token_positions(column, token)
+            worst = max(worst, _MATCH_LEVELS.index(level))
+            result = positions if result is None else np.intersect1d(result, positions, assume_unique=True)
+            if not len(result):
+                break
+        return (_EMPTY_POSITIONS if result is None else result), _MATCH_LEVELS[worst]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hash": {column: len(index) for column, index in self.hash.items()},
+            "sorted": {column: len(values) for column, (values, _) in self.sorted.items()},
+            "text": {column: len(vocabulary) for column, vocabulary in self.vocabulary.items()},
+        }
+# --- Fine indici secondari ---
+
+
+# --- Cache in memoria dei dataset ---
+_CURRENCY_PATTERN = r"^\s*-?[$€£]\s*-?[\d.,]+\s*$"
+
+def _parse_currency_columns(frame: pd.DataFrame) -> Dict[str, pd.Series]:
+    """Converte una volta sola in numeri le colonne testuali i cui valori sono tutti importi in valuta."""
+    numeric: Dict[str, pd.Series] = {}
+    for column in frame.columns:
+        series = frame[column]
+        if pd.api.types.is_numeric_dtype(series) or not series.notna().any():
+            continue
+        text = series.dropna().astype(str)
+        if not text.str.match(_CURRENCY_PATTERN).all():
+            continue
+        # Formato americano: la virgola separa le migliaia, il punto i decimali
+        cleaned = series.astype(str).str.replace(r"[$€£,\s]", "", regex=True)
+        numeric[column] = pd.to_numeric(cleaned.where(series.notna()), errors="coerce")
+    return numeric
+
+class DatasetSnapshot:
+    """Versione di un file dati caricata in memoria: forma parsata e body JSON già serializzato."""
+
+    def __init__(self, data: Any, frame: pd.DataFrame, body: bytes, signature: Tuple[int, int], version: int,
+                 formats: Optional[Dict[str, str]] = None):
+        self.data = data # dict (stagisti.json) o DataFrame (CSV); None se letto dall'archivio colonnare
+        self.frame = frame # Righe del dataset in forma tabellare, usate da filtri e ordinamenti
+        self.body = body # Risposta JSON pronta da inviare
+        self.signature = signature # (mtime_ns, size) del file al momento del caricamento
+        self.version = version # Incrementata a ogni ricaricamento
+        self.etag = ""  # Assegnato da DatasetCache: dipende solo dal file, quindi è uguale in tutti i worker
+        self._encoded: Dict[str, bytes] = {} # Varianti compresse del body, calcolate una volta per versione
+        # Versioni numeriche delle colonne testuali che contengono importi (es. Salary "$58,473" -> 58473.0)
+        self.numeric: Dict[str, pd.Series] = _parse_currency_columns(frame)
+        # Colonne già numeriche nell'archivio colonnare che nelle risposte tornano nel formato originale ("$")
+        self.formats: Dict[str, str] = formats or {}
+        self.indexes: Optional[DatasetIndexes] = None # Assegnati da DatasetCache al caricamento
+        self._derived: Dict[str, pd.Series] = {}
+
+    def records(self, page: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Righe in forma JSON, con gli importi riformattati come nel file sorgente."""
+        formatted = {column: _format_currency(page[column], symbol) for column, symbol in self.formats.items() if column in page.columns}
+        return _frame_to_records(page.assign(**formatted) if formatted else page)
+
+    def value_column(self, column: str) -> pd.Series:
+        """Colonna usata per confronti, ordinamenti e aggregazioni: quella numerica se disponibile."""
+        numeric = self.numeric.get(column)
+        return numeric if numeric is not None else self.frame[column]
+
+    def derived_column(self, key: str, builder: Callable[[], pd.Series]) -> pd.Series:
+        """Colonna calcolata una sola volta per versione (es. testo normalizzato in minuscolo)."""
+        column = self._derived.get(key)
+        if column is None:
+            column = builder()
+            self._derived[key] = column
+        return column
+
+    def encoded_body(self, encoding: str) -> bytes:
+        encoded = self._encoded.get(encoding)
+        if encoded is None:
+            encoded = _compress(self.body, encoding)
+            self._encoded[encoding] = encoded
+        return encoded
+
+
+class DatasetCache:
+    """Carica un file dati una sola volta e lo ricarica solo quando mtime o dimensione cambiano."""
+
+    def __init__(self, name: str, path: str, loader: Callable[[str], Tuple[Any, pd.DataFrame, Any]],
+                 records_key: Optional[str] = None, index_columns: Optional[Dict[str, List[str]]] = None):
+        self.name = name
+        self.path = path
+        self._loader = loader # path -> (forma parsata, DataFrame delle righe, oggetto JSON della risposta)
+        # Chiave della risposta che contiene le righe (None: la risposta è direttamente la lista delle righe)
+        self.records_key = records_key
+        self.columnar = ColumnarStore(name, path) if DATASET_COLUMNAR else None
+        # Colonne da indicizzare: {"hash_columns": [...], "sorted_columns": [...], "text_columns": [...]}
+        self.index_columns = index_columns or {}
+        self._lock = threading.Lock()
+        self._snapshot: Optional[DatasetSnapshot] = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _file_signature(self) -> Tuple[int, int]:
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self) -> DatasetSnapshot:
+        # La firma va letta PRIMA del parsing: se il file cambia durante la lettura,
+        # la richiesta successiva vedrà una firma diversa e ricaricherà.
+        signature = self._file_signature()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.signature == signature:
+            self.hits += 1
+            return snapshot
+
+        with self._lock:
+            # Un'altra richiesta potrebbe aver già ricaricato mentre aspettavamo il lock
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.signature == signature:
+                self.hits += 1
+                return snapshot
+
+            self.misses += 1
+            if snapshot is not None:
+                self.reloads += 1
+                print(f"DatasetCache '{self.name}': file {self.path} modificato, ricaricamento...")
+
+            version = snapshot.version + 1 if snapshot is not None else 1
+            if self.columnar is not None:
+                new_snapshot = self._load_columnar(signature, version)
+            else:
+                data, frame, payload = self._loader(self.path)
+                new_snapshot = DatasetSnapshot(data, frame, _json_bytes(payload), signature, version)
+            new_snapshot.etag = _make_etag(f"{self.name}:{signature[0]}:{signature[1]}")
+            # Indici costruiti prima di pubblicare lo snapshot: chi lo vede li trova già pronti
+            new_snapshot.indexes = DatasetIndexes(new_snapshot, **self.index_columns)
+            self._snapshot = new_snapshot
+            return new_snapshot
+
+    def _load_columnar(self, signature: Tuple[int, int], version: int) -> DatasetSnapshot:
+        frame, formats, envelope = self.columnar.load(signature, self._loader, self.records_key)
+        snapshot = DatasetSnapshot(None, frame, b"", signature, version, formats)
+        records = snapshot.records(frame)
+        if self.records_key is None:
+            payload: Any = records
+        else:
+            payload = {key: records if key == self.records_key else value for key, value in envelope.items()}
+        snapshot.body = _json_bytes(payload)
+        return snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "storage": self.columnar.stats() if self.columnar is not None else "source",
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "version": snapshot.version if snapshot else None,
+            "etag": snapshot.etag if snapshot else None,
+            "rows": len(snapshot.frame) if snapshot else 0,
+            "body_bytes": len(snapshot.body) if snapshot else 0,
+            "indexes": snapshot.indexes.stats() if snapshot and snapshot.indexes else None,
+        }
+
+
+def _render_currency(value: Any, symbol: str) -> Any:
+    if value is None or pd.isna(value):
+        return None
+    sign = "-" if value < 0 else ""
+    amount = abs(float(value))
+    return f"{sign}{symbol}{amount:,.0f}" if amount.is_integer() else f"{sign}{symbol}{amount:,.2f}"
+
+def _format_currency(values: pd.Series, symbol: str) -> pd.Series:
+    return values.map(lambda value: _render_currency(value, symbol)).astype(object)
+
+def _json_bytes(payload: Any) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _frame_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    # NaN non è JSON valido: le celle vuote diventano null nella risposta
+    return df.astype(object).where(pd.notna(df), None).to_dict(orient="records")
+
+def _load_stagisti(path: str) -> Tuple[Dict[str, Any], pd.DataFrame, Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    frame = pd.DataFrame(data.get("dipendenti", []))
+    return data, frame, data
+
+def _load_employees_csv(path: str) -> Tuple[pd.DataFrame, pd.DataFrame, Any]:
+    # Esempio con pandas, assicurati che pandas sia in requirements_dataset.txt
+    df = pd.read_csv(path)
+    return df, df, _frame_to_records(df)
+
+stagisti_cache = DatasetCache("stagisti", STAGISTI_JSON_PATH, _load_stagisti, records_key="dipendenti",
+                              index_columns={"hash_columns": ["ruolo"], "sorted_columns": ["eta"], "text_columns": ["nome"]})
+employees_cache = DatasetCache("dati-csv", MAUDEN_CSV_PATH, _load_employees_csv,
+                               index_columns={"hash_columns": ["Role"], "sorted_columns": ["Age"], "text_columns": ["Name"]})
+# --- Fine cache dataset ---
+
+
+# --- Filtri, proiezione, ordinamento e paginazione ---
+# Sintassi della query string: filtri "Campo<op>valore" con op tra =, !=, >, >=, <, <=, ~ o ~= (contiene),
+# più i parametri riservati fields=A,B  sort=-Age,Name  limit=N  offset=N.
+# Più filtri "=" sullo stesso campo sono in OR (Role=A&Role=B), tutti gli altri in AND.
+RESERVED_QUERY_PARAMS = {"fields", "sort", "limit", "offset", "group_by", "metrics", "format"}
+_QUERY_PART_PATTERN = re.compile(r"^(?P<field>[^<>=!~]+?)(?P<op>>=|<=|!=|~=|=|>|<|~)(?P<value>.*)$")
+
+
+class QueryError(ValueError):
+    """Parametri di query non validi: restituiti al client con status 400."""
+
+
+class DatasetQuery:
+    """Filtri, proiezione, ordinamento e paginazione richiesti su un endpoint dataset."""
+
+    def __init__(self):
+        self.filters: List[Tuple[str, str, str]] = [] # (campo, operatore, valore)
+        self.fields: Optional[List[str]] = None
+        self.sort: List[Tuple[str, bool]] = [] # (campo, ascendente)
+        self.limit: Optional[int] = None
+        self.offset: int = 0
+        self.group_by: List[str] = [] # Solo per /aggregate: "Role" oppure "Age:10" (fasce di ampiezza 10)
+        self.metrics: List[str] = [] # Solo per /aggregate: "count", "mean:Salary", "p90:Salary", ...
+        self.format: str = "json" # "ndjson" per l'esportazione in streaming
+
+    def is_empty(self) -> bool:
+        return not (self.filters or self.fields or self.sort or self.limit is not None or self.offset)
+
+    def has_aggregation(self) -> bool:
+        return bool(self.group_by or self.metrics)
+
+
+def _parse_non_negative_int(name: str, value: str) -> int:
+    try:
+        parsed = int(value)
+    except ValueError:
+        raise QueryError(f"Il parametro '{name}' deve essere un intero, ricevuto '{value}'")
+    if parsed < 0:
+        raise QueryError(f"Il parametro '{name}' non può essere negativo")
+    return parsed
+
+def parse_dataset_query(raw_query: str) -> DatasetQuery:
+    """Interpreta la query string grezza: parse_qs non basta perché "Age>=50" verrebbe spezzato sul primo '='."""
+    query = DatasetQuery()
+    for part in raw_query.split("&"):
+        if not part:
+            continue
+        decoded = unquote_plus(part)
+        match = _QUERY_PART_PATTERN.match(decoded)
+        if not match:
+            raise QueryError(f"Parametro di query non valido: '{decoded}'")
+        field, op, value = match.group("field").strip(), match.group("op"), match.group("value").strip()
+        if op == "~=": # Forma prodotta dai client HTTP che codificano il filtro come coppia chiave=valore ("Name~=jo")
+            op = "~"
+
+        if field not in RESERVED_QUERY_PARAMS:
+            query.filters.append((field, op, value))
+            continue
+        if op != "=":
+            raise QueryError(f"Il parametro '{field}' accetta solo l'operatore '='")
+        if field == "fields":
+            query.fields = [name.strip() for name in value.split(",") if name.strip()]
+        elif field == "sort":
+            for name in (name.strip() for name in value.split(",")):
+                if name:
+                    query.sort.append((name.lstrip("+-"), not name.startswith("-")))
+        elif field == "limit":
+            query.limit = _parse_non_negative_int(field, value)
+        elif field == "offset":
+            query.offset = _parse_non_negative_int(field, value)
+        elif field == "group_by":
+            query.group_by = [name.strip() for name in value.split(",") if name.strip()]
+        elif field == "metrics":
+            query.metrics = [name.strip() for name in value.split(",") if name.strip()]
+        elif field == "format":
+            if value.lower() not in ("json", "ndjson"):
+                raise QueryError(f"Formato non supportato '{value}': usa json o ndjson")
+            query.format = value.lower()
+    return query
+
+def _resolve_column(frame: pd.DataFrame, field: str) -> str:
+    return _resolve_name(list(frame.columns), field)
+
+def _resolve_name(columns: List[Any], field: str) -> Any:
+    if field in columns:
+        return field
+    # Il modello spesso scrive i nomi dei campi in minuscolo ("role" invece di "Role")
+    for column in columns:
+        if str(column).lower() == field.lower():
+            return column
+    raise QueryError(f"Campo sconosciuto '{field}'. Campi disponibili: {', '.join(map(str, columns))}")
+
+def _lowercase_column(snapshot: DatasetSnapshot, column: str) -> pd.Series:
+    return snapshot.derived_column(
+        f"lower:{column}",
+        lambda: snapshot.frame[column].astype(str).str.lower().where(snapshot.frame[column].notna(), ""),
+    )
+
+def _parse_number(field: str, value: str) -> float:
+    try:
+        # Accetta anche importi scritti come nel dataset ("$58,473")
+        return float(re.sub(r"[$€£,\s]", "", value))
+    except ValueError:
+        raise QueryError(f"Il campo '{field}' è numerico, valore non valido '{value}'")
+
+def _positions_mask(size: int, positions: np.ndarray) -> np.ndarray:
+    mask = np.zeros(size, dtype=bool)
+    mask[positions] = True
+    return mask
+
+def _filter_mask(snapshot: DatasetSnapshot, filters: List[Tuple[str, str, str]]) -> np.ndarray:
+    frame = snapshot.frame
+    mask = np.ones(len(frame), dtype=bool)
+    equality_values: Dict[str, List[str]] = {}
+
+    for field, op, value in filters:
+        column = _resolve_column(frame, field)
+        if op == "=":
+            equality_values.setdefault(column, []).append(value)
+            continue
+
+        series = snapshot.value_column(column)
+        indexes = snapshot.indexes
+        if op == "~":
+            condition = _lowercase_column(snapshot, column).str.contains(value.lower(), regex=False)
+        elif indexes is not None and indexes.has_sorted(column) and op in (">", ">=", "<", "<="):
+            number = _parse_number(field, value)
+            if op in (">", ">="):
+                positions = indexes.range(column, low=number, include_low=op == ">=")
+            else:
+                positions = indexes.range(column, high=number, include_high=op == "<=")
+            mask &= _positions_mask(len(frame), positions)
+            continue
+        elif pd.api.types.is_numeric_dtype(series):
+            number = _parse_number(field, value)
+            condition = {"!=": series != number, ">": series > number, ">=": series >= number,
+                         "<": series < number, "<=": series <= number}[op]
+        else:
+            lowered = _lowercase_column(snapshot, column)
+            needle = value.lower()
+            condition = {"!=": lowered != needle, ">": lowered > needle, ">=": lowered >= needle,
+                         "<": lowered < needle, "<=": lowered <= needle}[op]
+        mask &= condition.to_numpy(dtype=bool)
+
+    for column, values in equality_values.items():
+        series = snapshot.value_column(column)
+        if snapshot.indexes is not None and snapshot.indexes.has_hash(column) and not pd.api.types.is_numeric_dtype(series):
+            mask &= _positions_mask(len(frame), snapshot.indexes.equal(column, values)[0])
+            continue
+        if pd.api.types.is_numeric_dtype(series):
+            condition = series.isin([_parse_number(column, value) for value in values])
+        else:
+            condition = _lowercase_column(snapshot, column).isin([value.lower() for value in values])
+        mask &= condition.to_numpy(dtype=bool)
+    return mask
+
+def apply_dataset_query(snapshot: DatasetSnapshot, query: DatasetQuery) -> Dict[str, Any]:
+    """Applica la query al DataFrame in cache; converte in record solo la pagina richiesta."""
+    frame = snapshot.frame
+    columns = [_resolve_column(frame, field) for field in query.fields] if query.fields else list(frame.columns)
+
+    positions = np.flatnonzero(_filter_mask(snapshot, query.filters)) if query.filters else np.arange(len(frame))
+    if query.sort and len(positions):
+        sort_columns = [_resolve_column(frame, field) for field in dict.fromkeys(field for field, _ in query.sort)]
+        ascending = [dict(query.sort)[field] for field in dict.fromkeys(field for field, _ in query.sort)]
+        keys = pd.DataFrame({column: snapshot.value_column(column).iloc[positions].to_numpy() for column in sort_columns})
+        order = keys.sort_values(by=sort_columns, ascending=ascending, kind="stable", na_position="last").index
+        positions = positions[order.to_numpy()]
+
+    total = len(positions)
+    end = total if query.limit is None else min(total, query.offset + query.limit)
+    page = frame.iloc[positions[query.offset:end]][columns]
+    return {
+        "total": total,
+        "offset": query.offset,
+        "limit": query.limit,
+        "next_offset": end if end < total else None,
+        "records": snapshot.records(page),
+    }
+# --- Fine filtri ---
+
+
+# --- Ricerca di persone sugli indici ---
+class PeopleSearch:
+    """Criteri di /search: nome (token, prefissi, approssimato), ruolo, intervallo d'età."""
+
+    def __init__(self):
+        self.name: Optional[str] = None
+        self.role: Optional[str] = None
+        self.min_age: Optional[int] = None
+        self.max_age: Optional[int] = None
+        self.limit: int = DATASET_SEARCH_DEFAULT_LIMIT
+
+
+def parse_people_search(params: Dict[str, str]) -> PeopleSearch:
+    search = PeopleSearch()
+    unknown = set(params) - {"name", "role", "min_age", "max_age", "limit"}
+    if unknown:
+        raise QueryError(f"Parametri non supportati: {', '.join(sorted(unknown))}. Usa name, role, min_age, max_age, limit")
+    search.name = params.get("name", "").strip() or None
+    search.role = params.get("role", "").strip() or None
+    for field in ("min_age", "max_age", "limit"):
+        if params.get(field, "").strip():
+            setattr(search, field, _parse_non_negative_int(field, params[field].strip()))
+    if not (search.name or search.role or search.min_age is not None or search.max_age is not None):
+        raise QueryError("Indica almeno un criterio tra name, role, min_age e max_age")
+    return search
+
+def apply_people_search(snapshot: DatasetSnapshot, search: PeopleSearch, name_column: str, role_column: str,
+                        age_column: str) -> Dict[str, Any]:
+    """Interseca le posizioni restituite dagli indici: nessuna scansione delle righe."""
+    indexes = snapshot.indexes
+    candidates: Optional[np.ndarray] = None
+    match: Dict[str, str] = {}
+
+    def narrow(positions: np.ndarray):
+        nonlocal candidates
+        candidates = positions if candidates is None else np.intersect1d(candidates, positions, assume_unique=True)
+
+    if search.name:
+        positions, match["name"] = indexes.match_text(name_column, search.name)
+        narrow(positions)
+    if search.role:
+        positions, match["role"] = indexes.equal(role_column, [search.role], fuzzy=True)
+        narrow(positions)
+    if search.min_age is not None or search.max_age is not None:
+        narrow(indexes.range(age_column, search.min_age, search.max_age))
+
+    total = len(candidates)
+    page = snapshot.frame.iloc[candidates[:search.limit]]
+    return {
+        "total": total,
+        "limit": search.limit,
+        "match": match, # exact / prefix / fuzzy: quanto la ricerca ha dovuto allargarsi per trovare risultati
+        "records": snapshot.records(page),
+    }
+# --- Fine ricerca ---
+
+
+# --- Aggregazioni (group-by + metriche) ---
+_AGGREGATE_FUNCTIONS = {"count", "sum", "mean", "median", "min", "max", "std"}
+_NUMERIC_ONLY_FUNCTIONS = {"sum", "mean", "median", "std"}
+_PERCENTILE_PATTERN = re.compile(r"^p(\d{1,2}(?:\.\d+)?)$")
+
+
+def _group_keys(snapshot: DatasetSnapshot, positions: np.ndarray, group_by: List[str]) -> Dict[str, np.ndarray]:
+    keys: Dict[str, np.ndarray] = {}
+    for spec in group_by:
+        field, _, width = spec.partition(":")
+        column = _resolve_column(snapshot.frame, field.strip())
+        values = snapshot.value_column(column).iloc[positions]
+        if not width:
+            keys[column] = values.to_numpy()
+            continue
+        # "Age:10" raggruppa per fasce di ampiezza 10, etichettate "50-59"
+        if not pd.api.types.is_numeric_dtype(values):
+            raise QueryError(f"Le fasce '{spec}' richiedono un campo numerico")
+        band = _parse_number(spec, width)
+        if band <= 0:
+            raise QueryError(f"L'ampiezza della fascia in '{spec}' deve essere positiva")
+        lower = (np.floor(values.to_numpy(dtype=float) / band) * band)
+        labels = pd.Series(lower).map(lambda start: None if pd.isna(start) else f"{start:g}-{start + band - 1:g}")
+        keys[f"{column}_band"] = labels.to_numpy()
+    return keys
+
+def _metric_series(snapshot: DatasetSnapshot, positions: np.ndarray, metric: str, grouper: Optional[List[np.ndarray]]) -> Tuple[str, Any]:
+    function, _, field = metric.partition(":")
+    function = function.strip().lower()
+    if function == "count" and not field:
+        name = "count"
+        values = pd.Series(np.ones(len(positions), dtype=np.int64))
+        return name, (values.groupby(grouper, dropna=False).size() if grouper else len(positions))
+
+    if not field:
+        raise QueryError(f"La metrica '{metric}' richiede un campo (es. '{function}:Salary')")
+    column = _resolve_column(snapshot.frame, field.strip())
+    values = pd.Series(snapshot.value_column(column).iloc[positions].to_numpy())
+    name = f"{function}_{column}"
+
+    percentile = _PERCENTILE_PATTERN.match(function)
+    if function not in _AGGREGATE_FUNCTIONS and not percentile:
+        raise QueryError(f"Metrica sconosciuta '{function}'. Disponibili: {', '.join(sorted(_AGGREGATE_FUNCTIONS))}, pNN (es. p90)")
+    if (percentile or function in _NUMERIC_ONLY_FUNCTIONS) and not pd.api.types.is_numeric_dtype(values):
+        raise QueryError(f"La metrica '{metric}' richiede un campo numerico")
+
+    target = values.groupby(grouper, dropna=False) if grouper else values
+    if percentile:
+        return name, target.quantile(float(percentile.group(1)) / 100)
+    return name, getattr(target, function)()
+
+def _json_scalar(value: Any) -> Any:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+def apply_dataset_aggregation(snapshot: DatasetSnapshot, query: DatasetQuery) -> Dict[str, Any]:
+    """Raggruppa e aggrega in modo vettoriale le righe filtrate; restituisce una riga per gruppo."""
+    metrics = query.metrics or ["count"]
+    positions = np.flatnonzero(_filter_mask(snapshot, query.filters)) if query.filters else np.arange(len(snapshot.frame))
+    keys = _group_keys(snapshot, positions, query.group_by)
+    grouper = list(keys.values()) or None
+
+    results = dict(_metric_series(snapshot, positions, metric, grouper) for metric in metrics)
+    if grouper:
+        table = pd.DataFrame(results)
+        table.index.names = list(keys.keys())
+        table = table.reset_index()
+    else:
+        table = pd.DataFrame([results])
+
+    if query.sort:
+        sort_columns = [_resolve_column(table, field) for field, _ in query.sort]
+        table = table.sort_values(by=sort_columns, ascending=[ascending for _, ascending in query.sort],
+                                  kind="stable", na_position="last")
+    total_groups = len(table)
+    end = total_groups if query.limit is None else min(total_groups, query.offset + query.limit)
+    table = table.iloc[query.offset:end]
+
+    groups = [{column: _json_scalar(value) for column, value in row.items()} for row in table.to_dict(orient="records")]
+    return {
+        "group_by": list(keys.keys()),
+        "metrics": list(results.keys()),
+        "matched_rows": len(positions),
+        "total_groups": total_groups,
+        "next_offset": end if end < total_groups else None,
+        "groups": groups,
+    }
+# --- Fine aggregazioni ---
+
+
+# --- Esportazione in streaming (NDJSON) ---
+# Il dataset viene letto a blocchi di righe (record batch dell'archivio colonnare o blocchi del CSV):
+# la memoria resta limitata a un blocco e il primo record parte appena il primo blocco è stato filtrato.
+DATASET_STREAM_CHUNK_ROWS = int(os.getenv("DATASET_STREAM_CHUNK_ROWS", "10000"))
+
+def _iter_ndjson(chunks: Iterator[pd.DataFrame], query: DatasetQuery, source: str,
+                 formats: Optional[Dict[str, str]] = None) -> Iterator[bytes]:
+    skip = query.offset
+    remaining = query.limit
+    if remaining == 0:
+        return
+    try:
+        for chunk in chunks:
+            # Uno snapshot per blocco riusa filtri e colonne numeriche (Salary) del percorso non in streaming
+            chunk_snapshot = DatasetSnapshot(None, chunk, b"", (0, 0), 0, formats)
+            positions = np.flatnonzero(_filter_mask(chunk_snapshot, query.filters)) if query.filters else np.arange(len(chunk))
+            if skip:
+                skipped = min(skip, len(positions))
+                positions = positions[skipped:]
+                skip -= skipped
+            if remaining is not None:
+                positions = positions[:remaining]
+                remaining -= len(positions)
+            if len(positions):
+                page = chunk.iloc[positions]
+                if query.fields:
+                    page = page[[_resolve_column(chunk, field) for field in query.fields]]
+                yield b"".join(_json_bytes(record) + b"\n" for record in chunk_snapshot.records(page))
+            if remaining == 0:
+                return # Limite raggiunto: il resto del file non viene letto
+    except Exception as e:
+        # Lo status 200 è già stato inviato: l'errore arriva come ultima riga dello stream
+        yield _json_bytes({"error": f"Errore durante lo streaming di {source}: {str(e)}"}) + b"\n"
+
+def _iter_csv_chunks(path: str) -> Iterator[pd.DataFrame]:
+    with pd.read_csv(path, chunksize=DATASET_STREAM_CHUNK_ROWS) as reader:
+        yield from reader
+
+def stream_dataset_response(cache: "DatasetCache", query: DatasetQuery) -> StreamingResponse:
+    if query.sort:
+        raise QueryError("sort non è supportato in streaming: usa /dati-csv senza format=ndjson")
+    if query.has_aggregation():
+        raise QueryError("group_by e metrics non sono supportati in streaming")
+    chunks, formats = None, None
+    if cache.columnar is not None:
+        snapshot = cache.get() # Ricostruisce l'archivio se la sorgente è cambiata
+        chunks, formats = cache.columnar.iter_frames(snapshot.signature), snapshot.formats
+        header = snapshot.frame.iloc[:0]
+    if chunks is None:
+        header = pd.read_csv(cache.path, nrows=0)
+        chunks = _iter_csv_chunks(cache.path)
+    # I nomi dei campi si validano sull'intestazione, prima di iniziare la risposta
+    for field, _, _ in query.filters:
+        _resolve_column(header, field)
+    for field in query.fields or []:
+        _resolve_column(header, field)
+    # Iteratore sincrono: Starlette lo consuma in un thread, senza bloccare l'event loop
+    return StreamingResponse(_iter_ndjson(chunks, query, cache.path, formats), media_type="application/x-ndjson")
+# --- Fine streaming ---
+
+
+def _dataset_response(request: Request, cache: DatasetCache) -> Response:
+    query = parse_dataset_query(request.url.query)
+    if query.format == "ndjson":
+        if cache is not employees_cache:
+            raise QueryError("format=ndjson è disponibile solo per /dati-csv")
+        return stream_dataset_response(cache, query)
+    if query.has_aggregation():
+        raise QueryError(f"group_by e metrics sono supportati solo da {request.url.path}/aggregate")
+    snapshot = cache.get()
+    if query.is_empty():
+        return conditional_json_response(request, snapshot.etag, lambda: snapshot.body, snapshot)
+    # L'ETag di una risposta filtrata dipende da versione del file e query: il 304 evita anche il calcolo
+    etag = _make_etag(f"{snapshot.etag}?{request.url.query}")
+    return conditional_json_response(request, etag, lambda: _json_bytes(apply_dataset_query(snapshot, query)))
+
+def _aggregate_response(request: Request, cache: DatasetCache) -> Response:
+    query = parse_dataset_query(request.url.query)
+    snapshot = cache.get()
+    etag = _make_etag(f"{snapshot.etag}/aggregate?{request.url.query}")
+    return conditional_json_response(request, etag, lambda: _json_bytes(apply_dataset_aggregation(snapshot, query)))
+
+
+def _search_response(request: Request, cache: DatasetCache, name_column: str, role_column: str, age_column: str) -> Response:
+    search = parse_people_search(dict(request.query_params))
+    snapshot = cache.get()
+    etag = _make_etag(f"{snapshot.etag}/search?{request.url.query}")
+    return conditional_json_response(
+        request, etag, lambda: _json_bytes(apply_people_search(snapshot, search, name_column, role_column, age_column)))
+
+
+# --- Sorgente SQL ---
+# In alternativa ai file, un dataset può essere servito da una tabella SQL: filtri, ordinamenti,
+# paginazione e aggregazioni della stessa sintassi di query vengono tradotti in SQL parametrico ed
+# eseguiti dal database, e l'esportazione NDJSON legge le righe dal cursore a blocchi.
+#   DATASET_SQL_URL=sqlite:///data/mauden.db   DATASET_SQL_TABLES=dati-csv=employees,stagisti=stagisti
+# Con DATASET_SQL_SEED=1 le tabelle mancanti vengono create all'avvio a partire dai file (test locali).
+DATASET_SQL_URL = os.getenv("DATASET_SQL_URL", "")
+DATASET_SQL_TABLES = os.getenv("DATASET_SQL_TABLES", "dati-csv=employees,stagisti=stagisti")
+DATASET_SQL_POOL_SIZE = int(os.getenv("DATASET_SQL_POOL_SIZE", "5"))
+DATASET_SQL_SEED = os.getenv("DATASET_SQL_SEED", "0").lower() in ("1", "true", "yes")
+
+_SQL_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_SQL_FUNCTIONS = {"count": "COUNT", "sum": "SUM", "mean": "AVG", "min": "MIN", "max": "MAX"}
+_SQL_FORMATS_TABLE = "_mcp_formats" # Simbolo di valuta delle colonne numeriche che nelle risposte tornano "$58,473"
+
+
+def _sql_quote(identifier: str) -> str:
+    """Gli identificatori non possono essere parametri: si accettano solo nomi già validati e si quotano."""
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def _like_escape(value: str) -> str:
+    """Testo cercato con LIKE (ESCAPE '\\'): % e _ dell'utente valgono come caratteri normali."""
+    return value.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class SqlDriver(ABC):
+    """Differenze tra database: connessione, segnaposto dei parametri, tipi delle colonne, versione dei dati."""
+
+    placeholder = "?"
+    row_order = "" # Espressione dell'ordine di inserimento: rende stabili ordinamenti con pari merito e paginazione
+
+    def __init__(self, url: str):
+        self.url = url
+
+    @abstractmethod
+    def connect(self) -> Any:
+        ...
+
+    @abstractmethod
+    def column_types(self, connection: Any, table: str) -> Dict[str, bool]:
+        """colonna -> True se numerica."""
+
+    @abstractmethod
+    def data_version(self) -> str:
+        ...
+
+
+class SqliteDriver(SqlDriver):
+    row_order = "rowid"
+
+    def __init__(self, url: str):
+        super().__init__(url)
+        self.path = url[len("sqlite:///"):]
+
+    def connect(self) -> Any:
+        # Le connessioni passano tra i thread del pool: ciascuna è usata da una sola richiesta alla volta
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL") # Letture concorrenti mentre un processo esterno aggiorna i dati
+        return connection
+
+    def column_types(self, connection: Any, table: str) -> Dict[str, bool]:
+        rows = connection.execute(f"PRAGMA table_info({_sql_quote(table)})").fetchall()
+        return {row[1]: any(kind in (row[2] or "").upper() for kind in ("INT", "REAL", "FLOA", "DOUB", "NUM", "DEC")) for row in rows}
+
+    def data_version(self) -> str:
+        # Ogni commit modifica il file del database o il suo WAL
+        parts = []
+        for path in (self.path, self.path + "-wal"):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+        return "/".join(parts)
+
+
+SQL_DRIVERS: Dict[str, Callable[[str], SqlDriver]] = {"sqlite": SqliteDriver} # Schema dell'URL -> driver
+
+
+class SqlConnectionPool:
+    """Pool asincrono di connessioni DB-API: l'attesa di una connessione libera non blocca il loop,
+    e le chiamate al driver (bloccanti) girano nel pool di thread tramite run_blocking."""
+
+    def __init__(self, driver: SqlDriver, size: int = DATASET_SQL_POOL_SIZE):
+        self.driver = driver
+        self.size = size
+        self._idle: List[Any] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None # Creato nel loop (e nel processo) che lo usa
+        self.opened = 0
+        self.discarded = 0
+        self.in_use = 0
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[Any]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+        async with self._semaphore:
+            connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                connection = await run_blocking(self.driver.connect)
+                self.opened += 1
+            self.in_use += 1
+            try:
+                yield connection
+            except QueryError:
+                self._idle.append(connection) # Errore di validazione: la connessione è ancora pulita
+                raise
+            except BaseException:
+                # Stato della connessione incerto (errore o stream interrotto): non torna nel pool
+                self.discarded += 1
+                await asyncio.shield(run_blocking(connection.close))
+                raise
+            else:
+                self._idle.append(connection)
+            finally:
+                self.in_use -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": self.size, "idle": len(self._idle), "in_use": self.in_use, "opened": self.opened, "discarded": self.discarded}
+
+
+def _sql_execute(connection: Any, sql: str, params: List[Any]) -> Any:
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    return cursor
+
+
+class SqlDataSource:
+    """Un dataset servito da una tabella SQL, con le stesse risposte della sorgente a file."""
+
+    def __init__(self, name: str, table: str, pool: SqlConnectionPool, records_key: Optional[str] = None,
+                 search_columns: Optional[Tuple[str, str, str]] = None):
+        if not _SQL_IDENTIFIER.match(table):
+            raise ValueError(f"Nome di tabella SQL non valido: '{table}'")
+        self.name = name
+        self.table = table
+        self.pool = pool
+        self.records_key = records_key
+        self.search_columns = search_columns # (nome, ruolo, età) per /search
+        self.numeric: Dict[str, bool] = {}
+        self.formats: Dict[str, str] = {}
+        self.queries = 0
+
+    async def _describe(self, connection: Any):
+        if self.numeric:
+            return
+        self.numeric = await run_blocking(self.pool.driver.column_types, connection, self.table)
+        if not self.numeric:
+            raise QueryError(f"Tabella SQL '{self.table}' non trovata")
+        try:
+            cursor = await run_blocking(_sql_execute, connection,
+                                        f"SELECT column_name, symbol FROM {_SQL_FORMATS_TABLE} WHERE table_name = {self.pool.driver.placeholder}",
+                                        [self.table])
+            self.formats = dict(await run_blocking(cursor.fetchall))
+        except Exception:
+            self.formats = {} # Tabella dei formati assente: gli importi restano numerici
+
+    # Traduzione della query in SQL: i valori viaggiano sempre come parametri, gli identificatori
+    # solo dopo il confronto con le colonne reali della tabella.
+    def _where(self, filters: List[Tuple[str, str, str]]) -> Tuple[str, List[Any]]:
+        mark = self.pool.driver.placeholder
+        clauses: List[str] = []
+        params: List[Any] = []
+        equality_values: Dict[str, List[str]] = {}
+        for field, op, value in filters:
+            column = _resolve_name(list(self.numeric), field)
+            if op == "=":
+                equality_values.setdefault(column, []).append(value)
+                continue
+            quoted = _sql_quote(column)
+            if op in ("word", "prefix"):
+                # Solo per /search: token del nome intero o come inizio di parola, come l'indice testuale
+                clauses.append(f"(' ' || LOWER({quoted}) || ' ') LIKE {mark} ESCAPE '\\'")
+                params.append(f"% {_like_escape(value)} %" if op == "word" else f"% {_like_escape(value)}%")
+            elif op == "~":
+                clauses.append(f"LOWER({quoted}) LIKE {mark} ESCAPE '\\'")
+                params.append(f"%{_like_escape(value)}%")
+            elif self.numeric[column]:
+                clauses.append(f"{quoted} {'<>' if op == '!=' else op} {mark}")
+                params.append(_parse_number(field, value))
+            else:
+                clauses.append(f"LOWER({quoted}) {'<>' if op == '!=' else op} {mark}")
+                params.append(value.lower())
+        for column, values in equality_values.items():
+            marks = ", ".join([mark] * len(values))
+            if self.numeric[column]:
+                clauses.append(f"{_sql_quote(column)} IN ({marks})")
+                params.extend(_parse_number(column, value) for value in values)
+            else:
+                clauses.append(f"LOWER({_sql_quote(column)}) IN ({marks})")
+                params.extend(value.lower() for value in values)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _page(self, limit: Optional[int], offset: int) -> Tuple[str, List[Any]]:
+        if limit is None and not offset:
+            return "", []
+        # -1 = nessun limite (SQLite); serve perché OFFSET richiede LIMIT
+        return f" LIMIT {self.pool.driver.placeholder} OFFSET {self.pool.driver.placeholder}", [-1 if limit is None else limit, offset]
+
+    def _record(self, columns: List[str], row: Tuple[Any, ...]) -> Dict[str, Any]:
+        record = dict(zip(columns, row))
+        for column, symbol in self.formats.items():
+            if column in record:
+                record[column] = _render_currency(record[column], symbol)
+        return record
+
+    async def _fetch(self, connection: Any, sql: str, params: List[Any]) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+        self.queries += 1
+        cursor = await run_blocking(_sql_execute, connection, sql, params)
+        rows = await run_blocking(cursor.fetchall)
+        return [description[0] for description in cursor.description], rows
+
+    async def query(self, query: DatasetQuery) -> Any:
+        async with self.pool.connection() as connection:
+            await self._describe(connection)
+            columns = [_resolve_name(list(self.numeric), field) for field in query.fields] if query.fields else list(self.numeric)
+            where, params = self._where(query.filters)
+            select = f"SELECT {', '.join(map(_sql_quote, columns))} FROM {_sql_quote(self.table)}{where}"
+            # (col IS NULL) prima della colonna: i valori mancanti vanno in fondo come nella sorgente a file
+            order = [f"({_sql_quote(column)} IS NULL), {_sql_quote(column)} {'ASC' if ascending else 'DESC'}"
+                     for column, ascending in ((_resolve_name(list(self.numeric), field), ascending) for field, ascending in query.sort)]
+            if self.pool.driver.row_order:
+                order.append(self.pool.driver.row_order)
+            if order:
+                select += " ORDER BY " + ", ".join(order)
+            page_sql, page_params = self._page(query.limit, query.offset)
+            names, rows = await self._fetch(connection, select + page_sql, params + page_params)
+            records = [self._record(names, row) for row in rows]
+            if query.is_empty():
+                return records if self.records_key is None else {self.records_key: records}
+            _, count = await self._fetch(connection, f"SELECT COUNT(*) FROM {_sql_quote(self.table)}{where}", params)
+        total = count[0][0]
+        end = total if query.limit is None else min(total, query.offset + query.limit)
+        return {"total": total, "offset": query.offset, "limit": query.limit,
+                "next_offset": end if end < total else None, "records": records}
+
+    async def aggregate(self, query: DatasetQuery) -> Dict[str, Any]:
+        mark = self.pool.driver.placeholder
+        async with self.pool.connection() as connection:
+            await self._describe(connection)
+            where, params = self._where(query.filters)
+            keys: List[str] = []
+            select: List[str] = []
+            select_params: List[Any] = []
+            bands: Dict[str, float] = {}
+            for spec in query.group_by:
+                field, _, width = spec.partition(":")
+                column = _resolve_name(list(self.numeric), field.strip())
+                if not width:
+                    keys.append(column)
+                    select.append(f"{_sql_quote(column)} AS {_sql_quote(column)}")
+                    continue
+                if not self.numeric[column]:
+                    raise QueryError(f"Le fasce '{spec}' richiedono un campo numerico")
+                band = _parse_number(spec, width)
+                if band <= 0:
+                    raise QueryError(f"L'ampiezza della fascia in '{spec}' deve essere positiva")
+                key = f"{column}_band"
+                keys.append(key)
+                bands[key] = band
+                # Inizio della fascia; CAST tronca verso zero, corretto per valori non negativi come l'età
+                select.append(f"CAST({_sql_quote(column)} / {mark} AS INTEGER) * {mark} AS {_sql_quote(key)}")
+                select_params.extend([band, band])
+            metric_names: List[str] = []
+            for metric in query.metrics or ["count"]:
+                function, _, field = metric.partition(":")
+                function = function.strip().lower()
+                if function == "count" and not field:
+                    metric_names.append("count")
+                    select.append(f"COUNT(*) AS {_sql_quote('count')}")
+                    continue
+                if function not in _SQL_FUNCTIONS:
+                    raise QueryError(f"Metrica '{function}' non disponibile con la sorgente SQL. Disponibili: {', '.join(_SQL_FUNCTIONS)}")
+                if not field:
+                    raise QueryError(f"La metrica '{metric}' richiede un campo (es. '{function}:Salary')")
+                column = _resolve_name(list(self.numeric), field.strip())
+                if function in ("sum", "mean") and not self.numeric[column]:
+                    raise QueryError(f"La metrica '{metric}' richiede un campo numerico")
+                name = f"{function}_{column}"
+                metric_names.append(name)
+                select.append(f"{_SQL_FUNCTIONS[function]}({_sql_quote(column)}) AS {_sql_quote(name)}")
+
+            grouped = f"SELECT {', '.join(select)} FROM {_sql_quote(self.table)}{where}"
+            if keys:
+                grouped += " GROUP BY " + ", ".join(_sql_quote(key) for key in keys)
+            sql = grouped
+            if query.sort:
+                result_columns = keys + metric_names
+                sql += " ORDER BY " + ", ".join(
+                    f"({_sql_quote(column)} IS NULL), {_sql_quote(column)} {'ASC' if ascending else 'DESC'}"
+                    for column, ascending in ((_resolve_name(result_columns, field), ascending) for field, ascending in query.sort))
+            page_sql, page_params = self._page(query.limit, query.offset)
+            names, rows = await self._fetch(connection, sql + page_sql, select_params + params + page_params)
+            _, total_groups = await self._fetch(connection, f"SELECT COUNT(*) FROM ({grouped}) AS grouped", select_params + params)
+            _, matched = await self._fetch(connection, f"SELECT COUNT(*) FROM {_sql_quote(self.table)}{where}", params)
+
+        groups = []
+        for row in rows:
+            group = {}
+            for name, value in zip(names, row):
+                if name in bands and value is not None:
+                    value = f"{value:g}-{value + bands[name] - 1:g}"
+                group[name] = _json_scalar(value)
+            groups.append(group)
+        total = total_groups[0][0]
+        end = total if query.limit is None else min(total, query.offset + query.limit)
+        return {"group_by": keys, "metrics": metric_names, "matched_rows": matched[0][0], "total_groups": total,
+                "next_offset": end if end < total else None, "groups": groups}
+
+    async def stream(self, query: DatasetQuery) -> AsyncIterator[bytes]:
+        """Righe lette dal cursore a blocchi di DATASET_STREAM_CHUNK_ROWS: la tabella non passa mai tutta in memoria."""
+        try:
+            async with self.pool.connection() as connection:
+                columns = [_resolve_name(list(self.numeric), field) for field in query.fields] if query.fields else list(self.numeric)
+                where, params = self._where(query.filters)
+                page_sql, page_params = self._page(query.limit, query.offset)
+                order = f" ORDER BY {self.pool.driver.row_order}" if self.pool.driver.row_order else ""
+                self.queries += 1
+                cursor = await run_blocking(_sql_execute, connection,
+                                            f"SELECT {', '.join(map(_sql_quote, columns))} FROM {_sql_quote(self.table)}{where}{order}{page_sql}",
+                                            params + page_params)
+                names = [description[0] for description in cursor.description]
+                while True:
+                    rows = await run_blocking(cursor.fetchmany, DATASET_STREAM_CHUNK_ROWS)
+                    if not rows:
+                        break
+                    yield b"".join(_json_bytes(self._record(names, row)) + b"\n" for row in rows)
+        except Exception as e:
+            yield _json_bytes({"error": f"Errore durante lo streaming di {self.table}: {str(e)}"}) + b"\n"
+
+    async def search(self, search: PeopleSearch) -> Dict[str, Any]:
+        """Stessi criteri della ricerca indicizzata, tradotti in filtri SQL (sfruttano gli indici della tabella)."""
+        name_column, role_column, age_column = self.search_columns
+        query = DatasetQuery()
+        if search.role:
+            query.filters.append((role_column, "=", search.role))
+        if search.min_age is not None:
+            query.filters.append((age_column, ">=", str(search.min_age)))
+        if search.max_age is not None:
+            query.filters.append((age_column, "<=", str(search.max_age)))
+        query.limit = search.limit
+        match = {"role": "exact"} if search.role else {}
+        if not search.name:
+            result = await self.query(query)
+        else:
+            # Prima parole intere, poi (se non trova nulla) inizi di parola; niente ricerca approssimata in SQL
+            base = list(query.filters)
+            for mode in ("word", "prefix"):
+                query.filters = base + [(name_column, mode, token) for token in _tokens(search.name)]
+                result = await self.query(query)
+                match["name"] = "exact" if mode == "word" else "prefix"
+                if result["total"]:
+                    break
+        return {"total": result["total"], "limit": search.limit, "match": match, "records": result["records"]}
+
+    def data_version(self) -> str:
+        return self.pool.driver.data_version()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"storage": "sql", "table": self.table, "queries": self.queries, "pool": self.pool.stats()}
+
+    async def respond(self, request: Request, kind: str) -> Response:
+        """Risposta HTTP per un endpoint del dataset (kind: query, aggregate, stream, search), con ETag sulla versione dei dati."""
+        if kind == "search":
+            search = parse_people_search(dict(request.query_params))
+        else:
+            query = parse_dataset_query(request.url.query)
+            if kind == "query" and query.format == "ndjson":
+                kind = "stream"
+            if kind == "stream" and query.sort:
+                raise QueryError("sort non è supportato in streaming: usa l'endpoint senza format=ndjson")
+            if kind in ("query", "stream") and query.has_aggregation():
+                raise QueryError(f"group_by e metrics sono supportati solo da /{self.name}/aggregate")
+        if kind == "stream":
+            # Nomi dei campi validati prima di iniziare la risposta, come per la sorgente a file
+            async with self.pool.connection() as connection:
+                await self._describe(connection)
+            self._where(query.filters)
+            for field in query.fields or []:
+                _resolve_name(list(self.numeric), field)
+            return StreamingResponse(self.stream(query), media_type="application/x-ndjson")
+
+        etag = _make_etag(f"sql:{self.table}:{await run_blocking(self.data_version)}/{kind}?{request.url.query}")
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _matching_etag(if_none_match, etag, None) is not None:
+            # Stessa risposta (e stesso ETag) di conditional_json_response, senza interrogare il database
+            return conditional_json_response(request, etag, lambda: b"")
+        if kind == "search":
+            payload = await self.search(search)
+        elif kind == "aggregate":
+            payload = await self.aggregate(query)
+        else:
+            payload = await self.query(query)
+        body = _json_bytes(payload)
+        return await run_blocking(conditional_json_response, request, etag, lambda: body)
+
+
+def seed_sql_from_files(driver: SqlDriver, tables: Dict[str, str]):
+    """Crea le tabelle mancanti dai file dati (tipi della conversione colonnare, indici come quelli in memoria)."""
+    connection = driver.connect()
+    try:
+        connection.execute(f"CREATE TABLE IF NOT EXISTS {_SQL_FORMATS_TABLE} (table_name TEXT, column_name TEXT, symbol TEXT)")
+        for cache in (stagisti_cache, employees_cache):
+            table = tables.get(cache.name)
+            if table is None or driver.column_types(connection, table) or not os.path.exists(cache.path):
+                continue
+            _, frame, _ = cache._loader(cache.path)
+            typed, formats = _typed_frame(frame)
+            typed.to_sql(table, connection, index=False)
+            connection.executemany(f"INSERT INTO {_SQL_FORMATS_TABLE} VALUES ({', '.join([driver.placeholder] * 3)})",
+                                   [(table, column, symbol) for column, symbol in formats.items()])
+            for column in {column for columns in cache.index_columns.values() for column in columns}:
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {_sql_quote(f'idx_{table}_{column}')} ON {_sql_quote(table)} ({_sql_quote(column)})")
+            connection.commit()
+            print(f"Sorgente SQL: tabella '{table}' creata da {cache.path} ({len(typed)} righe).")
+    finally:
+        connection.close()
+
+
+def create_sql_sources(url: str = DATASET_SQL_URL, table_spec: str = DATASET_SQL_TABLES) -> Dict[str, SqlDataSource]:
+    if not url:
+        return {}
+    scheme = url.split(":", 1)[0]
+    if scheme not in SQL_DRIVERS:
+        raise ValueError(f"DATASET_SQL_URL: database '{scheme}' non supportato. Disponibili: {', '.join(SQL_DRIVERS)}")
+    driver = SQL_DRIVERS[scheme](url)
+    tables = dict(item.strip().split("=", 1) for item in table_spec.split(",") if "=" in item)
+    if DATASET_SQL_SEED:
+        seed_sql_from_files(driver, tables)
+    pool = SqlConnectionPool(driver) # Un pool per database, condiviso dalle tabelle
+    sources = {}
+    for name, table in tables.items():
+        cache = {"stagisti": stagisti_cache, "dati-csv": employees_cache}.get(name)
+        if cache is None:
+            raise ValueError(f"DATASET_SQL_TABLES: dataset sconosciuto '{name}' (ammessi: stagisti, dati-csv)")
+        search_columns = ("nome", "ruolo", "eta") if name == "stagisti" else ("Name", "Role", "Age")
+        sources[name] = SqlDataSource(name, table, pool, records_key=cache.records_key, search_columns=search_columns)
+    print(f"Sorgente SQL attiva per: {', '.join(f'{name} -> {table}' for name, table in tables.items())}")
+    return sources
+
+
+sql_sources = create_sql_sources()
+# --- Fine sorgente SQL ---
+
+
 @app.get("/stagisti")
-async def get_stagisti():
+async def get_stagisti(request: Request):
     try:
         # Verifica se il file esiste prima di aprirlo
+        if "stagisti" in sql_sources:
+            return await sql_sources["stagisti"].respond(request, "query")
         if not os.path.exists(STAGISTI_JSON_PATH):
             return {"error": f"File stagisti non trovato in {STAGISTI_JSON_PATH}"}
-        with open(STAGISTI_JSON_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data
+        return await run_blocking(_dataset_response, request, stagisti_cache)
+    except QueryError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     except Exception as e:
         return {"error": f"Errore nel leggere o processare stagisti.json: {str(e)}"}
 
 @app.get("/dati-csv")
-async def get_dati_csv():
+async def get_dati_csv(request: Request):
     try:
+        if "dati-csv" in sql_sources:
+            return await sql_sources["dati-csv"].respond(request, "query")
         if not os.path.exists(MAUDEN_CSV_PATH):
             return {"error": f"File CSV dei dipendenti non trovato in {MAUDEN_CSV_PATH}"}
-        # Esempio con pandas, assicurati che pandas sia in requirements_dataset.txt
-        df = pd.read_csv(MAUDEN_CSV_PATH)
-        return df.to_dict(orient="records")
+        return await run_blocking(_dataset_response, request, employees_cache)
+    except QueryError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     except Exception as e:
         return {"error": f"Errore nel leggere o processare mauden_employees.csv: {str(e)}"}
 
+@app.get("/dati-csv/stream")
+async def stream_dati_csv(request: Request):
+    """Esporta le righe del CSV (filtrate) in NDJSON, un record JSON per riga."""
+    try:
+        if "dati-csv" in sql_sources:
+            return await sql_sources["dati-csv"].respond(request, "stream")
+        if not os.path.exists(MAUDEN_CSV_PATH):
+            return {"error": f"File CSV dei dipendenti non trovato in {MAUDEN_CSV_PATH}"}
+        # Solo la preparazione (archivio e intestazione): le righe le legge Starlette nel proprio threadpool
+        return await run_blocking(stream_dataset_response, employees_cache, parse_dataset_query(request.url.query))
+    except QueryError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        return {"error": f"Errore nello streaming di mauden_employees.csv: {str(e)}"}
+
+@app.get("/stagisti/aggregate")
+async def aggregate_stagisti(request: Request):
+    try:
+        if "stagisti" in sql_sources:
+            return await sql_sources["stagisti"].respond(request, "aggregate")
+        if not os.path.exists(STAGISTI_JSON_PATH):
+            return {"error": f"File stagisti non trovato in {STAGISTI_JSON_PATH}"}
+        return await run_blocking(_aggregate_response, request, stagisti_cache)
+    except QueryError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        return {"error": f"Errore nell'aggregare stagisti.json: {str(e)}"}
+
+@app.get("/dati-csv/aggregate")
+async def aggregate_dati_csv(request: Request):
+    try:
+        if "dati-csv" in sql_sources:
+            return await sql_sources["dati-csv"].respond(request, "aggregate")
+        if not os.path.exists(MAUDEN_CSV_PATH):
+            return {"error": f"File CSV dei dipendenti non trovato in {MAUDEN_CSV_PATH}"}
+        return await run_blocking(_aggregate_response, request, employees_cache)
+    except QueryError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        return {"error": f"Errore nell'aggregare mauden_employees.csv: {str(e)}"}
+
+@app.get("/stagisti/search")
+async def search_stagisti(request: Request):
+    """Ricerca indicizzata per nome, ruolo ed età: name=, role=, min_age=, max_age=, limit=."""
+    try:
+        if "stagisti" in sql_sources:
+            return await sql_sources["stagisti"].respond(request, "search")
+        if not os.path.exists(STAGISTI_JSON_PATH):
+            return {"error": f"File stagisti non trovato in {STAGISTI_JSON_PATH}"}
+        return await run_blocking(_search_response, request, stagisti_cache, "nome", "ruolo", "eta")
+    except QueryError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        return {"error": f"Errore nella ricerca su stagisti.json: {str(e)}"}
+
+@app.get("/dati-csv/search")
+async def search_dati_csv(request: Request):
+    """Ricerca indicizzata per nome, ruolo ed età: name=, role=, min_age=, max_age=, limit=."""
+    try:
+        if "dati-csv" in sql_sources:
+            return await sql_sources["dati-csv"].respond(request, "search")
+        if not os.path.exists(MAUDEN_CSV_PATH):
+            return {"error": f"File CSV dei dipendenti non trovato in {MAUDEN_CSV_PATH}"}
+        return await run_blocking(_search_response, request, employees_cache, "Name", "Role", "Age")
+    except QueryError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        return {"error": f"Errore nella ricerca su mauden_employees.csv: {str(e)}"}
+
+@app.get("/data-version")
+async def get_data_version(request: Request):
+    """Versione complessiva dei dati: cambia quando cambia uno qualsiasi dei file (stessa firma degli ETag)."""
+    def build() -> Response:
+        datasets = {}
+        for cache in (stagisti_cache, employees_cache):
+            if cache.name in sql_sources:
+                datasets[cache.name] = _make_etag(f"sql:{sql_sources[cache.name].data_version()}").strip('"')
+            else:
+                datasets[cache.name] = cache.get().etag.strip('"') if os.path.exists(cache.path) else None
+        version = _make_etag(json.dumps(datasets, sort_keys=True))
+        return conditional_json_response(request, version, lambda: _json_bytes({"version": version.strip('"'), "datasets": datasets}))
+
+    return await run_blocking(build)
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    """Contatori hit/miss/reload della cache in memoria dei dataset."""
+    stats: Dict[str, Any] = {cache.name: cache.stats() for cache in (stagisti_cache, employees_cache)}
+    stats.update({name: source.stats() for name, source in sql_sources.items()})
+    stats["executor"] = executor_stats()
+    return stats
+
+
+# --- Modalità multi-worker ---
+# Con DATASET_PRELOAD=1 i dataset vengono caricati all'import del modulo. Avviando con
+#   gunicorn dataset_server:app --preload -k uvicorn.workers.UvicornWorker --workers N
+# il caricamento avviene una volta nel master e i worker, creati con fork, condividono in
+# copy-on-write DataFrame, body JSON e varianti compresse. Se un file cambia, ogni worker
+# ricarica per conto suo la nuova versione; gli ETag restano uguali tra i worker.
+DATASET_PRELOAD = os.getenv("DATASET_PRELOAD", "0").lower() in ("1", "true", "yes")
+
+def preload_datasets():
+    for cache in (stagisti_cache, employees_cache):
+        if cache.name in sql_sources or not os.path.exists(cache.path):
+            continue
+        snapshot = cache.get()
+        for encoding in (["br"] if brotli is not None else []) + ["gzip"]:
+            if len(snapshot.body) >= DATASET_COMPRESS_MIN_BYTES:
+                snapshot.encoded_body(encoding)
+        print(f"Dataset '{cache.name}' precaricato ({len(snapshot.frame)} righe, {len(snapshot.body)} byte).")
+    # Gli oggetti già creati escono dal GC: le sue visite non sporcano le pagine condivise dopo il fork
+    gc.freeze()
+
+if DATASET_PRELOAD:
+    preload_datasets()
+
 # Blocco per avviare il server se eseguito direttamente (opzionale, utile per test)
 if __name__ == "__main__":
     import uvicorn
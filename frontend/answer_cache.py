@@ -0,0 +1,228 @@
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+# Cache delle risposte finali per le domande ripetute: disattivata di default (opt-in)
+MCP_ANSWER_CACHE = os.getenv("MCP_ANSWER_CACHE", "0").lower() in ("1", "true", "yes")
+MCP_ANSWER_CACHE_TTL = float(os.getenv("MCP_ANSWER_CACHE_TTL", "600")) # Secondi
+MCP_ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("MCP_ANSWER_CACHE_MAX_ENTRIES", "500"))
+# Similarità coseno minima tra due domande per riusare la risposta; 0 = solo corrispondenza esatta
+MCP_ANSWER_CACHE_SIMILARITY = float(os.getenv("MCP_ANSWER_CACHE_SIMILARITY", "0.93"))
+MCP_ANSWER_CACHE_EMBEDDING_MODEL = os.getenv("MCP_ANSWER_CACHE_EMBEDDING_MODEL", "text-embedding-3-small")
+# Ogni quanti secondi riverificare la versione dei dati di un server (chiave "data_version_url" della configurazione)
+MCP_ANSWER_CACHE_VERSION_TTL = float(os.getenv("MCP_ANSWER_CACHE_VERSION_TTL", "5"))
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Minuscole, senza accenti né punteggiatura, spazi compattati: "Quanti stagisti ci sono?" == "quanti stagisti ci sono"."""
+    text = unicodedata.normalize("NFKD", prompt)
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    return " ".join(re.sub(r"[^\w]+", " ", text).split())
+
+
+def _normalize_vector(vector: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class AnswerProbe:
+    """Esito di una ricerca mancata: contiene quanto serve per memorizzare la risposta a fine turno."""
+
+    def __init__(self, key: str, scope: str, normalized: str, versions: Dict[str, str], embedding: Optional[List[float]]):
+        self.key = key
+        self.scope = scope
+        self.normalized = normalized
+        self.versions = versions
+        self.embedding = embedding
+
+
+class AnswerCache:
+    """Risposte finali del modello, condivise tra le sessioni del processo.
+
+    La chiave unisce domanda normalizzata, modello, server e tool selezionati e versione dei dati
+    di ogni server (letta da "data_version_url"): se un server non dichiara la versione dei propri
+    dati la domanda non viene mai memorizzata. Oltre alla corrispondenza esatta, con la soglia di
+    similarità attiva si cercano domande equivalenti tramite embedding nello stesso scope.
+    Quando la versione dei dati cambia, le risposte calcolate sulla versione precedente vengono rimosse.
+    """
+
+    def __init__(self, ttl: float = MCP_ANSWER_CACHE_TTL, max_entries: int = MCP_ANSWER_CACHE_MAX_ENTRIES,
+                 similarity: float = MCP_ANSWER_CACHE_SIMILARITY, embedding_model: str = MCP_ANSWER_CACHE_EMBEDDING_MODEL,
+                 version_ttl: float = MCP_ANSWER_CACHE_VERSION_TTL):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.embedding_model = embedding_model
+        self.version_ttl = version_ttl
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict() # Usato dal solo loop asyncio
+        self._versions: Dict[str, Tuple[float, Optional[str]]] = {} # url -> (verificata alle, versione)
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.embedding_errors = 0
+
+    async def _data_version(self, url: str) -> Optional[str]:
+        now = time.monotonic()
+        checked = self._versions.get(url)
+        if checked is not None and now - checked[0] < self.version_ttl:
+            return checked[1]
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(timeout=2.0)
+        try:
+            response = await self._http_client.get(url)
+            response.raise_for_status()
+            version = response.json().get("version")
+        except Exception as e:
+            print(f"AnswerCache: versione dei dati non disponibile da {url}: {e}", file=sys.stderr)
+            version = None
+        previous = checked[1] if checked is not None else None
+        if version and previous and version != previous:
+            self._invalidate(url, version)
+        self._versions[url] = (now, version)
+        return version
+
+    async def aclose(self):
+        """Chiude il client HTTP usato per le versioni dei dati (alla chiusura del loop del frontend)."""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    def _invalidate(self, url: str, version: str):
+        stale = [key for key, entry in self._entries.items() if entry["versions"].get(url, version) != version]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        print(f"AnswerCache: dati di {url} cambiati, {len(stale)} risposte invalidate.")
+
+    async def _data_versions(self, server_configs: List[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+        versions: Dict[str, str] = {}
+        for server_config in server_configs:
+            url = server_config.get("data_version_url")
+            version = await self._data_version(url) if url else None
+            if not version:
+                return None # Dati senza versione verificabile: la risposta potrebbe essere già vecchia
+            versions[url] = version
+        return versions
+
+    async def _embed(self, openai_client: Any, prompt: str) -> Optional[List[float]]:
+        if self.similarity <= 0 or openai_client is None:
+            return None
+        try:
+            response = await openai_client.embeddings.create(model=self.embedding_model, input=prompt)
+            return _normalize_vector(response.data[0].embedding)
+        except Exception as e:
+            self.embedding_errors += 1
+            print(f"AnswerCache: embedding non disponibile ({type(e).__name__}: {e}), uso solo la corrispondenza esatta.", file=sys.stderr)
+            return None
+
+    def _live_entry(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None and entry["expires"] < now:
+            del self._entries[key]
+            return None
+        return entry
+
+    def _most_similar(self, scope: str, embedding: List[float], now: float) -> Tuple[Optional[str], float]:
+        best_key, best_score = None, 0.0
+        for key, entry in list(self._entries.items()):
+            if entry["scope"] != scope or entry["embedding"] is None or self._live_entry(key, now) is None:
+                continue
+            score = sum(a * b for a, b in zip(embedding, entry["embedding"]))
+            if score > best_score:
+                best_key, best_score = key, score
+        return best_key, best_score
+
+    async def lookup(self, prompt: str, model_name: str, server_configs: List[Dict[str, Any]], tool_names: List[str],
+                     openai_client: Any = None) -> Tuple[Optional[str], Optional[AnswerProbe]]:
+        """Restituisce (risposta, None) se in cache, (None, probe) se la risposta andrà memorizzata con store(),
+        (None, None) se la domanda non è memorizzabile."""
+        versions = await self._data_versions(server_configs) if server_configs else None
+        if versions is None:
+            self.uncacheable += 1
+            return None, None
+        scope = hashlib.sha1(json.dumps({
+            "model": model_name,
+            "servers": sorted(server_config.get("id", "") for server_config in server_configs),
+            "tools": sorted(tool_names),
+            "versions": versions,
+        }, sort_keys=True).encode("utf-8")).hexdigest()
+        normalized = normalize_prompt(prompt)
+        key = hashlib.sha1(f"{scope}\n{normalized}".encode("utf-8")).hexdigest()
+        now = time.monotonic()
+
+        entry = self._live_entry(key, now)
+        if entry is not None:
+            self.exact_hits += 1
+            entry["hits"] += 1
+            self._entries.move_to_end(key)
+            return entry["answer"], None
+
+        embedding = await self._embed(openai_client, prompt.strip())
+        if embedding is not None:
+            similar_key, score = self._most_similar(scope, embedding, now)
+            if similar_key is not None and score >= self.similarity:
+                entry = self._entries[similar_key]
+                self.similar_hits += 1
+                entry["hits"] += 1
+                self._entries.move_to_end(similar_key)
+                print(f"AnswerCache: '{normalized}' equivalente a '{entry['prompt']}' (similarità {score:.3f}).")
+                return entry["answer"], None
+
+        self.misses += 1
+        return None, AnswerProbe(key, scope, normalized, versions, embedding)
+
+    def store(self, probe: Optional[AnswerProbe], answer: str):
+        if probe is None or not answer:
+            return
+        self._entries[probe.key] = {
+            "answer": answer,
+            "prompt": probe.normalized,
+            "scope": probe.scope,
+            "versions": probe.versions,
+            "embedding": probe.embedding,
+            "expires": time.monotonic() + self.ttl,
+            "hits": 0,
+        }
+        self._entries.move_to_end(probe.key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._versions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        entries = list(self._entries.values())
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "entries": len(entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl,
+            "similarity_threshold": self.similarity,
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.exact_hits + self.similar_hits) / lookups, 3) if lookups else None,
+            "uncacheable": self.uncacheable,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "embedding_errors": self.embedding_errors,
+            "data_versions": {url: version for url, (_, version) in self._versions.items()},
+        }
+
+
+shared_answer_cache = AnswerCache()
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import sys
+import threading
+import traceback
+from typing import Any, Callable, Coroutine, Dict, Optional, Set
+
+# Coroutine in esecuzione contemporaneamente sul loop asyncio e in attesa di uno slot:
+# oltre la somma dei due il lavoro viene rifiutato subito invece di accumularsi senza limite
+ASYNC_MAX_ACTIVE = int(os.getenv("ASYNC_MAX_ACTIVE", "64"))
+ASYNC_MAX_QUEUED = int(os.getenv("ASYNC_MAX_QUEUED", "256"))
+# Timeout (secondi) per tipo di operazione
+ASYNC_INIT_TIMEOUT = float(os.getenv("ASYNC_INIT_TIMEOUT", "60"))
+ASYNC_MESSAGE_TIMEOUT = float(os.getenv("ASYNC_MESSAGE_TIMEOUT", "300"))
+ASYNC_RESET_TIMEOUT = float(os.getenv("ASYNC_RESET_TIMEOUT", "10"))
+ASYNC_CLEANUP_TIMEOUT = float(os.getenv("ASYNC_CLEANUP_TIMEOUT", "10"))
+
+
+class AsyncDispatcher:
+    """Ponte non bloccante tra gli handler Flask-SocketIO e il loop asyncio dedicato.
+
+    `submit()` accoda la coroutine sul loop e ritorna subito: nessun thread resta in attesa del
+    risultato, che viene consegnato alle callback on_done/on_error eseguite sul loop. Le coroutine
+    di una sessione Socket.IO si possono cancellare in blocco alla disconnessione.
+    """
+
+    def __init__(self, max_active: int = ASYNC_MAX_ACTIVE, max_queued: int = ASYNC_MAX_QUEUED):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock() # submit() arriva dai thread/greenlet degli handler
+        self._in_flight = 0
+        self._active = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None # Creato sul loop alla prima esecuzione
+        self._tasks: Dict[str, Set[asyncio.Task]] = {}
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def submit(self, coro: Coroutine[Any, Any, Any], session_id: Optional[str] = None, timeout: Optional[float] = None,
+               on_done: Optional[Callable[[Any], None]] = None, on_error: Optional[Callable[[BaseException], None]] = None,
+               name: str = "") -> bool:
+        """Accoda la coroutine. Restituisce False (senza eseguirla) se il loop non c'è o è saturo."""
+        if self.loop is None or not self.loop.is_running():
+            coro.close()
+            print(f"AsyncDispatcher: loop asyncio non disponibile, '{name}' non eseguita.", file=sys.stderr)
+            return False
+        with self._lock:
+            if self._in_flight >= self.max_active + self.max_queued:
+                self.rejected += 1
+                coro.close()
+                print(f"AsyncDispatcher: coda piena ({self._in_flight} operazioni), '{name}' rifiutata.", file=sys.stderr)
+                return False
+            self._in_flight += 1
+        self.loop.call_soon_threadsafe(self._start, coro, session_id, timeout, on_done, on_error, name)
+        return True
+
+    def _start(self, coro, session_id, timeout, on_done, on_error, name):
+        task = self.loop.create_task(self._run(coro, timeout, on_done, on_error, name))
+        # Contabilità fuori dalla coroutine: un task cancellato prima del primo passo non esegue
+        # mai il corpo di _run, ma la done callback viene chiamata comunque
+        task.add_done_callback(lambda done: self._finish(coro, name, done))
+        if session_id is not None:
+            self._tasks.setdefault(session_id, set()).add(task)
+            task.add_done_callback(lambda done: self._forget(session_id, done))
+
+    def _finish(self, coro, name: str, task: asyncio.Task):
+        coro.close() # Senza effetto se già eseguita; evita l'avviso "never awaited" se cancellata in coda
+        if task.cancelled():
+            # Cancellata dalla disconnessione dell'utente: non c'è più nessuno a cui rispondere
+            self.cancelled += 1
+            print(f"AsyncDispatcher: '{name}' cancellata.")
+        with self._lock:
+            self._in_flight -= 1
+
+    def _forget(self, session_id: str, task: asyncio.Task):
+        tasks = self._tasks.get(session_id)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                self._tasks.pop(session_id, None)
+
+    async def _run(self, coro, timeout, on_done, on_error, name):
+        """Esegue la coroutine e consegna il risultato; la CancelledError si propaga fino al task (vedi _finish)."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_active)
+        try:
+            async with self._semaphore:
+                self._active += 1
+                try:
+                    result = await asyncio.wait_for(coro, timeout) if timeout else await coro
+                finally:
+                    self._active -= 1
+        except asyncio.TimeoutError as e:
+            self.timeouts += 1
+            print(f"AsyncDispatcher: '{name}' interrotta dopo {timeout}s.", file=sys.stderr)
+            self._callback(on_error, e, name)
+        except Exception as e:
+            self.failed += 1
+            self._callback(on_error, e, name)
+        else:
+            self.completed += 1
+            self._callback(on_done, result, name)
+
+    @staticmethod
+    def _callback(callback, value, name):
+        if callback is None:
+            if isinstance(value, BaseException):
+                print(f"AsyncDispatcher: errore in '{name}': {type(value).__name__} {value}", file=sys.stderr)
+            return
+        try:
+            callback(value)
+        except Exception:
+            print(f"AsyncDispatcher: errore nella callback di '{name}'.", file=sys.stderr)
+            traceback.print_exc()
+
+    def cancel_session(self, session_id: str):
+        """Cancella tutte le operazioni in corso o in coda della sessione (chiamabile da qualsiasi thread)."""
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._cancel_session, session_id)
+
+    def _cancel_session(self, session_id: str):
+        for task in list(self._tasks.get(session_id, ())):
+            task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = self._in_flight
+        return {
+            "active": self._active,
+            "queued": max(0, in_flight - self._active),
+            "max_active": self.max_active,
+            "max_queued": self.max_queued,
+            "sessions": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,220 @@
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+try:
+    import tiktoken # Opzionale: conteggio token esatto; senza si stima ~4 caratteri per token
+except ImportError:
+    tiktoken = None
+
+# Budget di token della history inviata a OpenAI (esclusi i tool, che hanno un costo fisso per turno)
+MCP_HISTORY_TOKEN_BUDGET = int(os.getenv("MCP_HISTORY_TOKEN_BUDGET", "12000"))
+# Ultimi N turni utente lasciati intatti: i risultati dei tool recenti servono ancora al modello
+MCP_HISTORY_KEEP_TURNS = int(os.getenv("MCP_HISTORY_KEEP_TURNS", "2"))
+# Caratteri dell'anteprima che sostituisce un risultato di tool compattato
+MCP_HISTORY_PREVIEW_CHARS = int(os.getenv("MCP_HISTORY_PREVIEW_CHARS", "300"))
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4 # Ruolo e separatori che OpenAI aggiunge a ogni messaggio
+
+
+class TokenCounter:
+    def __init__(self, model_name: str = "gpt-4.1"):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("o200k_base")
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        tokens = MESSAGE_OVERHEAD_TOKENS + self.count_text(_message_text(message))
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call.get("function", {})
+            tokens += self.count_text(function.get("name", "")) + self.count_text(function.get("arguments", ""))
+        return tokens
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content")
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    return json.dumps(content, ensure_ascii=False)
+
+
+def _message_bytes(message: Dict[str, Any]) -> int:
+    return len(_message_text(message).encode("utf-8"))
+
+
+def summarize_tool_content(content: str, preview_chars: int = MCP_HISTORY_PREVIEW_CHARS) -> str:
+    """Riassunto compatto di un risultato di tool già letto dal modello: dimensione, struttura e anteprima."""
+    summary: Dict[str, Any] = {"compacted": True, "original_chars": len(content)}
+    payload: Any = content
+    text = content
+    try:
+        payload = json.loads(content)
+        if isinstance(payload, dict) and isinstance(payload.get("result"), str):
+            text = payload["result"]
+            payload = json.loads(text) # I tool MCP restituiscono testo, spesso JSON
+    except (json.JSONDecodeError, TypeError):
+        pass
+    if isinstance(payload, list):
+        summary["items"] = len(payload)
+        if payload and isinstance(payload[0], dict):
+            summary["fields"] = list(payload[0].keys())
+    elif isinstance(payload, dict):
+        summary["keys"] = list(payload.keys())[:20]
+        for key, value in payload.items():
+            if isinstance(value, list):
+                summary[f"{key}_items"] = len(value)
+        if "next_page" in payload:
+            summary["next_page"] = payload["next_page"] # Il risultato completo resta leggibile a pagine
+    summary["preview"] = text if len(text) <= preview_chars else text[:preview_chars] + "…"
+    return json.dumps(summary, ensure_ascii=False)
+
+
+class ChatHistory:
+    """History della chat per OpenAI con conteggio token per messaggio e compattazione entro un budget.
+
+    Prima di ogni chiamata `compact()` sostituisce i risultati dei tool dei turni vecchi con un
+    riassunto e, se non basta, elimina i turni più vecchi per intero: un turno va dal messaggio
+    utente al successivo, quindi ogni tool_call resta insieme al suo messaggio 'tool'.
+    """
+
+    def __init__(self, token_budget: int = MCP_HISTORY_TOKEN_BUDGET, keep_turns: int = MCP_HISTORY_KEEP_TURNS,
+                 counter: Optional[TokenCounter] = None):
+        self.token_budget = token_budget
+        self.keep_turns = max(1, keep_turns)
+        self.counter = counter or TokenCounter()
+        self.messages: List[Dict[str, Any]] = []
+        self._tokens: List[int] = []
+        self._sizes: List[int] = [] # Byte UTF-8 del contenuto di ciascun messaggio
+        self.turns = 0
+        self.compacted_messages = 0
+        self.dropped_messages = 0
+        self.tokens_saved = 0
+        self.bytes_saved = 0
+        self.last_turn: Dict[str, int] = {}
+
+    def append(self, message: Dict[str, Any]):
+        self.messages.append(message)
+        self._tokens.append(self.counter.count_message(message))
+        self._sizes.append(_message_bytes(message))
+
+    def load(self, messages: List[Dict[str, Any]]):
+        """Sostituisce la history con messaggi salvati altrove (es. nello store di sessione)."""
+        self.clear()
+        for message in messages:
+            self.append(message)
+
+    def start_turn(self, prompt: str):
+        """Aggiunge il messaggio dell'utente e azzera le metriche del turno."""
+        self.turns += 1
+        self.last_turn = {"tokens_saved": 0, "bytes_saved": 0, "compacted_messages": 0, "dropped_messages": 0}
+        self.append({"role": "user", "content": prompt})
+
+    def pop(self) -> Dict[str, Any]:
+        self._tokens.pop()
+        self._sizes.pop()
+        return self.messages.pop()
+
+    def clear(self):
+        self.messages = []
+        self._tokens = []
+        self._sizes = []
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self._tokens)
+
+    def _turn_starts(self) -> List[int]:
+        return [index for index, message in enumerate(self.messages) if message.get("role") == "user"]
+
+    def payload_bytes(self) -> int:
+        return sum(self._sizes)
+
+    def compact(self) -> List[Dict[str, Any]]:
+        """Riporta la history entro il budget e restituisce i messaggi da inviare a OpenAI."""
+        tokens_before = self.total_tokens
+        if tokens_before <= self.token_budget:
+            return self.messages
+        bytes_before = self.payload_bytes()
+        compacted = dropped = 0
+
+        # Prima i risultati fuori dagli ultimi keep_turns turni, poi anche quelli dei turni precedenti
+        # a quello in corso; in entrambi i casi dal più vecchio e solo finché si è sopra il budget
+        turn_starts = self._turn_starts()
+        limits = [turn_starts[-self.keep_turns] if len(turn_starts) >= self.keep_turns else 0,
+                  turn_starts[-1] if turn_starts else 0]
+        for limit in limits:
+            for index in range(limit):
+                if self.total_tokens <= self.token_budget:
+                    break
+                message = self.messages[index]
+                content = _message_text(message)
+                if message.get("role") != "tool" or content.startswith('{"compacted": true'):
+                    continue
+                summary = summarize_tool_content(content)
+                if len(summary) >= len(content):
+                    continue
+                self.messages[index] = dict(message, content=summary)
+                self._tokens[index] = self.counter.count_message(self.messages[index])
+                self._sizes[index] = _message_bytes(self.messages[index])
+                compacted += 1
+
+        # Se non basta, via i turni più vecchi (l'ultimo turno, quello in corso, resta sempre)
+        turn_starts = self._turn_starts()
+        while self.total_tokens > self.token_budget and len(turn_starts) > 1:
+            first, second = turn_starts[0], turn_starts[1]
+            del self.messages[first:second]
+            del self._tokens[first:second]
+            del self._sizes[first:second]
+            dropped += second - first
+            turn_starts = self._turn_starts()
+
+        tokens_after = self.total_tokens
+        bytes_after = self.payload_bytes()
+        self.compacted_messages += compacted
+        self.dropped_messages += dropped
+        self.tokens_saved += tokens_before - tokens_after
+        self.bytes_saved += bytes_before - bytes_after
+        for key, value in (("tokens_saved", tokens_before - tokens_after), ("bytes_saved", bytes_before - bytes_after),
+                           ("compacted_messages", compacted), ("dropped_messages", dropped)):
+            self.last_turn[key] = self.last_turn.get(key, 0) + value
+        if compacted or dropped:
+            print(f"ChatHistory: compattazione {tokens_before} -> {tokens_after} token "
+                  f"({compacted} risultati riassunti, {dropped} messaggi eliminati, {bytes_before - bytes_after} byte risparmiati).")
+        if tokens_after > self.token_budget:
+            print(f"ChatHistory: il turno corrente da solo supera il budget ({tokens_after} > {self.token_budget} token).", file=sys.stderr)
+        return self.messages
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "messages": len(self.messages),
+            "tokens": self.total_tokens,
+            "bytes": self.payload_bytes(),
+            "token_budget": self.token_budget,
+            "exact_tokens": self.counter.encoding is not None,
+            "turns": self.turns,
+            "compacted_messages": self.compacted_messages,
+            "dropped_messages": self.dropped_messages,
+            "tokens_saved": self.tokens_saved,
+            "bytes_saved": self.bytes_saved,
+            "last_turn": self.last_turn,
+        }
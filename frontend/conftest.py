@@ -0,0 +1,7 @@
+# conftest.py
+import os
+import sys
+
+# resilience.py e mcp_web.py stanno nella radice del repository (nel container resilience.py viene
+# copiato accanto al frontend): i test li importano da lì
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -24,7 +24,9 @@ else:
 
 # Importa la classe MCPClient dal modulo principale
 try:
-    from mcp_client import MCPClient # Dovrebbe funzionare direttamente ora
+    from mcp_client import MCPClient, MCP_CONNECT_TIMEOUT, tool_resilience # Dovrebbe funzionare direttamente ora
+    from mcp_pool import shared_connection_pool # Sessioni MCP upstream condivise tra tutti gli utenti
+    from tool_catalog import shared_tool_catalog, MCP_CATALOG_PREWARM # Configurazione e tool condivisi
 except ImportError as e:
     print(f"Errore: Impossibile importare MCPClient da mcp_client.py (nella stessa directory): {e}", file=sys.stderr)
     # La classe fittizia rimane come fallback
@@ -35,16 +37,37 @@ except ImportError as e:
         async def reset_conversation(self, *args, **kwargs): raise NotImplementedError("MCPClient non caricato.")
         async def close_connections(self, *args, **kwargs): pass
         async def cleanup(self, *args, **kwargs): pass
+    # Fallback per gli altri nomi importati sopra: gli endpoint di stato rispondono 503 invece di NameError
+    MCP_CONNECT_TIMEOUT = 10.0
+    MCP_CATALOG_PREWARM = False
+    tool_resilience = None
+    shared_connection_pool = None
+    shared_tool_catalog = None
+
+from async_bridge import (AsyncDispatcher, ASYNC_INIT_TIMEOUT, ASYNC_MESSAGE_TIMEOUT, ASYNC_RESET_TIMEOUT,
+                          ASYNC_CLEANUP_TIMEOUT)
+from session_manager import SessionManager
+from session_store import create_session_store
+from answer_cache import MCP_ANSWER_CACHE, shared_answer_cache
 
 # --- Gestione Event Loop Asyncio Dedicato ---
 asyncio_loop = None
 loop_thread = None
+# Gli handler Socket.IO consegnano le coroutine al loop tramite il dispatcher e ritornano subito
+dispatcher = AsyncDispatcher()
+# Stato per sessione Socket.IO; le sessioni inattive, bloccate o in eccesso vengono chiuse dallo sweeper
+mcp_client_status = SessionManager()
 
 def start_asyncio_loop():
     global asyncio_loop
     try:
         asyncio_loop = asyncio.new_event_loop()
         asyncio.set_event_loop(asyncio_loop)
+        dispatcher.bind(asyncio_loop)
+        asyncio_loop.create_task(mcp_client_status.run_sweeper())
+        if shared_tool_catalog is not None and MCP_CATALOG_PREWARM:
+            # Le prime sessioni trovano già sessioni e tool pronti nel pool, senza round-trip di discovery
+            asyncio_loop.create_task(shared_tool_catalog.prewarm(shared_connection_pool, MCP_CONNECT_TIMEOUT))
         print("Starting dedicated asyncio event loop...")
         asyncio_loop.run_forever()
     finally:
@@ -53,7 +76,17 @@ def start_asyncio_loop():
         print("Asyncio event loop stopped.")
 
 def stop_asyncio_loop():
+    if asyncio_loop and asyncio_loop.is_running() and shared_connection_pool is not None:
+        print("Chiusura delle sessioni MCP condivise...")
+        try:
+            asyncio.run_coroutine_threadsafe(shared_connection_pool.close_all(), asyncio_loop).result(timeout=10)
+        except Exception as e:
+            print(f"Errore durante la chiusura del pool MCP: {e}", file=sys.stderr)
     if asyncio_loop and asyncio_loop.is_running():
+        try:
+            asyncio.run_coroutine_threadsafe(shared_answer_cache.aclose(), asyncio_loop).result(timeout=5)
+        except Exception as e:
+            print(f"Errore durante la chiusura della cache delle risposte: {e}", file=sys.stderr)
         print("Stopping asyncio event loop...")
         asyncio_loop.call_soon_threadsafe(asyncio_loop.stop)
     if loop_thread:
@@ -71,11 +104,19 @@ atexit.register(stop_asyncio_loop)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'chatbot-secret-key')
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Con più worker/container gli emit passano da una coda condivisa (es. redis://redis:6379/0): ogni
+# worker può così raggiungere i socket collegati agli altri. Senza, un solo processo come prima.
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE') or None
+socketio = SocketIO(app, cors_allowed_origins="*", message_queue=SOCKETIO_MESSAGE_QUEUE)
+# History e server selezionati di ogni conversazione, condivisibili tra worker (SESSION_STORE_URL)
+session_store = create_session_store()
 
-mcp_client_status: Dict[str, Dict[str, Any]] = {}
+# Risposte in streaming (eventi message_delta / tool_progress / message_done) invece di un unico new_message
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', '1').lower() in ('1', 'true', 'yes')
 
 def load_mcp_server_configs() -> List[Dict[str, Any]]:
+    if shared_tool_catalog is not None:
+        return shared_tool_catalog.server_configs() # Riletta solo se mcp_servers.json è cambiato
     # mcp_servers.json è nella stessa directory di questo script (frontend/)
     # All'interno del container, questo script è in /app/frontend/
     script_dir = os.path.dirname(os.path.abspath(__file__)) # Sarà /app/frontend
@@ -108,13 +149,71 @@ def get_available_mcp_servers():
     # Per ora lo lasciamo, ma valuta la sicurezza.
     return jsonify(servers)
 
+@app.route('/api/mcp_pool_stats')
+def get_mcp_pool_stats():
+    """Stato delle sessioni MCP upstream condivise (utenti collegati, salute, tool)."""
+    if shared_connection_pool is None:
+        return jsonify({'error': 'Pool MCP non disponibile'}), 503
+    return jsonify(shared_connection_pool.stats())
+
+@app.route('/api/tool_catalog_stats')
+def get_tool_catalog_stats():
+    """Versione del catalogo condiviso e tool convertiti per ciascun server."""
+    if shared_tool_catalog is None:
+        return jsonify({'error': 'Catalogo tool non disponibile'}), 503
+    return jsonify(shared_tool_catalog.stats())
+
+@app.route('/api/session_stats')
+def get_session_stats():
+    """Sessioni vive per stato, memoria stimata (history, risultati paginati), sessioni MCP referenziate, evizioni."""
+    return jsonify(mcp_client_status.stats())
+
+@app.route('/api/session_store_stats')
+def get_session_store_stats():
+    return jsonify(session_store.stats())
+
+@app.route('/api/dispatcher_stats')
+def get_dispatcher_stats():
+    """Operazioni asincrone attive, in coda, rifiutate, scadute e cancellate."""
+    return jsonify(dispatcher.stats())
+
+@app.route('/api/resilience_stats')
+def get_resilience_stats():
+    """Stato dei circuit breaker e metriche di retry/hedging delle tool call, per server MCP."""
+    if tool_resilience is None:
+        return jsonify({'error': 'Resilienza tool non disponibile'}), 503
+    return jsonify(tool_resilience.stats())
+
+@app.route('/api/answer_cache_stats')
+def get_answer_cache_stats():
+    """Hit esatti e per similarità, invalidazioni per cambio dei dati e versioni dei dati osservate."""
+    if not MCP_ANSWER_CACHE:
+        return jsonify({"enabled": False})
+    return jsonify(dict(shared_answer_cache.stats(), enabled=True))
+
+@app.route('/api/history_stats')
+def get_history_stats():
+    """Token della history, risparmi della compattazione e dei limiti sui risultati dei tool per sessione."""
+    stats = {}
+    for session_id, status in list(mcp_client_status.items()):
+        history = getattr(status.get('client'), 'chat_history', None)
+        if history is not None and hasattr(history, 'stats'):
+            stats[session_id] = history.stats()
+            result_shaper = getattr(status.get('client'), 'result_shaper', None)
+            if result_shaper is not None:
+                stats[session_id]['tool_output'] = result_shaper.stats()
+    return jsonify(stats)
+
 # ...oppure, come evento Socket.IO al momento della connessione del client:
 @socketio.on('request_server_list') # Il client emetterà questo evento
-def handle_request_server_list():
+def handle_request_server_list(data=None):
     session_id = request.sid
     servers = load_mcp_server_configs()
     print(f"Invio lista server disponibili a {session_id}")
-    emit('available_servers', {'servers': servers}, room=session_id)
+    # Conversazione già avviata (anche su un altro worker): il browser può reinizializzarla da solo
+    conversation_id = (data or {}).get('conversation_id')
+    resume = session_store.get_status(conversation_id) if conversation_id else None
+    emit('available_servers', {'servers': servers, 'resume': resume}, room=session_id)
 
 @socketio.on('connect')
 def handle_connect():
@@ -123,37 +222,43 @@ def handle_connect():
     mcp_client_status[session_id] = {'client': None, 'status': 'disconnected'}
     emit('status', {'message': 'Connesso al server frontend. Pronto a inizializzare i client MCP.'})
 
-@socketio.on('disconnect')
-def handle_disconnect():
-    session_id = request.sid
-    print(f"Client disconnected: {session_id}")
-    client_data = mcp_client_status.pop(session_id, None)
-    if client_data and client_data.get('client') and client_data.get('status') == 'connected': # Controlla lo stato 'connected'
+def release_session_client(session_id: str, client_data: Optional[Dict[str, Any]]):
+    """Annulla il lavoro in corso della sessione e rilascia sul loop asyncio le sessioni MCP del suo client."""
+    # Inizializzazione o risposta ancora in corso: nessuno aspetta più il risultato
+    dispatcher.cancel_session(session_id)
+    if client_data and client_data.get('client'):
         print(f"Avvio cleanup per MCP client {session_id}...")
         client = client_data['client']
-
-        def run_async_cleanup():
-            if not asyncio_loop: return
-            # Usa close_connections o un metodo di cleanup generico se lo hai
-            coro = client.close_connections() # Assumendo che close_connections faccia il cleanup necessario
-            future = asyncio.run_coroutine_threadsafe(coro, asyncio_loop)
-            try:
-                future.result(timeout=10)
-                print(f"Cleanup completato per MCP client {session_id}.")
-            except TimeoutError:
-                 print(f"Timeout durante cleanup per SID {session_id}.")
-            except Exception as e:
-                print(f"--- Errore durante cleanup per SID {session_id} (via run_coroutine_threadsafe) ---")
-                traceback.print_exception(type(e), e, e.__traceback__)
-        
-        socketio.start_background_task(run_async_cleanup)
+        # Senza session_id: il cleanup non deve essere cancellato insieme alle altre operazioni della sessione
+        dispatcher.submit(
+            client.close_connections(),
+            timeout=ASYNC_CLEANUP_TIMEOUT,
+            on_done=lambda _: print(f"Cleanup completato per MCP client {session_id}."),
+            on_error=lambda e: print(f"Errore durante cleanup per SID {session_id}: {type(e).__name__} {e}", file=sys.stderr),
+            name=f"cleanup {session_id}",
+        )
     else:
          print(f"Nessun client MCP attivo o connesso trovato per SID {session_id} da pulire.")
 
+def evict_session(session_id: str, client_data: Dict[str, Any], reason: str):
+    release_session_client(session_id, client_data)
+    # Il socket può essere ancora aperto: il browser torna allo stato "da inizializzare"
+    socketio.emit('session_expired', {'reason': reason, 'message': 'Sessione chiusa per inattività: reinizializza il chatbot.'}, room=session_id)
+
+mcp_client_status.on_evict = evict_session
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    session_id = request.sid
+    print(f"Client disconnected: {session_id}")
+    release_session_client(session_id, mcp_client_status.pop(session_id, None))
+
 @socketio.on('initialize')
 def initialize_mcp(data): # data ora conterrà { 'selected_server_ids': ['id1', 'id2'] }
     session_id = request.sid
     selected_server_ids = data.get('selected_server_ids', [])
+    # Id stabile scelto dal browser: la history nello store sopravvive a riconnessioni e cambi di worker
+    conversation_id = data.get('conversation_id') or session_id
 
     if not selected_server_ids:
         emit('error', {'message': 'Nessun server MCP selezionato per l\'inizializzazione.'})
@@ -176,15 +281,25 @@ def initialize_mcp(data): # data ora conterrà { 'selected_server_ids': ['id1',
         emit('error', {'message': 'Gli ID dei server selezionati non corrispondono a nessuna configurazione valida.'})
         return
     
+    status_info = mcp_client_status.get(session_id)
+    if status_info is None:
+        # Voce rimossa dall'LRU dopo la connessione: si ricrea invece di fallire
+        status_info = {'client': None, 'status': 'disconnected'}
+        mcp_client_status[session_id] = status_info
+    elif status_info.get('client') is not None:
+        # Nuovo tentativo dopo un timeout o un errore: il client precedente tiene ancora le sessioni del pool
+        release_session_client(session_id, status_info)
+        status_info['client'] = None
+
     # Salva i server selezionati per questa sessione, se necessario per riferimento futuro
-    if session_id in mcp_client_status:
-        mcp_client_status[session_id]['selected_servers_config'] = server_configs_to_use
+    status_info['selected_servers_config'] = server_configs_to_use
 
     try:
         # Passa solo i server selezionati al client MCP
         client = MCPClient(session_id=session_id, server_configs=server_configs_to_use, api_key=OPENAI_API_KEY_GLOBAL)
-        mcp_client_status[session_id]['client'] = client
-        mcp_client_status[session_id]['status'] = 'initializing'
+        status_info['client'] = client
+        status_info['status'] = 'initializing'
+        status_info['conversation_id'] = conversation_id
     except Exception as e:
         # ... (gestione errore esistente) ...
         return
@@ -193,43 +308,64 @@ def initialize_mcp(data): # data ora conterrà { 'selected_server_ids': ['id1',
     emit('status', {'message': f'Inizializzazione client MCP per {session_id}... Tentativo di connessione a {num_servers_to_connect} server(s) selezionati.'})
     print(f"Inizializzazione client MCP per {session_id}... Tentativo di connessione a {num_servers_to_connect} server(s): {[sc['name'] for sc in server_configs_to_use]}")
 
-    # ... (il resto della logica run_async_connect_all rimane simile, usando 'client' e 'num_servers_to_connect') ...
-
-    def run_async_connect_all():
-        if not asyncio_loop:
-            print("Errore: Event loop asyncio non disponibile.", file=sys.stderr)
-            socketio.emit('error', {'message': 'Errore interno del server (event loop)'}, room=session_id)
-            mcp_client_status[session_id]['status'] = 'failed'
-            return
-        try:
-            coro = client.initialize_connections()
-            future = asyncio.run_coroutine_threadsafe(coro, asyncio_loop)
-            future.result() 
-
-            if client.sessions: 
-                connected_servers_count = len(client.sessions)
-                print(f"MCP client {session_id} connesso con successo a {connected_servers_count} di {num_servers_to_connect} server(s).")
-                mcp_client_status[session_id]['status'] = 'connected' 
-                mcp_client_status[session_id]['connected_servers'] = connected_servers_count
-                mcp_client_status[session_id]['total_tools'] = len(client.all_tools_for_llm)
-                socketio.emit('mcp_initialized', {
-                    'message': f'Chatbot inizializzato con {connected_servers_count} server(s) e {len(client.all_tools_for_llm)} tool disponibili (OpenAI).', # Messaggio aggiornato
-                    'tools_available': len(client.all_tools_for_llm) > 0
-                }, room=session_id)
-            else:
-                print(f"MCP client {session_id}: Nessuna sessione MCP attiva dopo il tentativo di connessione.", file=sys.stderr)
-                mcp_client_status[session_id]['status'] = 'failed_connection'
-                socketio.emit('error', {'message': 'Impossibile connettersi ai server MCP.'}, room=session_id)
-        except Exception as e:
-            print(f"--- Errore Connessione Multipla MCP per SID {session_id} ---", file=sys.stderr)
-            traceback.print_exc(file=sys.stderr)
+    def report_server_ready(server_name: str, server_tools: int, total_tools: int):
+        # Set di tool parziale: il client vede subito i server già pronti
+        socketio.emit('status', {'message': f"Connesso a '{server_name}' ({server_tools} tool). Tool disponibili finora: {total_tools}."}, room=session_id)
+
+    async def initialize_and_restore() -> int:
+        await client.initialize_connections(on_server_ready=report_server_ready)
+        if not client.sessions:
+            return 0
+        history = await asyncio.to_thread(session_store.load_history, conversation_id)
+        if history:
+            client.chat_history.load(history)
+        await asyncio.to_thread(session_store.set_status, conversation_id, {
+            'status': 'connected',
+            'selected_server_ids': [config['id'] for config in server_configs_to_use],
+        })
+        return len(history)
+
+    def on_connected(restored_messages: int):
+        status_info = mcp_client_status.get(session_id)
+        if status_info is None:
+            return # Utente disconnesso nel frattempo
+        if client.sessions: 
+            connected_servers_count = len(client.sessions)
+            print(f"MCP client {session_id} connesso con successo a {connected_servers_count} di {num_servers_to_connect} server(s).")
+            status_info['status'] = 'connected' 
+            status_info['connected_servers'] = connected_servers_count
+            status_info['total_tools'] = len(client.all_tools_for_llm)
+            socketio.emit('mcp_initialized', {
+                'message': f'Chatbot inizializzato con {connected_servers_count} server(s) e {len(client.all_tools_for_llm)} tool disponibili (OpenAI).', # Messaggio aggiornato
+                'tools_available': len(client.all_tools_for_llm) > 0,
+                'restored_messages': restored_messages
+            }, room=session_id)
+        else:
+            print(f"MCP client {session_id}: Nessuna sessione MCP attiva dopo il tentativo di connessione.", file=sys.stderr)
+            status_info['status'] = 'failed_connection'
+            socketio.emit('error', {'message': 'Impossibile connettersi ai server MCP.'}, room=session_id)
+
+    def on_connect_error(e: BaseException):
+        print(f"--- Errore Connessione Multipla MCP per SID {session_id}: {type(e).__name__} {e} ---", file=sys.stderr)
+        if isinstance(e, asyncio.TimeoutError):
+            error_message = f'Timeout ({ASYNC_INIT_TIMEOUT:.0f}s) durante la connessione ai server MCP.'
+        else:
             error_message = f'Errore durante la connessione ai server MCP: {type(e).__name__} - {str(e)}'
-            socketio.emit('error', {'message': error_message}, room=session_id)
-            mcp_client_status[session_id]['status'] = 'failed'
-            # Non resettare a None, mantieni lo stato 'failed'
-            # mcp_client_status[session_id] = None 
-
-    socketio.start_background_task(run_async_connect_all)
+        socketio.emit('error', {'message': error_message}, room=session_id)
+        if session_id in mcp_client_status:
+            mcp_client_status[session_id]['status'] = 'failed' # Non resettare a None, mantieni lo stato 'failed'
+
+    accepted = dispatcher.submit(
+        initialize_and_restore(),
+        session_id=session_id,
+        timeout=ASYNC_INIT_TIMEOUT,
+        on_done=on_connected,
+        on_error=on_connect_error,
+        name=f"initialize {session_id}",
+    )
+    if not accepted:
+        status_info['status'] = 'failed'
+        emit('error', {'message': 'Server occupato: riprova l\'inizializzazione tra qualche secondo.'})
 
 @socketio.on('send_message')
 def handle_send_message_event(data):
@@ -259,24 +395,45 @@ def handle_send_message_event(data):
     emit('status', {'message': 'Elaborazione query in corso con OpenAI...'}) # Messaggio aggiornato
     print(f"Messaggio ricevuto da {session_id}: '{user_message}'. Inoltro a MCPClient (OpenAI).")
 
-    def run_async_process():
-        try:
-            # Chiama il metodo adattato per OpenAI
-            response_text = asyncio.run_coroutine_threadsafe(
-                client.call_openai_with_tools(user_message), # Metodo aggiornato
-                asyncio_loop
-            ).result() 
+    def relay_event(event: str, payload: Dict[str, Any]):
+        # Chiamata dal loop asyncio: frammenti di testo e avanzamento dei tool arrivano al browser man mano
+        socketio.emit(event, payload, room=session_id)
+
+    conversation_id = client_info.get('conversation_id', session_id)
 
+    async def run_turn() -> str:
+        response_text = await client.call_openai_with_tools(user_message, on_event=relay_event if STREAM_RESPONSES else None) # Metodo aggiornato
+        # La history aggiornata va nello store: un altro worker può riprendere la conversazione
+        await asyncio.to_thread(session_store.save_history, conversation_id, list(client.chat_history.messages))
+        return response_text
+
+    def on_response(response_text: str):
+        if STREAM_RESPONSES:
+            # Il testo completo chiude il messaggio costruito dai delta (o lo sostituisce, in caso di errore)
+            socketio.emit('message_done', {'sender': 'bot', 'text': response_text}, room=session_id)
+        else:
             socketio.emit('new_message', {'sender': 'bot', 'text': response_text}, room=session_id)
-        except Exception as e:
-            print(f"--- Errore Elaborazione Query per SID {session_id} (OpenAI) ---", file=sys.stderr) # Log aggiornato
-            traceback.print_exc(file=sys.stderr)
-            error_message = f'Errore durante l\'elaborazione (OpenAI): {type(e).__name__} - {str(e)}' # Messaggio aggiornato
-            socketio.emit('error', {'message': error_message}, room=session_id)
-        finally:
-             socketio.emit('status', {'message': 'Pronto per la prossima query.'}, room=session_id)
+        socketio.emit('status', {'message': 'Pronto per la prossima query.'}, room=session_id)
 
-    socketio.start_background_task(run_async_process)
+    def on_response_error(e: BaseException):
+        print(f"--- Errore Elaborazione Query per SID {session_id} (OpenAI): {type(e).__name__} {e} ---", file=sys.stderr) # Log aggiornato
+        if isinstance(e, asyncio.TimeoutError):
+            error_message = f'Nessuna risposta entro {ASYNC_MESSAGE_TIMEOUT:.0f} secondi: riprova.'
+        else:
+            error_message = f'Errore durante l\'elaborazione (OpenAI): {type(e).__name__} - {str(e)}' # Messaggio aggiornato
+        socketio.emit('error', {'message': error_message}, room=session_id)
+        socketio.emit('status', {'message': 'Pronto per la prossima query.'}, room=session_id)
+
+    accepted = dispatcher.submit(
+        run_turn(),
+        session_id=session_id,
+        timeout=ASYNC_MESSAGE_TIMEOUT,
+        on_done=on_response,
+        on_error=on_response_error,
+        name=f"send_message {session_id}",
+    )
+    if not accepted:
+        emit('error', {'message': 'Server occupato: troppe richieste in corso, riprova tra qualche secondo.'})
 
 @socketio.on('reset_conversation')
 def reset_conversation():
@@ -296,30 +453,31 @@ def reset_conversation():
     emit('status', {'message': 'Reset della conversazione in corso...'})
     print(f"Reset conversazione per {session_id}")
 
-    def run_async_reset():
-        if not asyncio_loop:
-            print("Errore: Event loop asyncio non disponibile.")
-            socketio.emit('error', {'message': 'Errore interno del server (event loop)'}, room=session_id)
-            socketio.emit('status', {'message': 'Errore interno.'}, room=session_id)
-            return
-        try:
-            # Il metodo reset_conversation in MCPClient dovrebbe ora resettare self.chat_history
-            coro = client.reset_conversation() 
-            future = asyncio.run_coroutine_threadsafe(coro, asyncio_loop)
-            future.result() 
-            print(f"Conversazione resettata per {session_id}.")
-            socketio.emit('status', {'message': 'Conversazione resettata.'}, room=session_id)
-            socketio.emit('conversation_reset', room=session_id)
-        except Exception as e:
-            print(f"--- Errore Reset Conversazione per SID {session_id} ---")
-            traceback.print_exception(type(e), e, e.__traceback__)
-            error_message = f'Errore durante il reset: {type(e).__name__} - {str(e)}'
-            socketio.emit('error', {'message': error_message}, room=session_id)
-        finally:
-             socketio.emit('status', {'message': 'Pronto.'}, room=session_id)
+    def on_reset(_):
+        print(f"Conversazione resettata per {session_id}.")
+        socketio.emit('status', {'message': 'Conversazione resettata.'}, room=session_id)
+        socketio.emit('conversation_reset', room=session_id)
+        socketio.emit('status', {'message': 'Pronto.'}, room=session_id)
+
+    def on_reset_error(e: BaseException):
+        print(f"--- Errore Reset Conversazione per SID {session_id}: {type(e).__name__} {e} ---")
+        error_message = f'Errore durante il reset: {type(e).__name__} - {str(e)}'
+        socketio.emit('error', {'message': error_message}, room=session_id)
+        socketio.emit('status', {'message': 'Pronto.'}, room=session_id)
+
+    conversation_id = client_info.get('conversation_id', session_id)
+
+    async def reset_and_forget():
+        # Il metodo reset_conversation in MCPClient dovrebbe ora resettare self.chat_history
+        await client.reset_conversation()
+        await asyncio.to_thread(session_store.save_history, conversation_id, [])
 
-    socketio.start_background_task(run_async_reset)
+    accepted = dispatcher.submit(reset_and_forget(), session_id=session_id, timeout=ASYNC_RESET_TIMEOUT,
+                                 on_done=on_reset, on_error=on_reset_error, name=f"reset {session_id}")
+    if not accepted:
+        emit('error', {'message': 'Server occupato: riprova il reset tra qualche secondo.'})
 
 if __name__ == '__main__':
     print("Avvio del server Flask-SocketIO...")
-    socketio.run(app, host='0.0.0.0', port=5000, debug=False, use_reloader=False)
\ No newline at end of file
+    # Server di sviluppo (avvio locale e benchmark): in produzione gunicorn con eventlet, vedi Dockerfile
+    socketio.run(app, host='0.0.0.0', port=5000, debug=False, use_reloader=False, allow_unsafe_werkzeug=True)
\ No newline at end of file
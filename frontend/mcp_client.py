@@ -1,42 +1,93 @@
 import asyncio
+import os
 import sys
+import time
 import traceback
-from typing import List, Dict, Optional, Any, Coroutine, AsyncGenerator
-from contextlib import AsyncExitStack
+from typing import List, Dict, Optional, Any, Callable, Coroutine, AsyncGenerator, Tuple
 import json # Aggiunto per la gestione degli argomenti dei tool OpenAI
 
-from fastmcp.client.client import Client as FastMCPUpstreamClient
-from fastmcp.client.transports import SSETransport
+import anyio
+import httpx
 import mcp.types
 
+from mcp_pool import MCPConnectionPool, PooledConnection, shared_connection_pool
+from tool_catalog import ToolCatalog, mcp_schema_to_openapi, shared_tool_catalog
+from chat_history import ChatHistory
+from tool_output import FETCH_PAGE_TOOL_DEFINITION, FETCH_PAGE_TOOL_NAME, ToolOutputShaper, log_preview
+from answer_cache import MCP_ANSWER_CACHE, AnswerCache, shared_answer_cache
+
 # Import per OpenAI
 import openai # Rimosso google.generativeai e google.genai.types
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+
+try:
+    from resilience import CircuitOpenError, EndpointPolicy, ResilienceRegistry
+except ImportError: # Avvio dal repository: il modulo condiviso sta nella cartella superiore
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from resilience import CircuitOpenError, EndpointPolicy, ResilienceRegistry
+
+# Timeout di default (secondi) per connessione + list_tools di ciascun server; sovrascrivibile con
+# la chiave "connect_timeout" della configurazione del server in mcp_servers.json
+MCP_CONNECT_TIMEOUT = float(os.getenv("MCP_CONNECT_TIMEOUT", "10"))
+# Massimo di tool call eseguite in parallelo per sessione e timeout (secondi) di ciascuna chiamata
+MCP_TOOL_CONCURRENCY = int(os.getenv("MCP_TOOL_CONCURRENCY", "4"))
+MCP_TOOL_CALL_TIMEOUT = float(os.getenv("MCP_TOOL_CALL_TIMEOUT", "60"))
+# Tentativi aggiuntivi per i tool dichiarati idempotenti (chiave "idempotent_tools" del server, "*" = tutti)
+MCP_TOOL_RETRIES = int(os.getenv("MCP_TOOL_RETRIES", "1"))
+# Timeout (secondi) e retry delle chiamate a OpenAI, gestiti dal client openai con backoff esponenziale
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+# Breaker e metriche per server MCP, condivisi da tutte le sessioni come le connessioni del pool
+tool_resilience = ResilienceRegistry()
+
+def _is_transport_failure(exc: BaseException) -> bool:
+    """Solo timeout e trasporto contano come guasti del server; gli errori restituiti dal tool no."""
+    return isinstance(exc, (asyncio.TimeoutError, ConnectionError, OSError, httpx.TransportError,
+                            anyio.ClosedResourceError, anyio.BrokenResourceError))
+
+def tool_policy(connection: PooledConnection) -> EndpointPolicy:
+    """Politica delle tool call verso un server: chiavi opzionali "tool_timeout" e "hedge_after" della configurazione."""
+    server_config = connection.server_config
+    hedge_after = server_config.get("hedge_after")
+    return tool_resilience.policy(
+        connection.server_id,
+        deadline=float(server_config.get("tool_timeout", MCP_TOOL_CALL_TIMEOUT)),
+        retries=MCP_TOOL_RETRIES,
+        hedge_after=float(hedge_after) if hedge_after else None,
+        is_failure=_is_transport_failure,
+    )
 
-# Funzione helper (invariata)
-def mcp_schema_to_openapi(mcp_schema: Optional[Dict[str, Any]]) -> Dict[str, Any]:
-    if not mcp_schema or 'properties' not in mcp_schema or not mcp_schema.get('properties'):
-        return {"type": "object", "properties": {}}
-    return {
-        "type": mcp_schema.get("type", "object"),
-        "properties": mcp_schema.get("properties", {}),
-        "required": mcp_schema.get("required", [])
-    }
+def is_idempotent_tool(connection: PooledConnection, tool_name: str) -> bool:
+    idempotent_tools = connection.server_config.get("idempotent_tools", [])
+    return "*" in idempotent_tools or tool_name in idempotent_tools
 
 class MCPClient:
-    def __init__(self, session_id: str, server_configs: List[Dict[str, str]], api_key: Optional[str] = None):
+    def __init__(self, session_id: str, server_configs: List[Dict[str, str]], api_key: Optional[str] = None,
+                 connection_pool: Optional[MCPConnectionPool] = None, tool_catalog: Optional[ToolCatalog] = None,
+                 answer_cache: Optional[AnswerCache] = None):
         self.user_session_id = session_id
         self.server_configs = server_configs
-        self.sessions: Dict[str, FastMCPUpstreamClient] = {}
+        # Le sessioni MCP upstream sono condivise a livello di processo: qui teniamo solo i riferimenti
+        self.connection_pool = connection_pool or shared_connection_pool
+        # Anche le definizioni OpenAI dei tool sono condivise: la sessione ricostruisce la propria lista
+        # solo quando cambia la versione del catalogo (nuovi tool o notifica tools/list_changed)
+        self.tool_catalog = tool_catalog or shared_tool_catalog
+        self.sessions: Dict[str, PooledConnection] = {}
         self.all_tools_for_llm: List[Dict[str, Any]] = [] # Modificato per il formato OpenAI
         self.tool_to_server_map: Dict[str, str] = {}
-        self.exit_stack = AsyncExitStack()
+        self._tools_catalog_version: Optional[int] = None
+        self._tool_semaphore = asyncio.Semaphore(MCP_TOOL_CONCURRENCY)
+        self.result_shaper = ToolOutputShaper() # Limiti di dimensione dei risultati e pagine successive
+        # Risposte già calcolate per le domande ripetute (opt-in con MCP_ANSWER_CACHE), condivise tra le sessioni
+        self.answer_cache = answer_cache or (shared_answer_cache if MCP_ANSWER_CACHE else None)
         self.openai_api_key = api_key # Rinominato per chiarezza
         
         self.openai_client: Optional[openai.AsyncOpenAI] = None
-        self.chat_history: List[Dict[str, Any]] = [] # Per mantenere la history della chat per OpenAI
+        self.chat_history = ChatHistory() # History per OpenAI, compattata entro MCP_HISTORY_TOKEN_BUDGET token
 
         if self.openai_api_key:
-            self.openai_client = openai.AsyncOpenAI(api_key=self.openai_api_key)
+            self.openai_client = openai.AsyncOpenAI(api_key=self.openai_api_key, timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES)
             print(f"MCPClient {self.user_session_id}: Client OpenAI inizializzato.")
         else:
             print(f"MCPClient {self.user_session_id}: ATTENZIONE - Chiave API OpenAI NON configurata.", file=sys.stderr)
@@ -44,13 +95,18 @@ class MCPClient:
         # Non inizializziamo un modello specifico qui, lo faremo al momento della chiamata
         # o in initialize_connections se necessario per configurare i tool globalmente.
 
-    async def initialize_connections(self):
-        # await self.exit_stack.aclose() # Può causare problemi se chiamato prima di enter_async_context
-        self.exit_stack = AsyncExitStack() 
+    async def initialize_connections(self, on_server_ready: Optional[Callable[[str, int, int], None]] = None):
+        """Connette in parallelo tutti i server configurati e ne raccoglie i tool man mano che rispondono.
+
+        on_server_ready(nome_server, tool_del_server, tool_totali) viene chiamata appena un server è pronto,
+        così il chiamante può segnalare un set di tool parziale senza attendere i server più lenti.
+        """
+        if self.sessions:
+            await self.close_connections()
         self.sessions = {}
         self.all_tools_for_llm = []
         self.tool_to_server_map = {}
-        self.chat_history = [] # Resetta la history se si reinizializzano le connessioni
+        self.chat_history.clear() # Resetta la history se si reinizializzano le connessioni
 
         if not self.server_configs:
             print(f"MCPClient {self.user_session_id}: Nessuna configurazione server MCP fornita.", file=sys.stderr)
@@ -60,159 +116,283 @@ class MCPClient:
             print(f"MCPClient {self.user_session_id}: Client OpenAI non inizializzato (manca API key?). Impossibile procedere.", file=sys.stderr)
             return
 
-        for server_config in self.server_configs:
-            server_id = server_config['id']
-            server_url = server_config['url'] 
-            server_name = server_config.get("name", server_id)
-
-            print(f"MCPClient {self.user_session_id}: Tentativo connessione a '{server_name}' ({server_url})...")
-            try:
-                transport = SSETransport(url=server_url)
-                mcp_upstream_client = FastMCPUpstreamClient(transport=transport)
-                await self.exit_stack.enter_async_context(mcp_upstream_client)
-                self.sessions[server_id] = mcp_upstream_client
-                print(f"MCPClient {self.user_session_id}: Connesso a '{server_name}'. In attesa di ottenere i tool...")
-
-                tools_list_from_server: List[mcp.types.Tool] = await mcp_upstream_client.list_tools()
-                
+        pending = [asyncio.ensure_future(self._connect_server(server_config)) for server_config in self.server_configs]
+        try:
+            for finished in asyncio.as_completed(pending):
+                result = await finished
+                if result is None:
+                    continue
+                server_config, pooled_connection, tools_list_from_server = result
+                server_id = server_config['id']
+                server_name = server_config.get("name", server_id)
+                self.sessions[server_id] = pooled_connection
                 if tools_list_from_server:
                     print(f"MCPClient {self.user_session_id}: Ricevuti {len(tools_list_from_server)} tool da '{server_name}'.")
-                    self._aggregate_tools_for_openai(tools_list_from_server, server_id, server_name)
                 else:
                     print(f"MCPClient {self.user_session_id}: Nessun tool ricevuto da '{server_name}'.")
-            except Exception as e:
-                print(f"MCPClient {self.user_session_id}: Errore durante la connessione/configurazione per '{server_name}' ({server_url}): {e}", file=sys.stderr)
-                traceback.print_exc()
-        
+                self._refresh_tools_for_llm()
+                if on_server_ready:
+                    try:
+                        on_server_ready(server_name, len(tools_list_from_server or []), len(self.all_tools_for_llm))
+                    except Exception as callback_exc:
+                        print(f"MCPClient {self.user_session_id}: Errore nella callback on_server_ready: {callback_exc}", file=sys.stderr)
+        except asyncio.CancelledError:
+            # Inizializzazione annullata (utente disconnesso o timeout): niente riferimenti orfani nel pool
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None and task.result() is not None:
+                    pooled_connection = task.result()[1]
+                    if self.sessions.get(pooled_connection.server_id) is not pooled_connection:
+                        self.connection_pool.release(pooled_connection)
+            raise
+
         if not self.sessions:
             print(f"MCPClient {self.user_session_id}: Nessuna connessione ai server MCP riuscita.", file=sys.stderr)
         else:
             print(f"MCPClient {self.user_session_id}: Tool OpenAI aggregati finali: {len(self.all_tools_for_llm)} tool.")
             # Non c'è una "chat_session" da inizializzare come in Gemini; la history è gestita manualmente.
 
-    def _aggregate_tools_for_openai(self, tools_from_server: List[mcp.types.Tool], server_id: str, server_name: str):
-        for tool_obj in tools_from_server:
-            tool_name = tool_obj.name
-            if not tool_name:
-                print(f"AVVISO: Tool da '{server_name}' senza nome: {tool_obj}", file=sys.stderr)
+    async def _connect_server(self, server_config: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], PooledConnection, List[mcp.types.Tool]]]:
+        server_id = server_config['id']
+        server_url = server_config['url']
+        server_name = server_config.get("name", server_id)
+        timeout = float(server_config.get("connect_timeout", MCP_CONNECT_TIMEOUT))
+
+        print(f"MCPClient {self.user_session_id}: Tentativo connessione a '{server_name}' ({server_url}, timeout {timeout}s)...")
+        try:
+            pooled_connection = await self.connection_pool.acquire(server_config, timeout)
+        except Exception as e:
+            print(f"MCPClient {self.user_session_id}: Errore durante la connessione/configurazione per '{server_name}' ({server_url}): {e}", file=sys.stderr)
+            return None
+        print(f"MCPClient {self.user_session_id}: Connesso a '{server_name}' (sessione condivisa, {pooled_connection.ref_count} utenti).")
+        return server_config, pooled_connection, pooled_connection.tools
+
+    def _refresh_tools_for_llm(self):
+        """Ricostruisce la lista dei tool OpenAI dalle definizioni del catalogo, nell'ordine della configurazione."""
+        self._tools_catalog_version = self.tool_catalog.version
+        self.all_tools_for_llm = []
+        self.tool_to_server_map = {}
+        for server_config in self.server_configs:
+            pooled_connection = self.sessions.get(server_config['id'])
+            if pooled_connection is None:
                 continue
+            for openai_tool_definition in self.tool_catalog.openai_tools(pooled_connection):
+                self.all_tools_for_llm.append(openai_tool_definition)
+                self.tool_to_server_map[openai_tool_definition["function"]["name"]] = pooled_connection.server_id
+        if self.all_tools_for_llm:
+            self.all_tools_for_llm.append(FETCH_PAGE_TOOL_DEFINITION)
 
-            parameters_schema_dict: Optional[Dict[str, Any]] = None
-            if tool_obj.inputSchema:
-                parameters_schema_dict = tool_obj.inputSchema 
+    async def _execute_tool_call(self, tool_call: Any) -> Dict[str, Any]:
+        """Esegue una tool_call di OpenAI sul server MCP corrispondente e restituisce il messaggio 'tool' per la history."""
+        function_name = tool_call.function.name
+        function_args_str = tool_call.function.arguments
+        try:
+            function_args = json.loads(function_args_str)
+        except json.JSONDecodeError:
+            print(f"MCPClient {self.user_session_id}: Errore nel decodificare gli argomenti JSON per {function_name}: {function_args_str}", file=sys.stderr)
+            return {
+                "tool_call_id": tool_call.id,
+                "role": "tool",
+                "name": function_name,
+                "content": json.dumps({"error": "Invalid arguments JSON", "details": function_args_str})
+            }
+        
+        print(f"MCPClient {self.user_session_id}: Tool richiesto: {function_name} con argomenti: {function_args}")
 
-            openapi_params = mcp_schema_to_openapi(parameters_schema_dict)
+        if function_name == FETCH_PAGE_TOOL_NAME:
+            # Pagina successiva di un risultato troncato: la serve il client senza passare dal server MCP
+            page_content = self.result_shaper.fetch_page(function_args.get("handle", ""), function_args.get("offset", 0), function_args.get("limit"))
+            return {
+                "tool_call_id": tool_call.id,
+                "role": "tool",
+                "name": function_name,
+                "content": page_content
+            }
 
-            # Formato tool per OpenAI
-            openai_tool_definition = {
-                "type": "function",
-                "function": {
-                    "name": f"{server_id}__{tool_name}", # Nome univoco per OpenAI
-                    "description": tool_obj.description or f"Tool {tool_name} from server {server_name}",
-                    "parameters": openapi_params
-                }
+        original_server_id = self.tool_to_server_map.get(function_name)
+        if not original_server_id:
+            print(f"MCPClient {self.user_session_id}: Errore: Tool '{function_name}' non mappato.", file=sys.stderr)
+            return {
+                "tool_call_id": tool_call.id,
+                "role": "tool",
+                "name": function_name,
+                "content": json.dumps({"error": f"Tool '{function_name}' non mappato a un server MCP."})
             }
-            self.all_tools_for_llm.append(openai_tool_definition)
-            self.tool_to_server_map[openai_tool_definition["function"]["name"]] = server_id
-            print(f"MCPClient {self.user_session_id}: Aggregato tool OpenAI: {openai_tool_definition['function']['name']}")
 
-    async def call_openai_with_tools(self, prompt: str, model_name: str = "gpt-4.1-2025-04-14") -> str: # Rinominato e modificato
+        pooled_connection = self.sessions.get(original_server_id)
+        mcp_upstream_service_client = pooled_connection.client if pooled_connection and pooled_connection.healthy else None
+        if not mcp_upstream_service_client:
+            print(f"MCPClient {self.user_session_id}: Errore: Server MCP '{original_server_id}' non trovato.", file=sys.stderr)
+            return {
+                "tool_call_id": tool_call.id,
+                "role": "tool",
+                "name": function_name,
+                "content": json.dumps({"error": f"Server MCP '{original_server_id}' per il tool '{function_name}' non trovato."})
+            }
+        
+        actual_tool_name = function_name.split("__", 1)[1] if "__" in function_name else function_name
+        policy = tool_policy(pooled_connection)
+
+        async def call_tool():
+            async with self._tool_semaphore:
+                return await mcp_upstream_service_client.call_tool(name=actual_tool_name, arguments=function_args)
+
+        try:
+            # Deadline, breaker del server e (solo per i tool idempotenti) retry con jitter e hedging
+            tool_mcp_response_content: list[mcp.types.Content] = await policy.call(
+                call_tool, idempotent=is_idempotent_tool(pooled_connection, actual_tool_name))
+            
+            tool_output_for_openai = ""
+            if tool_mcp_response_content and isinstance(tool_mcp_response_content[0], mcp.types.TextContent):
+                tool_output_for_openai = tool_mcp_response_content[0].text
+            elif tool_mcp_response_content: # Se non è TextContent, prova a serializzarlo
+                tool_output_for_openai = str(tool_mcp_response_content[0]) 
+            else:
+                tool_output_for_openai = "Il tool non ha restituito contenuto."
+            
+            print(f"MCPClient {self.user_session_id}: Risultato tool '{actual_tool_name}': {log_preview(tool_output_for_openai)}")
+            # Limiti di righe/byte del risultato, eventualmente specifici del tool (chiave "result_limits" del server)
+            result_limits = pooled_connection.server_config.get("result_limits", {}).get(actual_tool_name)
+            return {
+                "tool_call_id": tool_call.id,
+                "role": "tool",
+                "name": function_name,
+                "content": self.result_shaper.shape(function_name, tool_output_for_openai, result_limits) # OpenAI si aspetta una stringa, spesso JSON.
+            }
+        except CircuitOpenError as circuit_exc:
+            print(f"MCPClient {self.user_session_id}: Tool MCP '{actual_tool_name}' non chiamato: {circuit_exc}", file=sys.stderr)
+            return {
+                "tool_call_id": tool_call.id,
+                "role": "tool",
+                "name": function_name,
+                "content": json.dumps({"error": str(circuit_exc)})
+            }
+        except asyncio.TimeoutError:
+            print(f"MCPClient {self.user_session_id}: Timeout ({policy.deadline}s) del tool MCP '{actual_tool_name}'.", file=sys.stderr)
+            return {
+                "tool_call_id": tool_call.id,
+                "role": "tool",
+                "name": function_name,
+                "content": json.dumps({"error": f"Il tool '{actual_tool_name}' non ha risposto entro {policy.deadline} secondi."})
+            }
+        except Exception as tool_exc:
+            print(f"MCPClient {self.user_session_id}: Errore durante la chiamata al tool MCP '{actual_tool_name}': {tool_exc}", file=sys.stderr)
+            traceback.print_exc()
+            return {
+                "tool_call_id": tool_call.id,
+                "role": "tool",
+                "name": function_name,
+                "content": json.dumps({"error": f"Eccezione durante l'esecuzione del tool: {str(tool_exc)}"})
+            }
+
+    async def _execute_tool_call_with_events(self, tool_call: Any, on_event: Callable[[str, Dict[str, Any]], None]) -> Dict[str, Any]:
+        on_event("tool_progress", {"id": tool_call.id, "name": tool_call.function.name, "status": "started"})
+        started = time.perf_counter()
+        tool_response = await self._execute_tool_call(tool_call)
+        on_event("tool_progress", {
+            "id": tool_call.id,
+            "name": tool_call.function.name,
+            "status": "error" if tool_response["content"].startswith('{"error"') else "done",
+            "elapsed_ms": round((time.perf_counter() - started) * 1000),
+        })
+        return tool_response
+
+    async def _stream_completion(self, model_name: str, on_event: Callable[[str, Dict[str, Any]], None]) -> ChatCompletionMessage:
+        """Chiamata a OpenAI con stream=True: inoltra il testo man mano e ricompone il messaggio completo."""
+        stream = await self.openai_client.chat.completions.create(
+            model=model_name,
+            messages=self.chat_history.compact(),
+            tools=self.all_tools_for_llm if self.all_tools_for_llm else None,
+            tool_choice="auto" if self.all_tools_for_llm else None,
+            stream=True
+        )
+        content_parts: List[str] = []
+        tool_calls: Dict[int, Dict[str, Any]] = {} # Le tool_calls arrivano a pezzi, indicizzate per posizione
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                on_event("message_delta", {"text": delta.content})
+            for tool_call_delta in delta.tool_calls or []:
+                partial = tool_calls.setdefault(tool_call_delta.index, {"id": "", "name": "", "arguments": ""})
+                if tool_call_delta.id:
+                    partial["id"] = tool_call_delta.id
+                if tool_call_delta.function:
+                    partial["name"] += tool_call_delta.function.name or ""
+                    partial["arguments"] += tool_call_delta.function.arguments or ""
+
+        return ChatCompletionMessage(
+            role="assistant",
+            content="".join(content_parts) or None,
+            tool_calls=[
+                ChatCompletionMessageToolCall(id=partial["id"], type="function",
+                                              function={"name": partial["name"], "arguments": partial["arguments"]})
+                for _, partial in sorted(tool_calls.items())
+            ] or None,
+        )
+
+    async def call_openai_with_tools(self, prompt: str, model_name: str = "gpt-4.1-2025-04-14",
+                                     on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> str: # Rinominato e modificato
+        """Esegue un turno completo (chiamate ai tool comprese) e restituisce il testo finale.
+
+        Con on_event la risposta arriva in streaming: on_event("message_delta", {"text"}) per ogni frammento
+        di testo e on_event("tool_progress", {"id", "name", "status"}) all'inizio e alla fine di ogni tool.
+        """
         if not self.openai_client:
             print(f"MCPClient {self.user_session_id}: Client OpenAI non inizializzato.", file=sys.stderr)
             return "Errore: Client OpenAI non inizializzato."
 
+        if self._tools_catalog_version != self.tool_catalog.version:
+            self._refresh_tools_for_llm() # Un server ha cambiato i suoi tool dall'ultimo turno
+
+        answer_probe = None
+        # Solo le domande che aprono la conversazione: le successive possono dipendere dal contesto ("e di questi...")
+        if self.answer_cache is not None and not self.chat_history:
+            cached_answer, answer_probe = await self.answer_cache.lookup(
+                prompt, model_name,
+                [pooled_connection.server_config for pooled_connection in self.sessions.values()],
+                [tool["function"]["name"] for tool in self.all_tools_for_llm],
+                self.openai_client,
+            )
+            if cached_answer is not None:
+                print(f"MCPClient {self.user_session_id}: Risposta dalla cache per '{prompt}'.")
+                self.chat_history.start_turn(prompt)
+                self.chat_history.append({"role": "assistant", "content": cached_answer})
+                if on_event:
+                    on_event("message_delta", {"text": cached_answer})
+                return cached_answer
+
         # Aggiungi il prompt dell'utente alla history
-        self.chat_history.append({"role": "user", "content": prompt})
+        self.chat_history.start_turn(prompt)
         
         print(f"MCPClient {self.user_session_id}: Invio prompt a OpenAI: '{prompt}' con {len(self.all_tools_for_llm)} tools.")
 
         try:
             while True: # Ciclo per gestire le chiamate ai tool
                 print(f"MCPClient {self.user_session_id}: Chiamata a OpenAI. History attuale: {len(self.chat_history)} messaggi.")
-                completion = await self.openai_client.chat.completions.create(
-                    model=model_name,
-                    messages=self.chat_history,
-                    tools=self.all_tools_for_llm if self.all_tools_for_llm else None, # Invia i tool solo se ce ne sono
-                    tool_choice="auto" if self.all_tools_for_llm else None
-                )
-                
-                response_message = completion.choices[0].message
+                if on_event:
+                    response_message = await self._stream_completion(model_name, on_event)
+                else:
+                    completion = await self.openai_client.chat.completions.create(
+                        model=model_name,
+                        messages=self.chat_history.compact(),
+                        tools=self.all_tools_for_llm if self.all_tools_for_llm else None, # Invia i tool solo se ce ne sono
+                        tool_choice="auto" if self.all_tools_for_llm else None
+                    )
+                    response_message = completion.choices[0].message
                 self.chat_history.append(response_message.model_dump(exclude_none=True)) # Aggiungi la risposta dell'assistente alla history
 
                 if response_message.tool_calls:
                     print(f"MCPClient {self.user_session_id}: OpenAI ha richiesto {len(response_message.tool_calls)} chiamate ai tool.")
-                    tool_responses_for_openai = []
-                    for tool_call in response_message.tool_calls:
-                        function_name = tool_call.function.name
-                        function_args_str = tool_call.function.arguments
-                        try:
-                            function_args = json.loads(function_args_str)
-                        except json.JSONDecodeError:
-                            print(f"MCPClient {self.user_session_id}: Errore nel decodificare gli argomenti JSON per {function_name}: {function_args_str}", file=sys.stderr)
-                            tool_responses_for_openai.append({
-                                "tool_call_id": tool_call.id,
-                                "role": "tool",
-                                "name": function_name,
-                                "content": json.dumps({"error": "Invalid arguments JSON", "details": function_args_str})
-                            })
-                            continue
-                        
-                        print(f"MCPClient {self.user_session_id}: Tool richiesto: {function_name} con argomenti: {function_args}")
-
-                        original_server_id = self.tool_to_server_map.get(function_name)
-                        if not original_server_id:
-                            print(f"MCPClient {self.user_session_id}: Errore: Tool '{function_name}' non mappato.", file=sys.stderr)
-                            tool_responses_for_openai.append({
-                                "tool_call_id": tool_call.id,
-                                "role": "tool",
-                                "name": function_name,
-                                "content": json.dumps({"error": f"Tool '{function_name}' non mappato a un server MCP."})
-                            })
-                            continue
-
-                        mcp_upstream_service_client = self.sessions.get(original_server_id)
-                        if not mcp_upstream_service_client:
-                            print(f"MCPClient {self.user_session_id}: Errore: Server MCP '{original_server_id}' non trovato.", file=sys.stderr)
-                            tool_responses_for_openai.append({
-                                "tool_call_id": tool_call.id,
-                                "role": "tool",
-                                "name": function_name,
-                                "content": json.dumps({"error": f"Server MCP '{original_server_id}' per il tool '{function_name}' non trovato."})
-                            })
-                            continue
-                        
-                        actual_tool_name = function_name.split("__", 1)[1] if "__" in function_name else function_name
-                        
-                        try:
-                            tool_mcp_response_content: list[mcp.types.Content] = await mcp_upstream_service_client.call_tool(
-                                name=actual_tool_name, 
-                                arguments=function_args
-                            )
-                            
-                            tool_output_for_openai = ""
-                            if tool_mcp_response_content and isinstance(tool_mcp_response_content[0], mcp.types.TextContent):
-                                tool_output_for_openai = tool_mcp_response_content[0].text
-                            elif tool_mcp_response_content: # Se non è TextContent, prova a serializzarlo
-                                tool_output_for_openai = str(tool_mcp_response_content[0]) 
-                            else:
-                                tool_output_for_openai = "Il tool non ha restituito contenuto."
-                            
-                            print(f"MCPClient {self.user_session_id}: Risultato tool '{actual_tool_name}': {tool_output_for_openai}")
-                            tool_responses_for_openai.append({
-                                "tool_call_id": tool_call.id,
-                                "role": "tool",
-                                "name": function_name,
-                                "content": json.dumps({"result": tool_output_for_openai}) # OpenAI si aspetta una stringa, spesso JSON.
-                            })
-                        except Exception as tool_exc:
-                            print(f"MCPClient {self.user_session_id}: Errore durante la chiamata al tool MCP '{actual_tool_name}': {tool_exc}", file=sys.stderr)
-                            traceback.print_exc()
-                            tool_responses_for_openai.append({
-                                "tool_call_id": tool_call.id,
-                                "role": "tool",
-                                "name": function_name,
-                                "content": json.dumps({"error": f"Eccezione durante l'esecuzione del tool: {str(tool_exc)}"})
-                            })
+                    # Le chiamate dello stesso turno partono in parallelo (max MCP_TOOL_CONCURRENCY per sessione);
+                    # gather restituisce i risultati nell'ordine delle tool_calls, come si aspetta OpenAI
+                    tool_responses_for_openai = await asyncio.gather(
+                        *(self._execute_tool_call_with_events(tool_call, on_event) if on_event else self._execute_tool_call(tool_call)
+                          for tool_call in response_message.tool_calls)
+                    )
                     
                     # Aggiungi tutte le risposte dei tool alla history
                     for tool_response in tool_responses_for_openai:
@@ -221,7 +401,10 @@ class MCPClient:
                 
                 elif response_message.content:
                     final_text = response_message.content
-                    print(f"MCPClient {self.user_session_id}: Risposta finale da OpenAI: {final_text}")
+                    print(f"MCPClient {self.user_session_id}: Risposta finale da OpenAI: {log_preview(final_text)}")
+                    print(f"MCPClient {self.user_session_id}: History {self.chat_history.total_tokens} token, risparmiati nel turno: {self.chat_history.last_turn}")
+                    if answer_probe is not None:
+                        self.answer_cache.store(answer_probe, final_text)
                     return final_text
                 else:
                     # Caso inatteso (es. no content e no tool_calls)
@@ -241,24 +424,21 @@ class MCPClient:
             return f"Si è verificato un errore generico: {e}"
 
     async def close_connections(self):
-        print(f"MCPClient {self.user_session_id}: Chiusura di tutte le connessioni MCP...")
+        print(f"MCPClient {self.user_session_id}: Rilascio delle sessioni MCP condivise...")
         try:
-            await self.exit_stack.aclose()
-        except RuntimeError as e:
-            if "Attempted to exit cancel scope in a different task" in str(e):
-                print(f"MCPClient {self.user_session_id}: Errore gestito durante aclose (anyio cancel scope): {e}", file=sys.stderr)
-            else:
-                raise
+            for pooled_connection in self.sessions.values():
+                self.connection_pool.release(pooled_connection)
         except Exception as e:
-            print(f"MCPClient {self.user_session_id}: Eccezione generica durante aclose: {e}", file=sys.stderr)
+            print(f"MCPClient {self.user_session_id}: Eccezione generica durante il rilascio: {e}", file=sys.stderr)
             traceback.print_exc()
         finally:
             self.sessions = {} # Assicurati che le sessioni siano pulite
-            print(f"MCPClient {self.user_session_id}: Connessioni MCP chiuse (o tentativo di chiusura completato).")
+            print(f"MCPClient {self.user_session_id}: Sessioni MCP rilasciate.")
 
     async def reset_conversation(self):
         """Resetta la history della chat per la sessione corrente con OpenAI."""
-        self.chat_history = []
+        self.chat_history.clear()
+        self.result_shaper.clear()
         print(f"MCPClient {self.user_session_id}: History della chat OpenAI resettata.")
         # Non c'è una "chat_session" da resettare come in Gemini,
         # la history è gestita manualmente.
@@ -0,0 +1,261 @@
+import asyncio
+import os
+import sys
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+
+from fastmcp.client.client import Client as FastMCPUpstreamClient
+from fastmcp.client.transports import SSETransport
+import mcp.types
+
+# Pool di processo delle sessioni MCP upstream, condiviso da tutti gli MCPClient (uno per utente).
+# Ogni server configurato ha al massimo una sessione SSE aperta, indipendentemente dal numero di utenti.
+MCP_POOL_HEALTH_INTERVAL = float(os.getenv("MCP_POOL_HEALTH_INTERVAL", "30")) # Secondi tra due ping
+MCP_POOL_PING_TIMEOUT = float(os.getenv("MCP_POOL_PING_TIMEOUT", "5"))
+MCP_POOL_IDLE_TTL = float(os.getenv("MCP_POOL_IDLE_TTL", "300")) # Chiude le sessioni senza utenti da più di N secondi
+MCP_POOL_RETRY_AFTER = float(os.getenv("MCP_POOL_RETRY_AFTER", "30")) # Dopo un errore non ritenta prima di N secondi
+
+
+class PooledConnection:
+    """Sessione MCP condivisa verso un server, con i suoi tool e il numero di utenti che la usano."""
+
+    def __init__(self, server_config: Dict[str, Any]):
+        self.server_config = server_config
+        self.server_id: str = server_config['id']
+        self.server_name: str = server_config.get("name", self.server_id)
+        self.url: str = server_config['url']
+        self.client: Optional[FastMCPUpstreamClient] = None
+        self.tools: List[mcp.types.Tool] = []
+        self.tools_version = 0 # Incrementata a ogni nuova lista di tool (apertura o tools/list_changed)
+        self.ref_count = 0
+        self.healthy = False
+        self.connected_at: Optional[float] = None
+        self.last_used = time.monotonic()
+        self.reconnects = 0
+        # La sessione vive in un task dedicato che entra ed esce dal contesto del client:
+        # anyio richiede che i cancel scope vengano chiusi dallo stesso task che li ha aperti.
+        self._task: Optional[asyncio.Task] = None
+        self._close_event: Optional[asyncio.Event] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.server_name,
+            "url": self.url,
+            "healthy": self.healthy,
+            "ref_count": self.ref_count,
+            "tools": len(self.tools),
+            "tools_version": self.tools_version,
+            "reconnects": self.reconnects,
+            "connected_for_s": round(time.monotonic() - self.connected_at, 1) if self.connected_at else None,
+            "idle_for_s": round(time.monotonic() - self.last_used, 1) if self.ref_count == 0 else 0,
+        }
+
+
+class MCPConnectionPool:
+    """Sessioni MCP upstream condivise tra le sessioni Socket.IO, con health check e reference counting.
+
+    Va usato sempre dallo stesso event loop (il loop asyncio dedicato del frontend).
+    """
+
+    def __init__(self, health_interval: float = MCP_POOL_HEALTH_INTERVAL, idle_ttl: float = MCP_POOL_IDLE_TTL,
+                 retry_after: float = MCP_POOL_RETRY_AFTER):
+        self.health_interval = health_interval
+        self.idle_ttl = idle_ttl
+        self.retry_after = retry_after
+        self._connections: Dict[str, PooledConnection] = {}
+        self._connecting: Dict[str, asyncio.Future] = {}
+        self._failed_until: Dict[str, float] = {}
+        self._health_task: Optional[asyncio.Task] = None
+        self._tools_listeners: List[Callable[[str], None]] = []
+
+    def add_tools_listener(self, listener: Callable[[str], None]):
+        """Registra una callback chiamata con il server_id ogni volta che la lista dei tool di un server cambia."""
+        self._tools_listeners.append(listener)
+
+    def _notify_tools_changed(self, connection: PooledConnection):
+        for listener in self._tools_listeners:
+            try:
+                listener(connection.server_id)
+            except Exception as e:
+                print(f"MCPConnectionPool: errore in un listener dei tool: {e}", file=sys.stderr)
+
+    async def acquire(self, server_config: Dict[str, Any], timeout: float) -> PooledConnection:
+        """Restituisce la sessione condivisa per il server, aprendola se necessario. Solleva eccezione se non disponibile."""
+        self._ensure_health_task()
+        server_id = server_config['id']
+        connection = self._connections.get(server_id)
+        if connection is not None and connection.healthy and connection.url == server_config['url']:
+            connection.ref_count += 1
+            connection.last_used = time.monotonic()
+            return connection
+
+        retry_in = self._failed_until.get(server_id, 0) - time.monotonic()
+        if retry_in > 0:
+            # Server appena fallito: evita che ogni nuovo utente riaspetti lo stesso timeout
+            raise ConnectionError(f"Server '{server_config.get('name', server_id)}' non raggiungibile, nuovo tentativo tra {retry_in:.0f}s")
+
+        future = self._connecting.get(server_id)
+        if future is None:
+            # Un solo tentativo di connessione per server anche se molti utenti si inizializzano insieme
+            future = asyncio.ensure_future(self._open(server_config, timeout))
+            future.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._connecting[server_id] = future
+            future.add_done_callback(lambda _: self._connecting.pop(server_id, None))
+        connection = await asyncio.shield(future)
+        connection.ref_count += 1
+        connection.last_used = time.monotonic()
+        return connection
+
+    def release(self, connection: PooledConnection):
+        connection.ref_count = max(0, connection.ref_count - 1)
+        connection.last_used = time.monotonic()
+
+    async def _open(self, server_config: Dict[str, Any], timeout: float) -> PooledConnection:
+        server_id = server_config['id']
+        connection = self._connections.get(server_id)
+        if connection is None or connection.url != server_config['url']:
+            if connection is not None:
+                await self._close(connection)
+            connection = PooledConnection(server_config)
+        elif connection.client is not None:
+            await self._close(connection) # Sessione non più sana: la sostituiamo nello stesso oggetto
+            connection.reconnects += 1
+
+        print(f"MCPConnectionPool: apertura sessione verso '{connection.server_name}' ({connection.url}, timeout {timeout}s)...")
+        ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        connection._close_event = asyncio.Event()
+        connection._task = asyncio.ensure_future(self._hold(connection, ready))
+        try:
+            client, tools = await asyncio.wait_for(asyncio.shield(ready), timeout)
+        except BaseException as e:
+            connection._task.cancel()
+            connection._task = None
+            self._failed_until[server_id] = time.monotonic() + self.retry_after
+            if isinstance(e, asyncio.TimeoutError):
+                raise ConnectionError(f"Timeout ({timeout}s) nella connessione a '{connection.server_name}' ({connection.url})") from e
+            raise
+
+        connection.client = client
+        connection.tools = tools
+        connection.tools_version += 1
+        connection.healthy = True
+        connection.connected_at = time.monotonic()
+        self._failed_until.pop(server_id, None)
+        self._connections[server_id] = connection
+        print(f"MCPConnectionPool: sessione verso '{connection.server_name}' pronta con {len(tools)} tool.")
+        self._notify_tools_changed(connection)
+        return connection
+
+    async def _refresh_tools(self, connection: PooledConnection):
+        client = connection.client
+        if client is None or not connection.healthy:
+            return
+        try:
+            tools = await asyncio.wait_for(client.list_tools(), MCP_POOL_PING_TIMEOUT)
+        except Exception as e:
+            print(f"MCPConnectionPool: aggiornamento tool di '{connection.server_name}' fallito: {e}", file=sys.stderr)
+            return
+        if client is not connection.client:
+            return # Sessione sostituita nel frattempo: i tool arrivano già dalla nuova apertura
+        connection.tools = tools
+        connection.tools_version += 1
+        print(f"MCPConnectionPool: '{connection.server_name}' ha cambiato i tool, ora {len(tools)}.")
+        self._notify_tools_changed(connection)
+
+    def _message_handler(self, connection: PooledConnection):
+        async def handle(message: Any):
+            # Chiamato dal loop di ricezione della sessione: qui si può solo schedulare,
+            # una list_tools in linea aspetterebbe una risposta che questo stesso loop deve leggere.
+            if isinstance(message, mcp.types.ServerNotification) and isinstance(message.root, mcp.types.ToolListChangedNotification):
+                task = asyncio.ensure_future(self._refresh_tools(connection))
+                task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return handle
+
+    async def _hold(self, connection: PooledConnection, ready: asyncio.Future):
+        try:
+            mcp_upstream_client = FastMCPUpstreamClient(transport=SSETransport(url=connection.url),
+                                                        message_handler=self._message_handler(connection))
+            async with mcp_upstream_client:
+                tools: List[mcp.types.Tool] = await mcp_upstream_client.list_tools()
+                if not ready.done():
+                    ready.set_result((mcp_upstream_client, tools))
+                await connection._close_event.wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                print(f"MCPConnectionPool: sessione verso '{connection.server_name}' terminata con errore: {e}", file=sys.stderr)
+        finally:
+            connection.healthy = False
+
+    async def _close(self, connection: PooledConnection):
+        connection.healthy = False
+        if connection._close_event is not None:
+            connection._close_event.set()
+        task = connection._task
+        connection._task = None
+        connection.client = None
+        if task is not None and not task.done():
+            done, still_running = await asyncio.wait([task], timeout=10)
+            for pending in still_running:
+                pending.cancel()
+
+    def _ensure_health_task(self):
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.ensure_future(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                print(f"MCPConnectionPool: errore durante l'health check: {e}", file=sys.stderr)
+                traceback.print_exc()
+
+    async def check_health(self):
+        """Chiude le sessioni inattive, fa ping alle altre e riapre quelle cadute che hanno ancora utenti."""
+        now = time.monotonic()
+        for server_id, connection in list(self._connections.items()):
+            if connection.ref_count == 0 and now - connection.last_used > self.idle_ttl:
+                print(f"MCPConnectionPool: chiusura sessione inattiva verso '{connection.server_name}'.")
+                await self._close(connection)
+                self._connections.pop(server_id, None)
+                continue
+
+            if connection.healthy and connection.client is not None:
+                try:
+                    await asyncio.wait_for(connection.client.ping(), MCP_POOL_PING_TIMEOUT)
+                    continue
+                except Exception as e:
+                    print(f"MCPConnectionPool: ping fallito verso '{connection.server_name}': {type(e).__name__} {e}", file=sys.stderr)
+                    connection.healthy = False
+
+            if connection.ref_count > 0 and server_id not in self._connecting:
+                future = asyncio.ensure_future(self._open(connection.server_config, MCP_POOL_PING_TIMEOUT * 2))
+                future.add_done_callback(lambda done: done.cancelled() or done.exception())
+                self._connecting[server_id] = future
+                future.add_done_callback(lambda _, key=server_id: self._connecting.pop(key, None))
+
+    async def close_all(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for connection in list(self._connections.values()):
+            await self._close(connection)
+        self._connections = {}
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "connections": {server_id: connection.stats() for server_id, connection in self._connections.items()},
+            "connecting": list(self._connecting.keys()),
+            "backoff": {server_id: round(until - now, 1) for server_id, until in self._failed_until.items() if until > now},
+        }
+
+
+# Istanza condivisa dal processo frontend
+shared_connection_pool = MCPConnectionPool()
@@ -0,0 +1,167 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Sessioni senza attività da più di N secondi vengono chiuse dallo sweeper
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+# Sessioni rimaste in 'initializing' / 'failed' / 'failed_connection' da più di N secondi
+SESSION_STUCK_TTL = float(os.getenv("SESSION_STUCK_TTL", "300"))
+# Massimo di sessioni vive: oltre, si chiude quella usata meno di recente
+SESSION_MAX_CLIENTS = int(os.getenv("SESSION_MAX_CLIENTS", "200"))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+STUCK_STATES = ("initializing", "failed", "failed_connection")
+
+
+def estimate_session_memory(entry: Dict[str, Any]) -> Dict[str, int]:
+    """Stima della memoria trattenuta da una sessione: history, risultati paginati, sessioni MCP referenziate."""
+    client = entry.get('client')
+    history = getattr(client, 'chat_history', None)
+    result_shaper = getattr(client, 'result_shaper', None)
+    history_bytes = history.payload_bytes() if history is not None and hasattr(history, 'payload_bytes') else 0
+    tool_result_bytes = result_shaper.stored_bytes() if result_shaper is not None else 0
+    return {
+        "history_bytes": history_bytes,
+        "history_messages": len(history) if history is not None else 0,
+        "tool_result_bytes": tool_result_bytes,
+        "open_transports": len(getattr(client, 'sessions', None) or {}),
+        "estimated_bytes": history_bytes + tool_result_bytes,
+    }
+
+
+class SessionManager:
+    """Stato per sessione Socket.IO (client MCP compreso) con TTL di inattività e limite LRU.
+
+    Si usa come il dizionario che sostituisce (get, [], pop, in, items); ogni accesso tramite
+    `touch()`/`get()` aggiorna l'ultima attività. Le sessioni scadute o in eccesso vengono rimosse
+    e passate a `on_evict(session_id, entry, motivo)`, che si occupa di chiuderne il client.
+    """
+
+    def __init__(self, idle_ttl: float = SESSION_IDLE_TTL, stuck_ttl: float = SESSION_STUCK_TTL,
+                 max_clients: int = SESSION_MAX_CLIENTS, sweep_interval: float = SESSION_SWEEP_INTERVAL):
+        self.idle_ttl = idle_ttl
+        self.stuck_ttl = stuck_ttl
+        self.max_clients = max_clients
+        self.sweep_interval = sweep_interval
+        self.on_evict: Optional[Callable[[str, Dict[str, Any], str], None]] = None
+        self._lock = threading.RLock() # Handler Flask e sweeper sul loop asyncio
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict() # In ordine di ultima attività
+        self._last_active: Dict[str, float] = {}
+        self._state_since: Dict[str, Tuple[str, float]] = {}
+        self.evictions: Dict[str, int] = {"idle": 0, "stuck": 0, "lru": 0}
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._entries
+
+    def __getitem__(self, session_id: str) -> Dict[str, Any]:
+        return self._entries[session_id]
+
+    def __setitem__(self, session_id: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[session_id] = entry
+            self._entries.move_to_end(session_id)
+            self._last_active[session_id] = time.monotonic()
+        self._enforce_limit(keep=session_id)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, session_id: str, default: Any = None) -> Any:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return default
+        self.touch(session_id)
+        return entry
+
+    def touch(self, session_id: str):
+        with self._lock:
+            if session_id in self._entries:
+                self._entries.move_to_end(session_id)
+                self._last_active[session_id] = time.monotonic()
+
+    def pop(self, session_id: str, default: Any = None) -> Any:
+        with self._lock:
+            self._last_active.pop(session_id, None)
+            self._state_since.pop(session_id, None)
+            return self._entries.pop(session_id, default)
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            return list(self._entries.items())
+
+    def _evict(self, session_id: str, reason: str):
+        entry = self.pop(session_id)
+        if entry is None:
+            return
+        self.evictions[reason] += 1
+        print(f"SessionManager: sessione {session_id} chiusa ({reason}).")
+        if self.on_evict is not None:
+            try:
+                self.on_evict(session_id, entry, reason)
+            except Exception:
+                print(f"SessionManager: errore chiudendo la sessione {session_id}.", file=sys.stderr)
+                traceback.print_exc()
+
+    def _enforce_limit(self, keep: Optional[str] = None):
+        while len(self._entries) > self.max_clients:
+            with self._lock:
+                victim = next((session_id for session_id in self._entries if session_id != keep), None)
+            if victim is None:
+                return
+            self._evict(victim, "lru")
+
+    def sweep(self):
+        """Chiude le sessioni inattive e quelle bloccate in inizializzazione o in errore."""
+        now = time.monotonic()
+        expired: List[Tuple[str, str]] = []
+        with self._lock:
+            for session_id, entry in self._entries.items():
+                status = entry.get('status')
+                previous = self._state_since.get(session_id)
+                if previous is None or previous[0] != status:
+                    self._state_since[session_id] = (status, now)
+                    previous = self._state_since[session_id]
+                if now - self._last_active.get(session_id, now) > self.idle_ttl:
+                    expired.append((session_id, "idle"))
+                elif status in STUCK_STATES and now - previous[1] > self.stuck_ttl:
+                    expired.append((session_id, "stuck"))
+        for session_id, reason in expired:
+            self._evict(session_id, reason)
+        self._enforce_limit()
+
+    async def run_sweeper(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"SessionManager: errore durante lo sweep: {e}", file=sys.stderr)
+                traceback.print_exc()
+
+    def stats(self, top: int = 10) -> Dict[str, Any]:
+        now = time.monotonic()
+        sessions = []
+        for session_id, entry in self.items():
+            memory = estimate_session_memory(entry)
+            memory.update(session_id=session_id, status=entry.get('status'),
+                          idle_for_s=round(now - self._last_active.get(session_id, now), 1))
+            sessions.append(memory)
+        by_status: Dict[str, int] = {}
+        for session in sessions:
+            by_status[session["status"]] = by_status.get(session["status"], 0) + 1
+        sessions.sort(key=lambda session: session["estimated_bytes"], reverse=True)
+        return {
+            "sessions": len(sessions),
+            "max_clients": self.max_clients,
+            "idle_ttl_s": self.idle_ttl,
+            "by_status": by_status,
+            "estimated_bytes": sum(session["estimated_bytes"] for session in sessions),
+            "open_transports": sum(session["open_transports"] for session in sessions),
+            "evictions": dict(self.evictions),
+            "largest": sessions[:top],
+        }
@@ -0,0 +1,150 @@
+import json
+import os
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import redis # Opzionale: necessario solo con SESSION_STORE_URL=redis://...
+except ImportError:
+    redis = None
+
+# "memory://" (default, un solo processo) oppure "redis://host:6379/1" per condividere lo stato tra worker
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "memory://")
+# Una conversazione non usata per N secondi viene dimenticata dallo store
+SESSION_STORE_TTL = int(os.getenv("SESSION_STORE_TTL", "86400"))
+SESSION_STORE_MAX_ENTRIES = int(os.getenv("SESSION_STORE_MAX_ENTRIES", "1000")) # Solo per lo store in memoria
+
+
+class SessionStore(ABC):
+    """Stato di una conversazione che deve sopravvivere al processo che la serve.
+
+    La chiave è l'id di conversazione scelto dal browser (non il sid Socket.IO, che cambia a ogni
+    riconnessione): history per OpenAI e stato (server selezionati) sono dati JSON semplici, così
+    un altro worker può ricreare il client MCP e continuare la conversazione.
+    """
+
+    @abstractmethod
+    def load_history(self, conversation_id: str) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def save_history(self, conversation_id: str, messages: List[Dict[str, Any]]):
+        ...
+
+    @abstractmethod
+    def get_status(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def set_status(self, conversation_id: str, status: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def delete(self, conversation_id: str):
+        ...
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__}
+
+
+class InMemorySessionStore(SessionStore):
+    """Store di processo: va bene con un solo worker e nei test."""
+
+    def __init__(self, ttl: int = SESSION_STORE_TTL, max_entries: int = SESSION_STORE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict() # id -> (scadenza, dati)
+
+    def _entry(self, conversation_id: str, create: bool = False) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        item = self._entries.get(conversation_id)
+        if item is not None and item[0] < now:
+            del self._entries[conversation_id]
+            item = None
+        if item is None:
+            if not create:
+                return None
+            item = (0, {})
+        data = item[1]
+        self._entries[conversation_id] = (now + self.ttl, data)
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return data
+
+    def load_history(self, conversation_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            data = self._entry(conversation_id)
+            # Copia in JSON come farebbe uno store esterno: chi carica non condivide oggetti con chi salva
+            return json.loads(data["history"]) if data and "history" in data else []
+
+    def save_history(self, conversation_id: str, messages: List[Dict[str, Any]]):
+        serialized = json.dumps(messages, ensure_ascii=False)
+        with self._lock:
+            self._entry(conversation_id, create=True)["history"] = serialized
+
+    def get_status(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._entry(conversation_id)
+            return dict(data["status"]) if data and "status" in data else None
+
+    def set_status(self, conversation_id: str, status: Dict[str, Any]):
+        with self._lock:
+            self._entry(conversation_id, create=True)["status"] = dict(status)
+
+    def delete(self, conversation_id: str):
+        with self._lock:
+            self._entries.pop(conversation_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": type(self).__name__, "conversations": len(self._entries),
+                    "history_bytes": sum(len(data.get("history", "")) for _, data in self._entries.values())}
+
+
+class RedisSessionStore(SessionStore):
+    """Store condiviso tra worker/container: una chiave per history e una per stato, con TTL."""
+
+    def __init__(self, url: str, ttl: int = SESSION_STORE_TTL, prefix: str = "mcp:conversation:"):
+        if redis is None:
+            raise RuntimeError("SESSION_STORE_URL punta a Redis ma il pacchetto 'redis' non è installato.")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, conversation_id: str, kind: str) -> str:
+        return f"{self.prefix}{conversation_id}:{kind}"
+
+    def load_history(self, conversation_id: str) -> List[Dict[str, Any]]:
+        raw = self.client.get(self._key(conversation_id, "history"))
+        return json.loads(raw) if raw else []
+
+    def save_history(self, conversation_id: str, messages: List[Dict[str, Any]]):
+        self.client.set(self._key(conversation_id, "history"), json.dumps(messages, ensure_ascii=False), ex=self.ttl)
+
+    def get_status(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.get(self._key(conversation_id, "status"))
+        return json.loads(raw) if raw else None
+
+    def set_status(self, conversation_id: str, status: Dict[str, Any]):
+        self.client.set(self._key(conversation_id, "status"), json.dumps(status), ex=self.ttl)
+
+    def delete(self, conversation_id: str):
+        self.client.delete(self._key(conversation_id, "history"), self._key(conversation_id, "status"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__, "ttl_s": self.ttl}
+
+
+def create_session_store(url: str = SESSION_STORE_URL) -> SessionStore:
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        print(f"SessionStore: stato delle conversazioni su Redis ({url.split('@')[-1]}).")
+        return RedisSessionStore(url)
+    if url not in ("", "memory://"):
+        print(f"SessionStore: URL '{url}' non supportato, uso lo store in memoria.", file=sys.stderr)
+    return InMemorySessionStore()
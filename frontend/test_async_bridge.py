@@ -0,0 +1,115 @@
+# test_async_bridge.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from async_bridge import AsyncDispatcher
+
+
+@pytest.fixture
+def loop():
+    """Loop asyncio dedicato in un thread, come quello del frontend."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+    loop.close()
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_submit_and_complete(loop):
+    dispatcher = AsyncDispatcher(max_active=2, max_queued=2)
+    dispatcher.bind(loop)
+    results = []
+
+    async def work():
+        return 42
+
+    assert dispatcher.submit(work(), session_id="s", on_done=results.append, name="work")
+    assert _wait_until(lambda: results == [42])
+    assert _wait_until(lambda: dispatcher.stats()["queued"] == 0)
+    assert dispatcher.stats()["completed"] == 1
+
+
+def test_rejects_when_full(loop):
+    dispatcher = AsyncDispatcher(max_active=1, max_queued=1)
+    dispatcher.bind(loop)
+    release = threading.Event()
+
+    async def blocked():
+        await loop.run_in_executor(None, release.wait)
+
+    assert dispatcher.submit(blocked(), name="a")
+    assert dispatcher.submit(blocked(), name="b")
+    assert not dispatcher.submit(blocked(), name="c")
+    assert dispatcher.stats()["rejected"] == 1
+    release.set()
+    assert _wait_until(lambda: dispatcher.stats()["completed"] == 2)
+
+
+def test_cancel_right_after_submit_releases_slots(loop):
+    """Un task cancellato prima del primo passo deve comunque liberare il suo posto."""
+    dispatcher = AsyncDispatcher(max_active=2, max_queued=2)
+    dispatcher.bind(loop)
+    ran = []
+
+    async def work():
+        ran.append(True)
+
+    for _ in range(4):
+        assert dispatcher.submit(work(), session_id="s", name="work")
+        dispatcher.cancel_session("s")
+
+    assert _wait_until(lambda: dispatcher.stats()["queued"] == 0 and dispatcher.stats()["active"] == 0)
+    stats = dispatcher.stats()
+    assert stats["cancelled"] + stats["completed"] == 4
+    assert stats["sessions"] == 0
+    # Gli slot sono tornati disponibili per tutte le sessioni
+    done = []
+    assert dispatcher.submit(work(), session_id="t", on_done=done.append, name="after")
+    assert _wait_until(lambda: len(done) == 1)
+
+
+def test_cancel_running_task(loop):
+    dispatcher = AsyncDispatcher(max_active=1, max_queued=0)
+    dispatcher.bind(loop)
+    started = threading.Event()
+    errors = []
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(30)
+
+    assert dispatcher.submit(slow(), session_id="s", on_error=errors.append, name="slow")
+    assert started.wait(5)
+    dispatcher.cancel_session("s")
+    assert _wait_until(lambda: dispatcher.stats()["cancelled"] == 1)
+    assert _wait_until(lambda: dispatcher.stats()["queued"] == 0 and dispatcher.stats()["active"] == 0)
+    assert errors == [] # Nessuno a cui rispondere dopo la disconnessione
+
+
+def test_timeout_calls_on_error(loop):
+    dispatcher = AsyncDispatcher(max_active=1, max_queued=1)
+    dispatcher.bind(loop)
+    errors = []
+
+    async def slow():
+        await asyncio.sleep(30)
+
+    assert dispatcher.submit(slow(), timeout=0.05, on_error=errors.append, name="slow")
+    assert _wait_until(lambda: len(errors) == 1)
+    assert isinstance(errors[0], asyncio.TimeoutError)
+    assert _wait_until(lambda: dispatcher.stats()["queued"] == 0)
+    assert dispatcher.stats()["timeouts"] == 1
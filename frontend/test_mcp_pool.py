@@ -0,0 +1,92 @@
+# test_mcp_pool.py
+import asyncio
+
+import pytest
+
+import mcp_pool
+from mcp_pool import MCPConnectionPool
+
+SERVER = {"id": "local", "name": "Locale", "url": "http://mcp.test/sse"}
+
+
+class _FakeUpstreamClient:
+    """Sostituisce il client FastMCP: nessuna rete, conta le sessioni aperte."""
+
+    opened = 0
+
+    def __init__(self, transport=None, message_handler=None):
+        pass
+
+    async def __aenter__(self):
+        _FakeUpstreamClient.opened += 1
+        await asyncio.sleep(0.01)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def list_tools(self):
+        return ["tool"]
+
+    async def ping(self):
+        return True
+
+
+@pytest.fixture(autouse=True)
+def fake_client(monkeypatch):
+    _FakeUpstreamClient.opened = 0
+    monkeypatch.setattr(mcp_pool, "FastMCPUpstreamClient", _FakeUpstreamClient)
+    monkeypatch.setattr(mcp_pool, "SSETransport", lambda url: url)
+
+
+def test_concurrent_acquire_opens_one_session():
+    async def main():
+        pool = MCPConnectionPool(health_interval=3600)
+        connections = await asyncio.gather(*(pool.acquire(SERVER, timeout=5) for _ in range(5)))
+        stats = pool.stats()
+        await pool.close_all()
+        return connections, stats
+
+    connections, stats = asyncio.run(main())
+    assert len({id(connection) for connection in connections}) == 1
+    assert connections[0].ref_count == 5
+    assert _FakeUpstreamClient.opened == 1
+    assert stats["connections"]["local"]["tools"] == 1
+
+
+def test_release_and_idle_close():
+    async def main():
+        pool = MCPConnectionPool(health_interval=3600, idle_ttl=0)
+        connection = await pool.acquire(SERVER, timeout=5)
+        await pool.check_health()
+        still_open = "local" in pool.stats()["connections"] # Ancora in uso: non si chiude
+        pool.release(connection)
+        pool.release(connection) # Rilasci in eccesso non vanno sotto zero
+        await asyncio.sleep(0.01)
+        await pool.check_health()
+        await pool.close_all()
+        return connection, still_open, pool.stats()
+
+    connection, still_open, stats = asyncio.run(main())
+    assert still_open
+    assert connection.ref_count == 0
+    assert stats["connections"] == {}
+
+
+def test_failed_open_backs_off():
+    class _Broken(_FakeUpstreamClient):
+        async def __aenter__(self):
+            raise ConnectionError("rifiutata")
+
+    async def main():
+        mcp_pool.FastMCPUpstreamClient = _Broken
+        pool = MCPConnectionPool(health_interval=3600, retry_after=60)
+        with pytest.raises(ConnectionError, match="rifiutata"):
+            await pool.acquire(SERVER, timeout=5)
+        with pytest.raises(ConnectionError, match="nuovo tentativo"):
+            await pool.acquire(SERVER, timeout=5)
+        stats = pool.stats()
+        await pool.close_all()
+        return stats
+
+    assert "local" in asyncio.run(main())["backoff"]
@@ -0,0 +1,151 @@
+# test_resilience.py
+import asyncio
+
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, EndpointPolicy
+
+
+class _Clock:
+    """Sostituisce time.monotonic di resilience per far scorrere il tempo del breaker."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opened == 1
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_breaker_success_resets_failures(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.consecutive_failures == 1
+
+
+def test_breaker_half_open_allows_single_probe(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.allow() # Sonda
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow() # Solo una sonda alla volta
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.allow()
+
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    clock.now += 10
+    breaker.allow()
+
+
+def test_breaker_released_probe_can_be_retried(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.allow()
+    breaker.release_probe() # Sonda cancellata
+    breaker.allow()
+    assert breaker.state == "half_open"
+
+
+def test_policy_retries_idempotent_calls():
+    policy = EndpointPolicy("svc", deadline=5, retries=2, backoff_base=0.001, backoff_max=0.001,
+                            breaker=CircuitBreaker("svc", failure_threshold=10))
+    attempts = []
+
+    async def operation():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("giù")
+        return "ok"
+
+    assert asyncio.run(policy.call(operation, idempotent=True)) == "ok"
+    assert len(attempts) == 3
+    assert policy.retried == 2
+
+
+def test_policy_does_not_retry_non_idempotent_calls():
+    policy = EndpointPolicy("svc", deadline=5, retries=2, breaker=CircuitBreaker("svc", failure_threshold=10))
+    attempts = []
+
+    async def operation():
+        attempts.append(1)
+        raise ConnectionError("giù")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(policy.call(operation))
+    assert len(attempts) == 1
+
+
+def test_policy_propagates_non_failures_without_opening():
+    policy = EndpointPolicy("svc", deadline=5, retries=2, breaker=CircuitBreaker("svc", failure_threshold=1))
+
+    async def operation():
+        raise ValueError("argomenti non validi")
+
+    with pytest.raises(ValueError):
+        asyncio.run(policy.call(operation, idempotent=True))
+    assert policy.breaker.state == "closed"
+    assert policy.retried == 0
+
+
+def test_policy_hedges_slow_attempt():
+    policy = EndpointPolicy("svc", deadline=5, hedge_after=0.05)
+    attempts = []
+
+    async def operation():
+        attempts.append(1)
+        if len(attempts) == 1:
+            await asyncio.sleep(5) # Primo tentativo nella coda lenta
+        return len(attempts)
+
+    assert asyncio.run(policy.call(operation, idempotent=True)) == 2
+    assert policy.hedged == 1
+    assert policy.hedge_wins == 1
+
+
+def test_policy_deadline_exceeded():
+    policy = EndpointPolicy("svc", deadline=0.05, breaker=CircuitBreaker("svc", failure_threshold=10))
+
+    async def operation():
+        await asyncio.sleep(5)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(policy.call(operation))
+    assert policy.deadline_exceeded == 1
@@ -0,0 +1,75 @@
+# test_session_manager.py
+import pytest
+
+import session_manager
+from session_manager import SessionManager
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(session_manager.time, "monotonic", clock)
+    return clock
+
+
+def _manager(**settings):
+    manager = SessionManager(**settings)
+    evicted = []
+    manager.on_evict = lambda session_id, entry, reason: evicted.append((session_id, reason))
+    return manager, evicted
+
+
+def test_idle_sessions_are_swept(clock):
+    manager, evicted = _manager(idle_ttl=60, stuck_ttl=600, max_clients=10)
+    manager["a"] = {"status": "connected"}
+    manager["b"] = {"status": "connected"}
+    clock.now += 30
+    manager.get("b") # Attività: b resta viva
+    clock.now += 31
+    manager.sweep()
+    assert evicted == [("a", "idle")]
+    assert "a" not in manager and "b" in manager
+    assert manager.evictions["idle"] == 1
+
+
+def test_stuck_sessions_are_swept(clock):
+    manager, evicted = _manager(idle_ttl=600, stuck_ttl=60, max_clients=10)
+    manager["a"] = {"status": "initializing"}
+    manager["b"] = {"status": "initializing"}
+    manager.sweep() # Primo sweep: registra da quando sono in questo stato
+    manager["b"]["status"] = "connected"
+    clock.now += 30
+    manager.touch("a") # L'attività non basta se lo stato non cambia
+    clock.now += 31
+    manager.sweep()
+    assert evicted == [("a", "stuck")]
+
+
+def test_lru_limit_keeps_new_session(clock):
+    manager, evicted = _manager(max_clients=2)
+    manager["a"] = {"status": "connected"}
+    clock.now += 1
+    manager["b"] = {"status": "connected"}
+    clock.now += 1
+    manager.get("a")
+    manager["c"] = {"status": "connected"}
+    assert evicted == [("b", "lru")]
+    assert len(manager) == 2
+
+
+def test_evict_callback_errors_do_not_stop_sweep(clock):
+    manager = SessionManager(idle_ttl=1, max_clients=10)
+    manager.on_evict = lambda session_id, entry, reason: 1 / 0
+    manager["a"] = {"status": "connected"}
+    manager["b"] = {"status": "connected"}
+    clock.now += 2
+    manager.sweep()
+    assert len(manager) == 0
@@ -0,0 +1,114 @@
+# test_tool_result_cache.py
+import asyncio
+
+from mcp_web import ToolResultCache
+
+
+def test_concurrent_identical_calls_share_one_fetch():
+    cache = ToolResultCache(ttl=30, max_entries=10)
+    calls = []
+
+    async def fetch(etag):
+        calls.append(etag)
+        await asyncio.sleep(0.05)
+        return {"rows": 3}, '"v1"'
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_fetch("query", "role=QA", fetch) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert results == [{"rows": 3}] * 5
+    assert len(calls) == 1
+    assert cache.misses == 1
+    assert cache.coalesced == 4
+    assert cache.stats()["inflight"] == 0
+
+
+def test_hit_within_ttl():
+    cache = ToolResultCache(ttl=30, max_entries=10)
+    calls = []
+
+    async def fetch(etag):
+        calls.append(etag)
+        return len(calls), '"v1"'
+
+    async def main():
+        return [await cache.get_or_fetch("query", "a", fetch) for _ in range(3)]
+
+    assert asyncio.run(main()) == [1, 1, 1]
+    assert cache.hits == 2
+
+
+def test_expired_entry_is_revalidated_with_etag():
+    cache = ToolResultCache(ttl=0.01, max_entries=10)
+    calls = []
+
+    async def fetch(etag):
+        calls.append(etag)
+        if etag == '"v1"':
+            return None, None # 304: il dato non è cambiato
+        return {"rows": 3}, '"v1"'
+
+    async def main():
+        first = await cache.get_or_fetch("query", "a", fetch)
+        await asyncio.sleep(0.02)
+        second = await cache.get_or_fetch("query", "a", fetch)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first == second == {"rows": 3}
+    assert calls == [None, '"v1"']
+    assert cache.revalidated == 1
+
+
+def test_zero_ttl_disables_storage():
+    cache = ToolResultCache(ttl=0, max_entries=10)
+    calls = []
+
+    async def fetch(etag):
+        calls.append(etag)
+        return "x", '"v1"'
+
+    async def main():
+        await cache.get_or_fetch("query", "a", fetch)
+        await cache.get_or_fetch("query", "a", fetch)
+
+    asyncio.run(main())
+    assert calls == [None, None]
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction():
+    cache = ToolResultCache(ttl=30, max_entries=2)
+
+    async def fetch(etag):
+        return "x", None
+
+    async def main():
+        for key in ("a", "b", "a", "c"):
+            await cache.get_or_fetch("query", key, fetch)
+
+    asyncio.run(main())
+    assert cache.evictions == 1
+    assert list(cache._entries) == ["query:a", "query:c"]
+
+
+def test_failed_fetch_is_not_cached():
+    cache = ToolResultCache(ttl=30, max_entries=10)
+    calls = []
+
+    async def fetch(etag):
+        calls.append(etag)
+        if len(calls) == 1:
+            raise ConnectionError("giù")
+        return "ok", None
+
+    async def main():
+        try:
+            await cache.get_or_fetch("query", "a", fetch)
+        except ConnectionError:
+            pass
+        return await cache.get_or_fetch("query", "a", fetch)
+
+    assert asyncio.run(main()) == "ok"
+    assert len(calls) == 2
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import mcp.types
+
+from mcp_pool import MCPConnectionPool, PooledConnection, shared_connection_pool
+
+# mcp_servers.json è nella stessa directory di questo modulo (frontend/, nel container /app)
+MCP_SERVERS_CONFIG_PATH = os.getenv(
+    "MCP_SERVERS_CONFIG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "mcp_servers.json")
+)
+# Connette all'avvio i server "default_selected" così la prima sessione trova il catalogo già pronto
+MCP_CATALOG_PREWARM = os.getenv("MCP_CATALOG_PREWARM", "1").lower() in ("1", "true", "yes")
+
+
+def mcp_schema_to_openapi(mcp_schema: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not mcp_schema or 'properties' not in mcp_schema or not mcp_schema.get('properties'):
+        return {"type": "object", "properties": {}}
+    return {
+        "type": mcp_schema.get("type", "object"),
+        "properties": mcp_schema.get("properties", {}),
+        "required": mcp_schema.get("required", [])
+    }
+
+def build_openai_tools(tools_from_server: List[mcp.types.Tool], server_id: str, server_name: str) -> List[Dict[str, Any]]:
+    """Converte i tool MCP di un server nel formato function-calling di OpenAI."""
+    openai_tools: List[Dict[str, Any]] = []
+    for tool_obj in tools_from_server:
+        tool_name = tool_obj.name
+        if not tool_name:
+            print(f"AVVISO: Tool da '{server_name}' senza nome: {tool_obj}", file=sys.stderr)
+            continue
+
+        parameters_schema_dict: Optional[Dict[str, Any]] = None
+        if tool_obj.inputSchema:
+            parameters_schema_dict = tool_obj.inputSchema
+
+        # Formato tool per OpenAI
+        openai_tools.append({
+            "type": "function",
+            "function": {
+                "name": f"{server_id}__{tool_name}", # Nome univoco per OpenAI
+                "description": tool_obj.description or f"Tool {tool_name} from server {server_name}",
+                "parameters": mcp_schema_to_openapi(parameters_schema_dict)
+            }
+        })
+    return openai_tools
+
+
+class ToolCatalog:
+    """Configurazione dei server MCP e definizioni OpenAI dei loro tool, condivise da tutte le sessioni.
+
+    La configurazione viene riletta solo quando mcp_servers.json cambia (mtime/size); le definizioni
+    dei tool vengono convertite una volta per versione dei tool di ciascun server e invalidate dalle
+    notifiche MCP tools/list_changed. `version` cambia a ogni aggiornamento, così gli MCPClient
+    possono accorgersi che la propria lista di tool è da ricostruire.
+    """
+
+    def __init__(self, config_path: str = MCP_SERVERS_CONFIG_PATH):
+        self.config_path = config_path
+        self._lock = threading.Lock() # server_configs() viene chiamata dai thread di Flask
+        self._config_signature: Optional[Tuple[int, int]] = None
+        self._server_configs: List[Dict[str, Any]] = []
+        self._tool_definitions: Dict[str, Tuple[int, List[Dict[str, Any]]]] = {} # server_id -> (tools_version, tool OpenAI)
+        self.config_version = 0
+        self.version = 0
+
+    def server_configs(self) -> List[Dict[str, Any]]:
+        try:
+            stat = os.stat(self.config_path)
+        except FileNotFoundError:
+            print(f"ERRORE: File '{self.config_path}' non trovato.", file=sys.stderr)
+            return []
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if signature != self._config_signature:
+                self._reload_config(signature)
+            return list(self._server_configs)
+
+    def _reload_config(self, signature: Tuple[int, int]):
+        print(f"Tentativo di caricamento configurazione server da: {self.config_path}") # Log per debug
+        try:
+            with open(self.config_path, "r") as f:
+                config = json.load(f)
+        except json.JSONDecodeError:
+            print(f"ERRORE: Errore nel decodificare '{self.config_path}'. Assicurati che sia JSON valido.", file=sys.stderr)
+            return # Manteniamo l'ultima configurazione valida e ritentiamo alla prossima modifica
+        except Exception as e:
+            print(f"Errore caricando la configurazione dei server MCP da '{self.config_path}': {e}", file=sys.stderr)
+            return
+        self._config_signature = signature
+        self._server_configs = config.get("available_mcp_servers", [])
+        self._tool_definitions = {}
+        self.config_version += 1
+        self.version += 1
+
+    def openai_tools(self, connection: PooledConnection) -> List[Dict[str, Any]]:
+        """Definizioni OpenAI dei tool del server, riconvertite solo se i tool sono cambiati."""
+        cached = self._tool_definitions.get(connection.server_id)
+        if cached is not None and cached[0] == connection.tools_version:
+            return cached[1]
+        definitions = build_openai_tools(connection.tools, connection.server_id, connection.server_name)
+        self._tool_definitions[connection.server_id] = (connection.tools_version, definitions)
+        return definitions
+
+    def on_tools_changed(self, server_id: str):
+        self._tool_definitions.pop(server_id, None)
+        self.version += 1
+        print(f"ToolCatalog: tool del server '{server_id}' aggiornati (versione catalogo {self.version}).")
+
+    async def prewarm(self, connection_pool: MCPConnectionPool, timeout: float):
+        """Apre le sessioni dei server selezionati di default e ne converte i tool, poi le lascia nel pool."""
+        configs = [config for config in self.server_configs() if config.get("default_selected")]
+
+        async def warm(server_config: Dict[str, Any]):
+            try:
+                connection = await connection_pool.acquire(server_config, float(server_config.get("connect_timeout", timeout)))
+            except Exception as e:
+                print(f"ToolCatalog: prewarm di '{server_config.get('name', server_config['id'])}' fallito: {e}", file=sys.stderr)
+                return
+            self.openai_tools(connection)
+            connection_pool.release(connection)
+
+        await asyncio.gather(*(warm(config) for config in configs))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "config_version": self.config_version,
+            "servers": len(self._server_configs),
+            "tools_by_server": {server_id: {"tools_version": version, "tools": len(definitions)}
+                                for server_id, (version, definitions) in self._tool_definitions.items()},
+        }
+
+
+# Istanza condivisa dal processo frontend, aggiornata dalle notifiche tools/list_changed del pool
+shared_tool_catalog = ToolCatalog()
+shared_connection_pool.add_tools_listener(shared_tool_catalog.on_tools_changed)
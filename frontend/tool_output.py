@@ -0,0 +1,212 @@
+import itertools
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Limiti di default di un risultato di tool inviato al modello; per singolo tool si sovrascrivono
+# con la chiave "result_limits" del server in mcp_servers.json, es. {"get_dati_csv_mcp": {"max_rows": 20}}
+MCP_TOOL_RESULT_MAX_BYTES = int(os.getenv("MCP_TOOL_RESULT_MAX_BYTES", "16000"))
+MCP_TOOL_RESULT_MAX_ROWS = int(os.getenv("MCP_TOOL_RESULT_MAX_ROWS", "50"))
+# Risultati completi conservati per sessione, per le pagine successive richieste dal modello
+MCP_TOOL_RESULT_PAGES_KEPT = int(os.getenv("MCP_TOOL_RESULT_PAGES_KEPT", "8"))
+# Caratteri di un risultato mostrati nei log
+MCP_TOOL_RESULT_LOG_CHARS = int(os.getenv("MCP_TOOL_RESULT_LOG_CHARS", "500"))
+
+# Tool locale (non MCP) con cui il modello legge le pagine successive di un risultato troncato
+FETCH_PAGE_TOOL_NAME = "local__fetch_result_page"
+FETCH_PAGE_TOOL_DEFINITION = {
+    "type": "function",
+    "function": {
+        "name": FETCH_PAGE_TOOL_NAME,
+        "description": "Legge un'altra pagina di un risultato di tool troncato, usando il 'handle' e l'offset indicati in 'next_page'.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "handle": {"type": "string", "description": "Handle del risultato troncato"},
+                "offset": {"type": "integer", "description": "Prima riga (o primo carattere, per i testi) da restituire"},
+                "limit": {"type": "integer", "description": "Numero massimo di righe (o caratteri) da restituire"},
+            },
+            "required": ["handle", "offset"],
+        },
+    },
+}
+
+# Chiavi sotto cui i server di questo progetto restituiscono le liste di record (cercate per prime);
+# in mancanza vale qualunque campo che contenga una lista di oggetti (es. "csv_data_result" di mcp_web)
+RECORD_LIST_KEYS = ("records", "groups", "dipendenti", "stagisti_list", "csv_data_result", "rows", "items")
+
+
+def log_preview(text: str, limit: int = MCP_TOOL_RESULT_LOG_CHARS) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}… [{len(text)} caratteri]"
+
+
+def _is_record_list(value: Any) -> bool:
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def _find_records(payload: Any) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+    """Individua la lista di record del risultato; restituisce (record, altri campi) o None."""
+    if _is_record_list(payload):
+        return payload, {}
+    if isinstance(payload, dict):
+        candidates = [key for key in RECORD_LIST_KEYS if _is_record_list(payload.get(key))]
+        # Chiave non nota: la lista di oggetti più lunga
+        candidates = candidates or sorted((key for key, value in payload.items() if _is_record_list(value)),
+                                          key=lambda key: len(payload[key]), reverse=True)
+        if candidates:
+            key = candidates[0]
+            return payload[key], {k: v for k, v in payload.items() if k != key}
+    return None
+
+
+def records_to_table(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Lista di record -> tabella compatta: i nomi dei campi compaiono una volta sola."""
+    columns: List[str] = []
+    for record in records:
+        for key in record:
+            if key not in columns:
+                columns.append(key)
+    return {"columns": columns, "rows": [[record.get(column) for column in columns] for record in records]}
+
+
+def _json_size(value: Any) -> int:
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+class _StoredResult:
+    def __init__(self, tool_name: str, records: Optional[List[Dict[str, Any]]], text: Optional[str], extra: Dict[str, Any],
+                 max_bytes: int, max_rows: int):
+        self.tool_name = tool_name
+        self.records = records
+        self.text = text
+        self.extra = extra
+        # Limiti in vigore per il tool (anche quelli di "result_limits"): valgono per tutte le pagine
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+
+
+class ToolOutputShaper:
+    """Riduce i risultati dei tool entro limiti di byte/righe prima che entrino nella history.
+
+    Le liste di record diventano tabelle colonnari; se il risultato va troncato, quello completo
+    resta in memoria (per sessione, LRU) e il modello riceve un handle per chiedere le pagine
+    successive con il tool locale FETCH_PAGE_TOOL_NAME.
+    """
+
+    def __init__(self, max_bytes: int = MCP_TOOL_RESULT_MAX_BYTES, max_rows: int = MCP_TOOL_RESULT_MAX_ROWS,
+                 pages_kept: int = MCP_TOOL_RESULT_PAGES_KEPT):
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.pages_kept = pages_kept
+        self._stored: "OrderedDict[str, _StoredResult]" = OrderedDict()
+        self._stored_sizes: Dict[str, int] = {}
+        self._handles = itertools.count(1)
+        self.shaped_results = 0
+        self.truncated_results = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _limits(self, limits: Optional[Dict[str, Any]]) -> Tuple[int, int]:
+        limits = limits or {}
+        return int(limits.get("max_bytes", self.max_bytes)), int(limits.get("max_rows", self.max_rows))
+
+    def _store(self, result: _StoredResult, size: int) -> str:
+        handle = f"r{next(self._handles)}"
+        self._stored[handle] = result
+        self._stored_sizes[handle] = size
+        while len(self._stored) > self.pages_kept:
+            evicted, _ = self._stored.popitem(last=False)
+            self._stored_sizes.pop(evicted, None)
+        return handle
+
+    def stored_bytes(self) -> int:
+        """Dimensione (approssimata, come JSON) dei risultati completi tenuti per la paginazione."""
+        return sum(self._stored_sizes.values())
+
+    def shape(self, tool_name: str, text: str, limits: Optional[Dict[str, Any]] = None) -> str:
+        """Restituisce il contenuto del messaggio 'tool' per OpenAI a partire dal testo del tool."""
+        max_bytes, max_rows = self._limits(limits)
+        raw_content = json.dumps({"result": text})
+        self.bytes_in += len(raw_content.encode("utf-8"))
+        try:
+            payload = json.loads(text)
+        except (json.JSONDecodeError, TypeError):
+            payload = None
+        found = _find_records(payload) if payload is not None else None
+
+        if found is None:
+            if len(raw_content.encode("utf-8")) <= max_bytes:
+                self.bytes_out += len(raw_content.encode("utf-8"))
+                return raw_content
+            handle = self._store(_StoredResult(tool_name, None, text, {}, max_bytes, max_rows), len(raw_content))
+            page = self._text_page(handle, text, 0, max_bytes // 2)
+        else:
+            records, extra = found
+            if len(records) <= max_rows and len(raw_content.encode("utf-8")) <= max_bytes:
+                self.bytes_out += len(raw_content.encode("utf-8"))
+                return raw_content
+            handle = self._store(_StoredResult(tool_name, records, None, extra, max_bytes, max_rows), len(raw_content))
+            page = self._records_page(handle, records, extra, 0, max_rows, max_bytes)
+
+        content = json.dumps(page, ensure_ascii=False)
+        self.shaped_results += 1
+        if page.get("truncated"):
+            self.truncated_results += 1
+        self.bytes_out += len(content.encode("utf-8"))
+        return content
+
+    def _records_page(self, handle: str, records: List[Dict[str, Any]], extra: Dict[str, Any], offset: int,
+                      max_rows: int, max_bytes: int) -> Dict[str, Any]:
+        page = records[offset:offset + max_rows]
+        table = records_to_table(page)
+        # Se la tabella supera ancora il limite di byte, dimezza le righe fino a rientrarvi
+        while len(table["rows"]) > 1 and _json_size(table) > max_bytes:
+            page = page[:len(page) // 2]
+            table = records_to_table(page)
+        result: Dict[str, Any] = {"result": dict(extra, **table), "total_rows": len(records), "offset": offset,
+                                  "returned_rows": len(page)}
+        next_offset = offset + len(page)
+        if next_offset < len(records):
+            result["truncated"] = True
+            result["next_page"] = {"tool": FETCH_PAGE_TOOL_NAME, "handle": handle, "offset": next_offset}
+        return result
+
+    def _text_page(self, handle: str, text: str, offset: int, max_chars: int) -> Dict[str, Any]:
+        chunk = text[offset:offset + max_chars]
+        result: Dict[str, Any] = {"result": chunk, "total_chars": len(text), "offset": offset}
+        next_offset = offset + len(chunk)
+        if next_offset < len(text):
+            result["truncated"] = True
+            result["next_page"] = {"tool": FETCH_PAGE_TOOL_NAME, "handle": handle, "offset": next_offset}
+        return result
+
+    def fetch_page(self, handle: str, offset: int, limit: Optional[int] = None) -> str:
+        """Implementazione del tool locale di paginazione."""
+        stored = self._stored.get(handle)
+        if stored is None:
+            return json.dumps({"error": f"Handle '{handle}' sconosciuto o scaduto: richiama il tool originale."})
+        self._stored.move_to_end(handle)
+        offset = max(0, int(offset))
+        if stored.records is not None:
+            max_rows = min(int(limit), stored.max_rows) if limit else stored.max_rows
+            return json.dumps(self._records_page(handle, stored.records, stored.extra, offset, max_rows, stored.max_bytes),
+                              ensure_ascii=False)
+        max_chars = min(int(limit), stored.max_bytes // 2) if limit else stored.max_bytes // 2
+        return json.dumps(self._text_page(handle, stored.text, offset, max_chars))
+
+    def clear(self):
+        self._stored.clear()
+        self._stored_sizes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "shaped_results": self.shaped_results,
+            "truncated_results": self.truncated_results,
+            "stored_results": len(self._stored),
+            "stored_bytes": self.stored_bytes(),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
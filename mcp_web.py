@@ -1,9 +1,20 @@
-from typing import Any, Dict, List
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import time
 import httpx
 from mcp.server.fastmcp import FastMCP
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
 import sys
 import uvicorn
 import os
+from urllib.parse import quote, urlencode
+from resilience import CircuitOpenError, ResilienceRegistry
 
 # Inizializza il server MCP
 mcp = FastMCP("stagisti-mcp", "0.1.0")
@@ -11,64 +22,568 @@ mcp = FastMCP("stagisti-mcp", "0.1.0")
 # Endpoint del dataset server - leggilo da una variabile d'ambiente
 DATASET_API_BASE = os.getenv("DATASET_API_BASE_URL", "http://127.0.0.1:8000") # Default per test locali
 
+# --- Client HTTP condiviso verso il dataset server ---
+# Un solo AsyncClient per processo: le connessioni keep-alive vengono riusate tra le chiamate ai tool
+DATASET_HTTP_MAX_CONNECTIONS = int(os.getenv("DATASET_HTTP_MAX_CONNECTIONS", "100"))
+DATASET_HTTP_MAX_KEEPALIVE = int(os.getenv("DATASET_HTTP_MAX_KEEPALIVE", "20"))
+DATASET_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("DATASET_HTTP_KEEPALIVE_EXPIRY", "30"))
+DATASET_HTTP_TIMEOUT = float(os.getenv("DATASET_HTTP_TIMEOUT", "10"))
+DATASET_HTTP_CONNECT_TIMEOUT = float(os.getenv("DATASET_HTTP_CONNECT_TIMEOUT", "5"))
+DATASET_HTTP2 = os.getenv("DATASET_HTTP2", "0").lower() in ("1", "true", "yes")
+
+# Resilienza verso il dataset server: deadline complessiva, retry con jitter per le letture, breaker e hedging opzionale
+DATASET_DEADLINE = float(os.getenv("DATASET_DEADLINE", "20")) # Secondi, retry compresi
+DATASET_RETRIES = int(os.getenv("DATASET_RETRIES", "2"))
+DATASET_HEDGE_AFTER = float(os.getenv("DATASET_HEDGE_AFTER", "0")) # 0 disattiva; es. 1.5 = secondo tentativo dopo 1.5s
+
+_http_client: Optional[httpx.AsyncClient] = None
+_http_requests_total = 0
+
+def _http2_available() -> bool:
+    try:
+        import h2 # noqa: F401 - richiesto da httpx per HTTP/2 (pip install httpx[http2])
+        return True
+    except ImportError:
+        return False
+
+def _create_http_client() -> httpx.AsyncClient:
+    http2 = DATASET_HTTP2 and _http2_available()
+    if DATASET_HTTP2 and not http2:
+        print("ATTENZIONE: DATASET_HTTP2 attivo ma il pacchetto 'h2' non è installato, uso HTTP/1.1.", file=sys.stderr)
+
+    async def count_request(request: httpx.Request):
+        global _http_requests_total
+        _http_requests_total += 1
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=DATASET_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=DATASET_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=DATASET_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(DATASET_HTTP_TIMEOUT, connect=DATASET_HTTP_CONNECT_TIMEOUT),
+        http2=http2,
+        event_hooks={"request": [count_request]},
+    )
+
+def get_http_client() -> httpx.AsyncClient:
+    """Restituisce il client condiviso; lo crea al primo uso se il lifespan dell'app non è attivo (es. test)."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _create_http_client()
+    return _http_client
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def http_pool_stats() -> Dict[str, Any]:
+    """Statistiche del pool di connessioni verso il dataset server."""
+    stats: Dict[str, Any] = {
+        "requests_total": _http_requests_total,
+        "max_connections": DATASET_HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": DATASET_HTTP_MAX_KEEPALIVE,
+        "http2": bool(_http_client and DATASET_HTTP2 and _http2_available()),
+        "client_open": bool(_http_client and not _http_client.is_closed),
+    }
+    # httpx non espone il pool pubblicamente: leggiamo lo stato di httpcore se disponibile
+    pool = getattr(getattr(_http_client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    stats["connections"] = len(connections)
+    stats["idle_connections"] = sum(1 for connection in connections if connection.is_idle())
+    stats["active_connections"] = stats["connections"] - stats["idle_connections"]
+    return stats
+
+def _is_dataset_failure(exc: BaseException) -> bool:
+    """Errori che indicano un dataset server in difficoltà: rete, timeout e 5xx (non i 4xx né i dati non validi)."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, (httpx.TransportError, asyncio.TimeoutError))
+
+resilience = ResilienceRegistry()
+dataset_policy = resilience.policy(
+    "dataset",
+    deadline=DATASET_DEADLINE,
+    attempt_timeout=DATASET_HTTP_TIMEOUT,
+    retries=DATASET_RETRIES,
+    hedge_after=DATASET_HEDGE_AFTER or None,
+    is_failure=_is_dataset_failure,
+)
+# --- Fine client HTTP condiviso ---
+
+
+# --- Cache dei risultati dei tool ---
+MCP_CACHE_TTL = float(os.getenv("MCP_CACHE_TTL", "30")) # Secondi; 0 disattiva la memorizzazione (resta la coalescenza)
+MCP_CACHE_MAX_ENTRIES = int(os.getenv("MCP_CACHE_MAX_ENTRIES", "256"))
+
+# fetch(etag) -> (dati, etag); dati None significa 304 Not Modified
+FetchFn = Callable[[Optional[str]], Awaitable[Tuple[Optional[Any], Optional[str]]]]
+
+
+class _CacheEntry:
+    def __init__(self, data: Any, etag: Optional[str], expires_at: float):
+        self.data = data
+        self.etag = etag
+        self.expires_at = expires_at
+
+
+class ToolResultCache:
+    """Cache LRU con TTL dei risultati dei tool, chiave = nome tool + argomenti normalizzati.
+
+    Le chiamate identiche concorrenti condividono un'unica richiesta upstream; una voce scaduta
+    viene rivalidata con If-None-Match, così se il dato non è cambiato il server risponde 304 senza body.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.revalidated = 0
+        self.evictions = 0
+
+    async def get_or_fetch(self, tool_name: str, normalized_args: str, fetch: FetchFn) -> Any:
+        key = f"{tool_name}:{normalized_args}"
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry.data
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch_and_store(key, entry, fetch))
+            # Evita il warning "exception was never retrieved" se tutti i chiamanti sono stati cancellati
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._inflight[key] = task
+        # shield: se un chiamante viene cancellato la richiesta condivisa prosegue per gli altri
+        return await asyncio.shield(task)
+
+    async def _fetch_and_store(self, key: str, stale: Optional[_CacheEntry], fetch: FetchFn) -> Any:
+        try:
+            data, etag = await fetch(stale.etag if stale is not None else None)
+            if data is None and stale is not None:
+                self.revalidated += 1
+                data, etag = stale.data, etag or stale.etag
+            if self.ttl > 0:
+                self._entries[key] = _CacheEntry(data, etag, time.monotonic() + self.ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            return data
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "ttl_seconds": self.ttl,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "revalidated": self.revalidated,
+            "evictions": self.evictions,
+        }
+
+
+tool_result_cache = ToolResultCache(MCP_CACHE_TTL, MCP_CACHE_MAX_ENTRIES)
+
+def _read_dataset_response(response: httpx.Response, path: str) -> Any:
+    if response.status_code == 400:
+        # Parametri rifiutati dal server: il messaggio aiuta il modello a correggere la chiamata
+        raise ValueError(f"Query non valida per {path}: {response.json().get('error', response.text)}")
+    response.raise_for_status()
+    data = response.json()
+    if isinstance(data, dict) and data.get("error"):
+        raise ValueError(f"Errore dal server dataset ({path}): {data['error']}")
+    return data
+
+async def _cached_dataset_get(tool_name: str, path: str, query_string: str = "") -> Any:
+    """GET verso il dataset server passando dalla cache dei risultati; la query string fa da argomenti normalizzati."""
+    url = f"{DATASET_API_BASE}{path}?{query_string}" if query_string else f"{DATASET_API_BASE}{path}"
+
+    async def fetch(etag: Optional[str]) -> Tuple[Optional[Any], Optional[str]]:
+        async def attempt() -> Tuple[Optional[Any], Optional[str]]:
+            response = await get_http_client().get(url, headers={"If-None-Match": etag} if etag else None)
+            if response.status_code == 304:
+                return None, etag
+            return _read_dataset_response(response, path), response.headers.get("ETag")
+
+        # GET idempotente: può essere ripetuta o duplicata (hedging) senza effetti collaterali
+        return await dataset_policy.call(attempt, idempotent=True)
+
+    return await tool_result_cache.get_or_fetch(tool_name, f"{path}?{query_string}", fetch)
+# --- Fine cache dei risultati ---
+
 @mcp.tool()
 async def get_stagisti_mcp() -> Dict[str, Any]:
     """Recupera la lista degli stagisti di Mauden dal dataset server tramite REST API."""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{DATASET_API_BASE}/stagisti")
-            response.raise_for_status()
-            data = response.json()
-
-            # Controllo errore più robusto
-            if not data or ("error" in data and isinstance(data, dict) and data.get("error")):
-                raise ValueError("Errore o risposta vuota dal server dataset (/stagisti): " + str(data))
-
-            # Assicura che venga restituito un dizionario, in linea con il type hint
-            if isinstance(data, list):
-                return {"stagisti_list": data} # Avvolgi la lista in un dizionario
-            elif not isinstance(data, dict):
-                # Se non è una lista né un dizionario (improbabile per JSON valido ma per sicurezza)
-                return {"result": data}
-            # Se è già un dizionario (e non un errore), restituiscilo direttamente
-            return data
+    try:
+        data = await _cached_dataset_get("get_stagisti_mcp", "/stagisti")
+
+        # Controllo errore più robusto
+        if not data or ("error" in data and isinstance(data, dict) and data.get("error")):
+            raise ValueError("Errore o risposta vuota dal server dataset (/stagisti): " + str(data))
 
-        except httpx.RequestError as exc:
-             print(f"Errore HTTPX durante la chiamata a {exc.request.url!r} per /stagisti: {exc}", file=sys.stderr)
-             raise ValueError(f"Errore di rete nel contattare il server dataset (/stagisti): {exc}") from exc
-        except Exception as e:
-             print(f"Errore generico in get_stagisti_mcp: {e}", file=sys.stderr)
-             raise ValueError(f"Errore imprevisto in get_stagisti_mcp: {e}") from e
+        # Assicura che venga restituito un dizionario, in linea con il type hint
+        if isinstance(data, list):
+            return {"stagisti_list": data} # Avvolgi la lista in un dizionario
+        elif not isinstance(data, dict):
+            # Se non è una lista né un dizionario (improbabile per JSON valido ma per sicurezza)
+            return {"result": data}
+        # Se è già un dizionario (e non un errore), restituiscilo direttamente
+        return data
+
+    except httpx.RequestError as exc:
+         print(f"Errore HTTPX durante la chiamata a {exc.request.url!r} per /stagisti: {exc}", file=sys.stderr)
+         raise ValueError(f"Errore di rete nel contattare il server dataset (/stagisti): {exc}") from exc
+    except Exception as e:
+         print(f"Errore generico in get_stagisti_mcp: {e}", file=sys.stderr)
+         raise ValueError(f"Errore imprevisto in get_stagisti_mcp: {e}") from e
 
 @mcp.tool()
 async def get_dati_csv_mcp() -> Dict[str, Any]:
     """Recupera i dati di tutti i dipendenti di Mauden dal dataset server tramite REST API (originati da CSV)."""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{DATASET_API_BASE}/dati-csv")
+    try:
+        data = await _cached_dataset_get("get_dati_csv_mcp", "/dati-csv")
+        # Controllo errore più robusto
+        if not data or ("error" in data and isinstance(data, dict) and data.get("error")):
+            raise ValueError("Errore o risposta vuota dal server dataset (/dati-csv): " + str(data))
+        
+        # Assicurati che venga restituito un dizionario
+        if not isinstance(data, dict):
+             return {"csv_data_result": data}
+        return data
+    except httpx.RequestError as exc:
+         print(f"Errore HTTPX durante la chiamata a {exc.request.url!r} per /dati-csv: {exc}", file=sys.stderr)
+         raise ValueError(f"Errore di rete nel contattare il server dataset (/dati-csv): {exc}") from exc
+    except Exception as e:
+        print(f"Errore generico in get_dati_csv_mcp: {e}", file=sys.stderr)
+        raise ValueError(f"Errore imprevisto durante il recupero dei dati CSV: {e}") from e
+
+
+# --- Tool parametrici: i filtri vengono eseguiti dal dataset server ---
+# Limite di default sulle righe restituite al modello, per non riempire il contesto con l'intero dataset
+QUERY_DEFAULT_LIMIT = int(os.getenv("MCP_QUERY_DEFAULT_LIMIT", "50"))
+
+def _build_query_params(equals: Dict[str, Optional[str]], contains: Dict[str, Optional[str]],
+                        age_field: str, min_age: Optional[int], max_age: Optional[int],
+                        fields: Optional[List[str]], sort: Optional[str],
+                        limit: Optional[int], offset: Optional[int]) -> List[Tuple[str, str]]:
+    """Traduce gli argomenti del tool nella sintassi di filtro del dataset server ("Age>=50", "Name~=jo")."""
+    params: List[Tuple[str, str]] = []
+    for field, value in equals.items():
+        if value:
+            params.append((field, value))
+    for field, value in contains.items():
+        if value:
+            params.append((f"{field}~", value))
+    # httpx codifica la chiave "Age>" come "Age%3E=50", che il server interpreta come "Age>=50"
+    if min_age is not None:
+        params.append((f"{age_field}>", str(min_age)))
+    if max_age is not None:
+        params.append((f"{age_field}<", str(max_age)))
+    if fields:
+        params.append(("fields", ",".join(fields)))
+    if sort:
+        params.append(("sort", sort))
+    params.append(("limit", str(QUERY_DEFAULT_LIMIT if limit is None else limit)))
+    if offset:
+        params.append(("offset", str(offset)))
+    return params
+
+async def _query_dataset(path: str, params: List[Tuple[str, str]], tool_name: str,
+                         raw_filters: Optional[List[str]] = None) -> Dict[str, Any]:
+    # I filtri liberi ("Age>=50") vanno codificati per intero: come coppia chiave/valore verrebbero spezzati sul primo '='
+    parts = [quote(expression.strip(), safe="") for expression in raw_filters or [] if expression.strip()]
+    if params:
+        parts.append(urlencode(params))
+    try:
+        return await _cached_dataset_get(tool_name, path, "&".join(parts))
+    except CircuitOpenError as exc:
+        raise ValueError(str(exc)) from exc
+    except asyncio.TimeoutError as exc:
+        raise ValueError(f"Il server dataset non ha risposto entro {dataset_policy.deadline:.0f}s ({path}).") from exc
+    except httpx.RequestError as exc:
+        print(f"Errore HTTPX durante la chiamata a {exc.request.url!r} per {path}: {exc}", file=sys.stderr)
+        raise ValueError(f"Errore di rete nel contattare il server dataset ({path}): {exc}") from exc
+    except ValueError:
+        raise
+    except Exception as e:
+        print(f"Errore generico in {tool_name}: {e}", file=sys.stderr)
+        raise ValueError(f"Errore imprevisto in {tool_name}: {e}") from e
+
+@mcp.tool()
+async def query_employees(
+    role: Optional[str] = None,
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None,
+    name_contains: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    sort: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Cerca i dipendenti di Mauden (dati CSV) filtrando lato server e restituisce solo le righe corrispondenti.
+
+    Args:
+        role: Ruolo esatto, senza distinzione maiuscole/minuscole (es. "Business Analyst").
+        min_age: Età minima inclusa.
+        max_age: Età massima inclusa.
+        name_contains: Parte del nome da cercare (es. "johnson").
+        fields: Colonne da restituire tra Name, Role, Age, Salary (default: tutte).
+        sort: Campi di ordinamento separati da virgola, "-" per decrescente (es. "-Age,Name").
+        limit: Numero massimo di righe (default 50).
+        offset: Righe da saltare, per leggere la pagina successiva indicata da next_offset.
+    """
+    params = _build_query_params(
+        equals={"Role": role}, contains={"Name": name_contains},
+        age_field="Age", min_age=min_age, max_age=max_age,
+        fields=fields, sort=sort, limit=limit, offset=offset,
+    )
+    return await _query_dataset("/dati-csv", params, "query_employees")
+
+@mcp.tool()
+async def query_stagisti(
+    role: Optional[str] = None,
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None,
+    name_contains: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    sort: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Cerca gli stagisti di Mauden filtrando lato server e restituisce solo le righe corrispondenti.
+
+    Args:
+        role: Ruolo esatto (campo "ruolo", es. "stagista").
+        min_age: Età minima inclusa (campo "eta").
+        max_age: Età massima inclusa (campo "eta").
+        name_contains: Parte del nome da cercare (campo "nome").
+        fields: Colonne da restituire tra ruolo, nome, societa, eta (default: tutte).
+        sort: Campi di ordinamento separati da virgola, "-" per decrescente (es. "-eta").
+        limit: Numero massimo di righe (default 50).
+        offset: Righe da saltare, per leggere la pagina successiva indicata da next_offset.
+    """
+    params = _build_query_params(
+        equals={"ruolo": role}, contains={"nome": name_contains},
+        age_field="eta", min_age=min_age, max_age=max_age,
+        fields=fields, sort=sort, limit=limit, offset=offset,
+    )
+    return await _query_dataset("/stagisti", params, "query_stagisti")
+
+async def _stream_dataset_rows(path: str, query_string: str, limit: int) -> List[Dict[str, Any]]:
+    """Legge un endpoint NDJSON riga per riga e chiude la connessione appena ha raccolto `limit` record."""
+    url = f"{DATASET_API_BASE}{path}?{query_string}" if query_string else f"{DATASET_API_BASE}{path}"
+    rows: List[Dict[str, Any]] = []
+
+    async def read_stream() -> List[Dict[str, Any]]:
+        async with get_http_client().stream("GET", url) as response:
+            if response.status_code == 400:
+                await response.aread()
+                raise ValueError(f"Query non valida per {path}: {response.json().get('error', response.text)}")
             response.raise_for_status()
-            data = response.json()
-            # Controllo errore più robusto
-            if not data or ("error" in data and isinstance(data, dict) and data.get("error")):
-                raise ValueError("Errore o risposta vuota dal server dataset (/dati-csv): " + str(data))
-            
-            # Assicurati che venga restituito un dizionario
-            if not isinstance(data, dict):
-                 return {"csv_data_result": data}
-            return data
-        except httpx.RequestError as exc:
-             print(f"Errore HTTPX durante la chiamata a {exc.request.url!r} per /dati-csv: {exc}", file=sys.stderr)
-             raise ValueError(f"Errore di rete nel contattare il server dataset (/dati-csv): {exc}") from exc
-        except Exception as e:
-            print(f"Errore generico in get_dati_csv_mcp: {e}", file=sys.stderr)
-            raise ValueError(f"Errore imprevisto durante il recupero dei dati CSV: {e}") from e
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "error" in record and len(record) == 1:
+                    raise ValueError(f"Errore dal server dataset ({path}): {record['error']}")
+                rows.append(record)
+                if len(rows) >= limit:
+                    break # Uscire dal blocco chiude lo stream: il server smette di leggere il CSV
+        return rows
+
+    # Nessun retry: le righe già lette andrebbero scartate; breaker e deadline valgono comunque
+    return await dataset_policy.call(read_stream)
+
+@mcp.tool()
+async def scan_employees(
+    filters: Optional[List[str]] = None,
+    fields: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Restituisce le prime righe dei dipendenti (CSV) che soddisfano i filtri, lette in streaming.
+
+    Più rapido di query_employees su dataset molto grandi perché non calcola il totale e si ferma
+    appena raccolte `limit` righe; non supporta l'ordinamento.
+
+    Args:
+        filters: Filtri come ["Role=Business Analyst", "Age>=50", "Name~john", "Salary>100000"].
+        fields: Colonne da restituire tra Name, Role, Age, Salary (default: tutte).
+        limit: Numero massimo di righe (default 50).
+    """
+    limit = QUERY_DEFAULT_LIMIT if limit is None else limit
+    parts = [quote(expression.strip(), safe="") for expression in filters or [] if expression.strip()]
+    params: List[Tuple[str, str]] = [("limit", str(limit))]
+    if fields:
+        params.append(("fields", ",".join(fields)))
+    parts.append(urlencode(params))
+    query_string = "&".join(parts)
+
+    async def fetch(etag: Optional[str]) -> Tuple[Optional[Any], Optional[str]]:
+        # Lo stream non ha ETag: alla scadenza del TTL viene riletto
+        return {"records": await _stream_dataset_rows("/dati-csv/stream", query_string, limit)}, None
+
+    try:
+        return await tool_result_cache.get_or_fetch("scan_employees", f"/dati-csv/stream?{query_string}", fetch)
+    except CircuitOpenError as exc:
+        raise ValueError(str(exc)) from exc
+    except asyncio.TimeoutError as exc:
+        raise ValueError(f"Il server dataset non ha risposto entro {dataset_policy.deadline:.0f}s (/dati-csv/stream).") from exc
+    except httpx.RequestError as exc:
+        print(f"Errore HTTPX durante la chiamata a {exc.request.url!r} per /dati-csv/stream: {exc}", file=sys.stderr)
+        raise ValueError(f"Errore di rete nel contattare il server dataset (/dati-csv/stream): {exc}") from exc
+    except ValueError:
+        raise
+    except Exception as e:
+        print(f"Errore generico in scan_employees: {e}", file=sys.stderr)
+        raise ValueError(f"Errore imprevisto in scan_employees: {e}") from e
+
+# Dataset in cui cerca search_people, con il relativo endpoint di ricerca indicizzata sul dataset server
+SEARCH_DATASETS = {"employees": "/dati-csv/search", "stagisti": "/stagisti/search"}
+
+@mcp.tool()
+async def search_people(
+    name: Optional[str] = None,
+    role: Optional[str] = None,
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None,
+    dataset: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Trova persone per nome, ruolo o età usando gli indici del dataset server: la via più rapida per
+    domande puntuali come "quanti anni ha Paolo Banfi?" o "chi sono i Business Analyst?".
+
+    Il nome si può scrivere anche in parte, senza accenti o con piccoli errori; il campo "match" del
+    risultato indica se la corrispondenza è esatta, per prefisso o approssimata.
+
+    Args:
+        name: Nome, cognome o entrambi (es. "paolo banfi", "banf").
+        role: Ruolo (es. "Business Analyst", "stagista").
+        min_age: Età minima inclusa.
+        max_age: Età massima inclusa.
+        dataset: "employees" (dipendenti CSV) o "stagisti"; se omesso cerca in entrambi.
+        limit: Numero massimo di persone per dataset (default 20).
+    """
+    if dataset is not None and dataset not in SEARCH_DATASETS:
+        raise ValueError(f"Dataset sconosciuto '{dataset}'. Valori ammessi: {', '.join(SEARCH_DATASETS)}")
+    if name is None and role is None and min_age is None and max_age is None:
+        raise ValueError("Indica almeno un criterio tra name, role, min_age e max_age.")
+    params = [(key, str(value)) for key, value in
+              (("name", name), ("role", role), ("min_age", min_age), ("max_age", max_age), ("limit", limit)) if value is not None]
+    targets = [dataset] if dataset else list(SEARCH_DATASETS)
+    results = await asyncio.gather(*(_query_dataset(SEARCH_DATASETS[target], params, "search_people") for target in targets),
+                                   return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, Exception):
+            raise result # Cancellazione: non è un errore del singolo dataset
+    if all(isinstance(result, Exception) for result in results):
+        raise results[0]
+    # Un dataset non disponibile non cancella i risultati dell'altro: l'errore resta sotto la sua chiave
+    return {target: {"error": str(result)} if isinstance(result, Exception) else result for target, result in zip(targets, results)}
+
+AGGREGATE_DATASETS = {"employees": "/dati-csv/aggregate", "stagisti": "/stagisti/aggregate"}
+
+@mcp.tool()
+async def aggregate_dataset(
+    dataset: str,
+    metrics: List[str],
+    group_by: Optional[List[str]] = None,
+    filters: Optional[List[str]] = None,
+    sort: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Calcola statistiche aggregate lato server (conteggi, somme, medie, minimi, massimi, percentili) senza scaricare le righe.
+
+    Args:
+        dataset: "employees" (CSV dipendenti: Name, Role, Age, Salary) oppure "stagisti" (nome, ruolo, societa, eta).
+        metrics: Metriche "funzione:campo" con funzione tra count, sum, mean, median, min, max, std, pNN
+            (es. ["count", "mean:Salary", "p90:Salary", "max:Age"]). Salary è già numerico.
+        group_by: Campi di raggruppamento (es. ["Role"]); "Age:10" raggruppa per fasce d'età di 10 anni.
+        filters: Filtri applicati prima dell'aggregazione, es. ["Role=Business Analyst", "Age>=50", "Name~john"].
+        sort: Ordinamento sulle colonne del risultato, "-" per decrescente (es. "-mean_Salary").
+        limit: Numero massimo di gruppi restituiti.
+    """
+    path = AGGREGATE_DATASETS.get(dataset)
+    if not path:
+        raise ValueError(f"Dataset sconosciuto '{dataset}'. Valori ammessi: {', '.join(AGGREGATE_DATASETS)}")
+    params: List[Tuple[str, str]] = [("metrics", ",".join(metrics))]
+    if group_by:
+        params.append(("group_by", ",".join(group_by)))
+    if sort:
+        params.append(("sort", sort))
+    if limit is not None:
+        params.append(("limit", str(limit)))
+    return await _query_dataset(path, params, "aggregate_dataset", raw_filters=filters)
+
+
+# --- App ASGI: SSE di FastMCP + lifespan del client HTTP condiviso ---
+@asynccontextmanager
+async def lifespan(app: Starlette) -> AsyncIterator[None]:
+    get_http_client()
+    print(f"Client HTTP verso {DATASET_API_BASE} pronto (max_connections={DATASET_HTTP_MAX_CONNECTIONS}, keepalive={DATASET_HTTP_MAX_KEEPALIVE}).")
+    try:
+        yield
+    finally:
+        await close_http_client()
+        print("Client HTTP verso il dataset server chiuso.")
+
+async def get_pool_stats(request: Request) -> JSONResponse:
+    return JSONResponse({"dataset_http_pool": http_pool_stats(), "tool_result_cache": tool_result_cache.stats(),
+                         "resilience": resilience.stats()})
+
+# Ultima versione letta da /data-version con il suo ETag: (etag, dati)
+_data_version: Tuple[Optional[str], Optional[Any]] = (None, None)
+
+async def get_data_version(request: Request) -> JSONResponse:
+    """Versione dei dati del dataset server: i client la usano per invalidare le risposte memorizzate
+    (es. la cache delle risposte del frontend). Letta a ogni richiesta senza passare dalla cache dei
+    tool, il cui TTL ritarderebbe l'invalidazione; If-None-Match rende economica la rilettura."""
+    global _data_version
+    url = f"{DATASET_API_BASE}/data-version"
+
+    async def attempt() -> Tuple[Optional[str], Optional[Any]]:
+        etag, data = _data_version
+        response = await get_http_client().get(url, headers={"If-None-Match": etag} if etag and data is not None else None)
+        if response.status_code == 304:
+            return etag, data
+        return response.headers.get("ETag"), _read_dataset_response(response, "/data-version")
+
+    try:
+        _data_version = await dataset_policy.call(attempt, idempotent=True)
+        return JSONResponse(_data_version[1])
+    except Exception as e:
+        print(f"Errore nel leggere la versione dei dati: {e}", file=sys.stderr)
+        return JSONResponse({"error": f"Versione dei dati non disponibile: {e}"}, status_code=503)
+
+app = Starlette(
+    routes=[
+        Route("/pool-stats", get_pool_stats),
+        Route("/data-version", get_data_version),
+        Mount("/", app=mcp.sse_app()),
+    ],
+    lifespan=lifespan,
+)
 
 
 # Blocco main
 if __name__ == "__main__":
     mcp_host = "0.0.0.0"
     mcp_port = 8080
-    app_string = "mcp_web:mcp.sse_app"
+    app_string = "mcp_web:app"
 
     try:
         uvicorn.run(app_string, host=mcp_host, port=mcp_port, reload=False, log_level="debug")
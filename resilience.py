@@ -0,0 +1,221 @@
+"""Chiamate verso dipendenze esterne con deadline, retry con jitter, circuit breaker e hedging.
+
+Modulo condiviso da mcp_web.py e dal frontend (nel container del frontend viene copiato
+tramite il build context aggiuntivo "shared" di docker-compose). Solo libreria standard.
+"""
+import asyncio
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Default per i breaker; sovrascrivibili per endpoint al momento della registrazione
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")) # Fallimenti consecutivi prima di aprire
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30")) # Secondi da aperto prima di una sonda
+
+
+class CircuitOpenError(ConnectionError):
+    """Il breaker dell'endpoint è aperto: la chiamata fallisce subito senza toccare la dipendenza."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Servizio '{name}' temporaneamente non disponibile (circuito aperto, nuovo tentativo tra {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """closed -> open dopo N fallimenti consecutivi; dopo reset_timeout lascia passare una sola
+    chiamata di prova (half_open): se riesce torna closed, altrimenti riapre."""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def allow(self):
+        """Solleva CircuitOpenError se la chiamata non deve partire."""
+        if self.state == "closed":
+            return
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == "open" and elapsed >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError(self.name, max(0.0, self.reset_timeout - elapsed))
+
+    def record_success(self):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        self.state = "closed"
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """La chiamata di prova è finita senza esito utile (es. cancellata): la prossima può riprovare."""
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "opened": self.opened,
+            "open_for_s": round(time.monotonic() - self.opened_at, 1) if self.state != "closed" else 0,
+        }
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full jitter: attesa casuale in [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _default_is_failure(exc: BaseException) -> bool:
+    return isinstance(exc, (asyncio.TimeoutError, ConnectionError, OSError))
+
+
+class EndpointPolicy:
+    """Politica di una dipendenza: deadline complessiva, timeout per tentativo, retry e hedging.
+
+    - deadline: tempo massimo totale della chiamata, retry compresi
+    - attempt_timeout: tempo massimo di un singolo tentativo (default: deadline)
+    - retries: tentativi aggiuntivi, solo per operazioni idempotenti
+    - hedge_after: se un tentativo non ha risposto dopo N secondi ne parte un secondo in parallelo
+      e vince il primo che risponde (solo idempotenti)
+    - is_failure(exc): quali eccezioni indicano una dipendenza in difficoltà (retry e breaker);
+      le altre (es. errori di validazione) vengono propagate subito
+    """
+
+    def __init__(self, name: str, deadline: float, attempt_timeout: Optional[float] = None, retries: int = 0,
+                 backoff_base: float = 0.1, backoff_max: float = 2.0, hedge_after: Optional[float] = None,
+                 is_failure: Callable[[BaseException], bool] = _default_is_failure,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout or deadline
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.is_failure = is_failure
+        self.breaker = breaker or CircuitBreaker(name)
+        self.calls = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+
+    async def call(self, operation: Callable[[], Awaitable[Any]], idempotent: bool = False) -> Any:
+        """Esegue operation() (una factory: ogni tentativo crea una nuova coroutine) secondo la politica."""
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + self.deadline
+        attempt = 0
+        while True:
+            self.breaker.allow()
+            remaining = deadline_at - loop.time()
+            try:
+                if idempotent and self.hedge_after is not None and self.hedge_after < min(self.attempt_timeout, remaining):
+                    result = await self._hedged(operation, min(self.attempt_timeout, remaining))
+                else:
+                    result = await asyncio.wait_for(operation(), min(self.attempt_timeout, remaining))
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as exc:
+                if not self.is_failure(exc):
+                    self.breaker.release_probe()
+                    raise
+                self.breaker.record_failure()
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                can_retry = idempotent and attempt < self.retries and self.breaker.state != "open"
+                if not can_retry or loop.time() + delay >= deadline_at:
+                    if isinstance(exc, asyncio.TimeoutError) and loop.time() >= deadline_at - 0.001:
+                        self.deadline_exceeded += 1
+                    raise
+                attempt += 1
+                self.retried += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def _hedged(self, operation: Callable[[], Awaitable[Any]], timeout: float) -> Any:
+        attempts = [asyncio.ensure_future(operation())]
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=self.hedge_after)
+            if not done:
+                # Il primo tentativo è nella coda lenta: ne parte un secondo, vince chi risponde prima
+                self.hedged += 1
+                attempts.append(asyncio.ensure_future(operation()))
+            pending = set(attempts)
+            deadline_at = asyncio.get_running_loop().time() + timeout - self.hedge_after
+            error: Optional[BaseException] = None
+            while pending:
+                remaining = deadline_at - asyncio.get_running_loop().time()
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, remaining), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        if len(attempts) > 1 and task is attempts[1]:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.stats(),
+            "deadline_s": self.deadline,
+            "calls": self.calls,
+            "retried": self.retried,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "deadline_exceeded": self.deadline_exceeded,
+        }
+
+
+class ResilienceRegistry:
+    """Politiche per nome di endpoint, create al primo uso, con le metriche di tutte."""
+
+    def __init__(self):
+        self._policies: Dict[str, EndpointPolicy] = {}
+
+    def policy(self, name: str, **settings: Any) -> EndpointPolicy:
+        policy = self._policies.get(name)
+        if policy is None:
+            policy = EndpointPolicy(name, **settings)
+            self._policies[name] = policy
+        return policy
+
+    def get(self, name: str) -> Optional[EndpointPolicy]:
+        return self._policies.get(name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: policy.stats() for name, policy in self._policies.items()}